@@ -1,13 +1,18 @@
 from __future__ import annotations
 
+import time
 from contextlib import asynccontextmanager
-from typing import AsyncIterator
+from typing import Any, AsyncIterator
 
+from sqlalchemy import Connection, event, inspect, text
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.schema import CreateColumn
 
 from bot.config import get_settings
 from .models.base import Base
-from .models import payment, user  # noqa: F401 - ensure models are registered
+from .models import broadcast, job, payment, user, video_cache  # noqa: F401 - ensure models are registered
+from .services.metrics import DB_CONNECTIONS, DB_QUERY_SECONDS, DB_SESSIONS
+from .services.tracing import span
 
 
 _settings = get_settings()
@@ -15,19 +20,76 @@ _engine = create_async_engine(_settings.database_url, echo=False, future=True)
 SessionLocal = async_sessionmaker(bind=_engine, class_=AsyncSession, expire_on_commit=False)
 
 
+@event.listens_for(_engine.sync_engine, "checkout")
+def _on_checkout(*_: Any) -> None:
+    DB_CONNECTIONS.inc()
+
+
+@event.listens_for(_engine.sync_engine, "checkin")
+def _on_checkin(*_: Any) -> None:
+    DB_CONNECTIONS.dec()
+
+
+@event.listens_for(_engine.sync_engine, "before_cursor_execute")
+def _before_execute(conn: Connection, cursor: Any, statement: str, *_: Any) -> None:
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+@event.listens_for(_engine.sync_engine, "after_cursor_execute")
+def _after_execute(conn: Connection, cursor: Any, statement: str, *_: Any) -> None:
+    started = conn.info["query_started"].pop()
+    # Label by statement kind only; full SQL would explode the series count.
+    kind = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+    DB_QUERY_SECONDS.observe(time.perf_counter() - started, statement=kind)
+
+
+@event.listens_for(_engine.sync_engine, "handle_error")
+def _on_error(context: Any) -> None:
+    if context.connection is not None and context.connection.info.get("query_started"):
+        context.connection.info["query_started"].pop()
+
+
 @asynccontextmanager
 async def session_factory() -> AsyncIterator[AsyncSession]:
-    session = SessionLocal()
-    try:
-        yield session
-        await session.commit()
-    except Exception:
-        await session.rollback()
-        raise
-    finally:
-        await session.close()
+    with span("db session"):
+        session = SessionLocal()
+        DB_SESSIONS.inc()
+        try:
+            yield session
+            await session.commit()
+        except Exception:
+            await session.rollback()
+            raise
+        finally:
+            await session.close()
+            DB_SESSIONS.dec()
+
+
+def _add_missing_columns(conn: Connection) -> None:
+    """Add columns introduced after a table was created.
+
+    ``create_all`` only creates missing tables, so new nullable or
+    server-defaulted columns are appended here until proper migrations exist.
+    """
+    inspector = inspect(conn)
+    preparer = conn.dialect.identifier_preparer
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            ddl = CreateColumn(column).compile(dialect=conn.dialect)
+            conn.execute(text(f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN {ddl}"))
 
 
 async def create_db_and_tables() -> None:
     async with _engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(_add_missing_columns)
+
+
+async def close_db() -> None:
+    """Close pooled connections so their driver threads do not outlive the loop."""
+    await _engine.dispose()
@@ -1,12 +1,20 @@
 from __future__ import annotations
 
+import asyncio
+import html
+from datetime import datetime
 from typing import Optional
 
-from aiogram import Router
+from aiogram import Bot, Router
 from aiogram.filters import Command
-from aiogram.types import Message
+from aiogram.types import BufferedInputFile, Message
 
-from ..services import user_service
+from ..middlewares.outbound import get_outbound_scheduler
+from ..services import broadcast_service, memory, user_service
+from ..services.admission import get_admission_controller
+from ..services.broadcast_service import get_broadcast_service
+from ..services.profiler import DEFAULT_DURATION, MAX_DURATION, Profile, get_profiler
+from ..services.tracing import format_trace, get_tracer
 
 router = Router(name="admin")
 
@@ -22,11 +30,19 @@ async def admin_stats(message: Message) -> None:
         return
 
     stats = await user_service.get_stats()
+    outbound = get_outbound_scheduler().stats()
+    pools = get_admission_controller().stats()
     await message.answer(
         "📊 Статистика\n"
         f"Пользователей: {stats['users']}\n"
         f"Успешных оплат: {stats['payments']}\n"
-        f"Выдано генераций (оплаченных): {stats['credited_generations']}",
+        f"Выдано генераций (оплаченных): {stats['credited_generations']}\n"
+        f"Очередь отправки: {outbound['interactive_queue']} ответов, {outbound['bulk_queue']} рассылки; "
+        f"повторов после 429: {outbound['retries']}\n"
+        f"Генерации: {pools['image']['running']} в работе, {pools['image']['waiting']} в очереди, "
+        f"~{pools['image']['latency']}с на задачу\n"
+        f"Видео: {pools['video']['running']} в работе, {pools['video']['waiting']} в очереди, "
+        f"~{pools['video']['latency']}с на задачу",
     )
 
 
@@ -83,19 +99,229 @@ async def admin_broadcast(message: Message) -> None:
         return
 
     text = message.text.split(maxsplit=1)
-    if len(text) != 2:
-        await message.answer("Использование: /broadcast <сообщение>")
+    source = message.reply_to_message
+    if len(text) == 2:
+        campaign = await broadcast_service.create_campaign(created_by=message.from_user.id, text=text[1])
+    elif source:
+        # Copying re-sends media by file_id, so photos and videos are not re-uploaded.
+        campaign = await broadcast_service.create_campaign(
+            created_by=message.from_user.id,
+            from_chat_id=source.chat.id,
+            message_id=source.message_id,
+        )
+    else:
+        await message.answer(
+            "Использование: /broadcast <сообщение>\n"
+            "или ответь командой /broadcast на сообщение с фото/видео, чтобы разослать его копию."
+        )
         return
 
-    broadcast_text = text[1]
-    users = await user_service.list_users(limit=1000)
-    sent = 0
-    failed = 0
-    for user in users:
+    report = await message.answer(broadcast_service.format_progress(campaign))
+    await broadcast_service.set_report_message(campaign.id, report.chat.id, report.message_id)
+    get_broadcast_service().start(message.bot, campaign.id)
+
+
+@router.message(Command("broadcasts"))
+async def admin_broadcasts(message: Message) -> None:
+    if not await _is_admin(message.from_user.id):
+        return
+
+    campaigns = await broadcast_service.list_campaigns(limit=10)
+    if not campaigns:
+        await message.answer("Рассылок ещё не было.")
+        return
+    await message.answer("\n\n".join(broadcast_service.format_progress(campaign) for campaign in campaigns))
+
+
+@router.message(Command("broadcast_stop"))
+async def admin_broadcast_stop(message: Message) -> None:
+    if not await _is_admin(message.from_user.id):
+        return
+
+    campaign_id = _parse_campaign_id(message.text)
+    if campaign_id is None:
+        await message.answer("Использование: /broadcast_stop <id>")
+        return
+
+    campaign = await get_broadcast_service().pause(campaign_id)
+    if not campaign:
+        await message.answer("Рассылка не найдена.")
+        return
+    await message.answer(f"Рассылка #{campaign_id} поставлена на паузу. Продолжить: /broadcast_resume {campaign_id}")
+
+
+@router.message(Command("broadcast_resume"))
+async def admin_broadcast_resume(message: Message) -> None:
+    if not await _is_admin(message.from_user.id):
+        return
+
+    campaign_id = _parse_campaign_id(message.text)
+    if campaign_id is None:
+        await message.answer("Использование: /broadcast_resume <id>")
+        return
+
+    campaign = await broadcast_service.get_campaign(campaign_id)
+    if not campaign or campaign.status in {"completed", "cancelled"}:
+        await message.answer("Такой незавершённой рассылки нет.")
+        return
+    if broadcast_service.runs_elsewhere(campaign):
+        await message.answer(
+            f"Рассылка #{campaign_id} уже идёт в другом процессе бота. "
+            f"Чтобы перенести её сюда: /broadcast_stop {campaign_id}, затем /broadcast_resume {campaign_id}"
+        )
+        return
+
+    report = await message.answer(broadcast_service.format_progress(campaign))
+    await broadcast_service.set_report_message(campaign.id, report.chat.id, report.message_id)
+    if not get_broadcast_service().start(message.bot, campaign.id):
+        await message.answer(f"Рассылка #{campaign_id} уже идёт.")
+
+
+@router.message(Command("traces"))
+async def admin_traces(message: Message) -> None:
+    if not await _is_admin(message.from_user.id):
+        return
+
+    tracer = get_tracer()
+    parts = (message.text or "").split()
+    if len(parts) == 2:
+        trace = tracer.find(parts[1])
+        if trace is None:
+            await message.answer("Трейс не найден (хранятся последние сохранённые трейсы этого процесса).")
+            return
+        tree = format_trace(trace)[:3500]
+        await message.answer(f"🔎 Трейс <code>{trace.trace_id}</code>\n<pre>{html.escape(tree)}</pre>")
+        return
+
+    traces = tracer.slowest(10)
+    if not traces:
+        await message.answer("Сохранённых трейсов пока нет.")
+        return
+    lines = ["🐢 Самые медленные недавние трейсы:"]
+    for trace in traces:
+        root = trace.root
+        started = datetime.fromtimestamp(root.start_ns / 1e9).strftime("%H:%M:%S")
+        user = root.attributes.get("user.id", "—")
+        kind = root.attributes.get("update.type", root.name)
+        lines.append(
+            f"• <code>{trace.trace_id[:12]}</code> {root.duration:.1f}с — {html.escape(str(kind))}, "
+            f"user {user}, {started}"
+        )
+    lines.append("\nПодробности: /traces &lt;id&gt;")
+    await message.answer("\n".join(lines))
+
+
+def _mb(size: int) -> str:
+    return f"{size / 1024 / 1024:.1f} МБ"
+
+
+@router.message(Command("memory"))
+async def admin_memory(message: Message) -> None:
+    if not await _is_admin(message.from_user.id):
+        return
+
+    heap = memory.get_heap_tracer()
+    parts = (message.text or "").split()
+    action = parts[1] if len(parts) > 1 else ""
+    if action == "start":
+        await heap.start()
+        await message.answer(
+            "🧠 tracemalloc запущен, базовый снимок сделан. Сравнить: /memory diff, выключить: /memory stop"
+        )
+        return
+    if action == "stop":
+        if heap.running:
+            heap.stop()
+        await message.answer("tracemalloc выключен.")
+        return
+    if action == "diff":
+        if not heap.running:
+            await message.answer("tracemalloc не запущен: /memory start")
+            return
+        stats = await heap.diff(rebase=True)
+        body = "\n".join(stats) or "Изменений нет."
+        await message.answer(f"🧠 Рост с прошлого снимка:\n<pre>{html.escape(body)[:3500]}</pre>")
+        return
+
+    lines = [f"🧠 Память: RSS {_mb(memory.rss_bytes())}, пик {_mb(memory.max_rss_bytes())}"]
+    buffers = memory.live_buffers()
+    if buffers:
+        held = ", ".join(f"{kind} {count} шт. / {_mb(size)}" for kind, (count, size) in buffers.items())
+        lines.append(f"Буферы: {held}")
+    for job in memory.active_jobs():
+        lines.append(f"• задача #{job.job_id} ({job.kind}): сейчас {_mb(job.live)}, пик {_mb(job.peak)}")
+    finished = list(memory.recent_jobs)[-5:]
+    if finished:
+        lines.append("Последние задачи (пик буферов, изменение RSS):")
+        for job in reversed(finished):
+            lines.append(
+                f"• #{job.job_id} ({job.kind}): {_mb(job.peak)} в {job.peak_buffers} буферах, "
+                f"RSS {(job.rss_end - job.rss_start) / 1024 / 1024:+.1f} МБ"
+            )
+    lines.append("tracemalloc: " + ("включён — /memory diff" if heap.running else "выключен — /memory start"))
+    await message.answer("\n".join(lines))
+
+
+_profile_tasks: set[asyncio.Task] = set()
+
+
+@router.message(Command("profile"))
+async def admin_profile(message: Message) -> None:
+    if not await _is_admin(message.from_user.id):
+        return
+
+    profiler = get_profiler()
+    parts = (message.text or "").split()
+    action = parts[1] if len(parts) > 1 else ""
+    if action == "start":
+        if profiler.running:
+            await message.answer("Профилировщик уже запущен. Остановить: /profile stop")
+            return
         try:
-            await message.bot.send_message(user.telegram_id, broadcast_text)
-            sent += 1
-        except Exception:  # pragma: no cover - network errors
-            failed += 1
+            duration = int(parts[2]) if len(parts) > 2 else DEFAULT_DURATION
+        except ValueError:
+            await message.answer(f"Использование: /profile start [секунды, до {MAX_DURATION}]")
+            return
+        profiler.start(duration)
+        task = asyncio.create_task(_stop_profile_later(message.bot, message.chat.id, profiler.started_at))
+        _profile_tasks.add(task)
+        task.add_done_callback(_profile_tasks.discard)
+        await message.answer(
+            f"🔬 Профилирование запущено на {int(profiler.duration)} с. "
+            "Результат придёт файлом, остановить раньше: /profile stop"
+        )
+    elif action == "stop":
+        if not profiler.running:
+            await message.answer("Профилировщик не запущен.")
+            return
+        await _send_profile(message.bot, message.chat.id, profiler.stop())
+    else:
+        await message.answer(f"Использование: /profile start [секунды, до {MAX_DURATION}] | /profile stop")
 
-    await message.answer(f"Рассылка завершена. Успешно: {sent}, ошибок: {failed}.")
+
+async def _stop_profile_later(bot: Bot, chat_id: int, started_at: Optional[float]) -> None:
+    profiler = get_profiler()
+    await asyncio.sleep(profiler.duration)
+    # Skip if it was stopped by hand (and maybe restarted) in the meantime.
+    if profiler.running and profiler.started_at == started_at:
+        await _send_profile(bot, chat_id, profiler.stop())
+
+
+async def _send_profile(bot: Bot, chat_id: int, profile: Profile) -> None:
+    started = datetime.fromtimestamp(profile.started_at)
+    lines = [f"🔬 Профиль: {profile.duration:.0f} с, {profile.samples} сэмплов."]
+    for frame, count in profile.top():
+        lines.append(f"• {html.escape(frame)} — {count}")
+    filename = f"profile-{started:%Y%m%d-%H%M%S}.collapsed"
+    document = BufferedInputFile(profile.collapsed().encode(), filename=filename)
+    await bot.send_document(chat_id, document, caption="\n".join(lines)[:1000])
+
+
+def _parse_campaign_id(text: Optional[str]) -> Optional[int]:
+    parts = (text or "").split()
+    if len(parts) != 2:
+        return None
+    try:
+        return int(parts[1])
+    except ValueError:
+        return None
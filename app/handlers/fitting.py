@@ -1,13 +1,15 @@
 from __future__ import annotations
 
 import logging
-from io import BytesIO
+from functools import partial
 from pathlib import Path
 
 from aiogram import F, Router
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.fsm.context import FSMContext
-from aiogram.types import BufferedInputFile, Message
+from aiogram.types import CallbackQuery, FSInputFile, Message
 
+from bot.config import get_settings
 from ..keyboards.common import (
     cancel_keyboard,
     car_uploaded_keyboard,
@@ -15,17 +17,27 @@ from ..keyboards.common import (
     menu_keyboard,
     post_result_keyboard,
     shop_keyboard,
+    waitlist_keyboard,
 )
-from ..services import user_service
+from ..models.user import User
+from ..models.video_cache import VideoCache
+from ..services import delivery, fal_queue, job_service, user_service, video_cache_service
+from ..services.admission import Decision, WorkKind, format_wait, get_admission_controller, priority_for
 from ..services.ai_service import get_ai_service
+from ..services.job_registry import JobCancelled, get_job_registry
+from ..services.lifecycle import get_lifecycle
+from ..services.tracing import span
 from ..services.video_service import get_video_service
 from ..states.fitting import FittingStates
 from ..utils.media import default_banner, step1_banner, step2_banner
-from ..utils.storage import build_upload_path, read_upload_bytes
+from ..utils import imaging, storage
+from ..utils.storage import download_upload, read_upload_bytes, write_upload_stream
 from .start import send_post_start_screen
 
 VIDEO_CREDIT_COST = 3
 
+_settings = get_settings()
+
 router = Router(name="fitting")
 logger = logging.getLogger(__name__)
 
@@ -40,18 +52,109 @@ async def _send_main_menu(message: Message, user_id: int) -> None:
 
 @router.message(F.text == "❌ Отмена")
 async def global_cancel(message: Message, state: FSMContext) -> None:
+    # Running provider jobs are aborted too; their handlers refund the credits.
+    cancelled = get_job_registry().cancel(message.from_user.id)
     await state.clear()
-    await message.answer("Отменено. Возвращаю тебя в меню.")
+    if cancelled:
+        await message.answer("Остановил задачу — списанные генерации верну. Возвращаю тебя в меню.")
+    else:
+        await message.answer("Отменено. Возвращаю тебя в меню.")
     await _send_main_menu(message, message.from_user.id)
     await state.set_state(FittingStates.menu)
 
 
-@router.message(F.text == "🎬 Видео-пролёт")
+async def _admit(message: Message, kind: WorkKind, user: User) -> Decision | None:
+    """Check provider capacity before anything is charged."""
+    if get_lifecycle().draining:
+        await message.answer("🔄 Бот перезапускается. Генерации не списаны — нажми ещё раз через несколько секунд.")
+        return None
+    decision = get_admission_controller().evaluate(kind, await priority_for(user))
+    if decision.admitted:
+        return decision
+    await message.answer(
+        f"⏳ Сейчас большая очередь — ожидание около {format_wait(decision.wait)}. "
+        "Генерации не списаны. Попробуй чуть позже или я напишу, когда место освободится.",
+        reply_markup=waitlist_keyboard(kind),
+    )
+    return None
+
+
+def _queue_note(decision: Decision) -> str:
+    return f"\nТы в очереди: №{decision.position}." if decision.position else ""
+
+
+@router.callback_query(F.data.startswith("waitlist:"))
+async def join_waitlist(callback: CallbackQuery) -> None:
+    kind = callback.data.split(":", maxsplit=1)[1]
+    if kind in {"image", "video"}:
+        get_admission_controller().join_waitlist(kind, callback.from_user.id, callback.bot)
+    await callback.answer("Напишу, как только очередь освободится 🔔")
+
+
+async def _charge_video(message: Message, state: FSMContext, user: User, amount: int) -> bool:
+    if user.is_admin or amount <= 0:
+        return True
+    if user.balance < amount:
+        await message.answer(
+            f"Для видео-пролёта нужно {amount} генерации. Пополни баланс и попробуй снова.",
+            reply_markup=shop_keyboard(),
+        )
+        await state.set_state(FittingStates.shop)
+        return False
+
+    deducted = await user_service.deduct_credit(user.telegram_id, amount=amount)
+    if not deducted:
+        await message.answer(
+            "Не удалось списать генерации для видео. Пополни баланс и попробуй снова.",
+            reply_markup=shop_keyboard(),
+        )
+        await state.set_state(FittingStates.shop)
+        return False
+    return True
+
+
+async def _send_cached_flyby(message: Message, entry: VideoCache) -> bool:
+    """Resend a cached fly-by by Telegram file_id, falling back to the stored file."""
+    if entry.telegram_file_id:
+        try:
+            await message.answer_video(
+                entry.telegram_file_id,
+                caption="Видео-пролёт готов! 🎬",
+                supports_streaming=True,
+            )
+            return True
+        except TelegramBadRequest as exc:
+            logger.info("Cached fly-by file_id rejected: %s", exc.message)
+
+    video_path = await storage.blob_path(entry.video_digest) if entry.video_digest else None
+    if video_path is None:
+        return False
+    sent = await delivery.send_flyby(message.bot, message.chat.id, video_path)
+    await video_cache_service.remember(
+        entry.cache_key,
+        video_digest=entry.video_digest,
+        telegram_file_id=sent.video.file_id if sent.video else None,
+    )
+    return True
+
+
+async def _finish_flyby(message: Message, state: FSMContext, user_id: int) -> None:
+    updated_user = await user_service.get_user(user_id)
+    balance_display = "∞" if updated_user and updated_user.is_admin else str(updated_user.balance if updated_user else 0)
+
+    await message.answer(
+        f"Осталось: {balance_display} генераций. Делись видео с друзьями или запускай новую примерку.",
+        reply_markup=post_result_keyboard(),
+    )
+    await state.set_state(FittingStates.menu)
+
+
+@router.message(F.text == "🎬 Видео-пролёт", flags={"action_lock": "video"})
 async def generate_video_flyby(message: Message, state: FSMContext) -> None:
     user_id = message.from_user.id
-    image_bytes = read_upload_bytes(user_id, "result")
+    result_digest = await storage.upload_digest(user_id, "result")
 
-    if not image_bytes:
+    if result_digest is None:
         await message.answer(
             "Пока нет свежей примерки. Сначала сгенерируй изображение с новыми дисками."
         )
@@ -61,64 +164,102 @@ async def generate_video_flyby(message: Message, state: FSMContext) -> None:
     if not user:
         user, _ = await user_service.get_or_create_user(user_id, message.from_user.username)
 
-    if not user.is_admin:
-        if user.balance < VIDEO_CREDIT_COST:
-            await message.answer(
-                f"Для видео-пролёта нужно {VIDEO_CREDIT_COST} генерации. Пополни баланс и попробуй снова.",
-                reply_markup=shop_keyboard(),
-            )
-            await state.set_state(FittingStates.shop)
-            return
+    video_service = get_video_service()
+    cache_key = video_service.cache_key(result_digest)
 
-        deducted = await user_service.deduct_credit(user_id, amount=VIDEO_CREDIT_COST)
-        if not deducted:
-            await message.answer(
-                "Не удалось списать генерации для видео. Пополни баланс и попробуй снова.",
-                reply_markup=shop_keyboard(),
-            )
-            await state.set_state(FittingStates.shop)
+    cached = await video_cache_service.lookup(cache_key)
+    if cached is not None:
+        # The same result always yields the same request; reuse the video.
+        hit_cost = VIDEO_CREDIT_COST if _settings.video_cache_charge_hits else 0
+        if not await _charge_video(message, state, user, hit_cost):
+            return
+        if await _send_cached_flyby(message, cached):
+            await _finish_flyby(message, state, user_id)
             return
+        await video_cache_service.forget(cache_key)
+        if hit_cost and not user.is_admin:
+            await user_service.add_credits(user_id, hit_cost)
+
+    decision = await _admit(message, "video", user)
+    if decision is None:
+        return
+    if not await _charge_video(message, state, user, VIDEO_CREDIT_COST):
+        return
+    job = await job_service.create_job(
+        user_id=user_id,
+        chat_id=message.chat.id,
+        kind="video",
+        credits=0 if user.is_admin else VIDEO_CREDIT_COST,
+        inputs={"source": result_digest, "cache_key": cache_key},
+    )
 
     await message.answer(
-        f"🎬 Запускаю видео-пролёт — списываю {VIDEO_CREDIT_COST} генерации. Дай мне ~20 секунд."
+        f"🎬 Запускаю видео-пролёт — списываю {VIDEO_CREDIT_COST} генерации. "
+        f"Дай мне ~{format_wait(decision.eta)}.{_queue_note(decision)}"
     )
     await state.set_state(FittingStates.video_generating)
 
-    video_service = get_video_service()
+    image_url = await storage.presigned_upload_url(user_id, "result")
+    image_bytes = None if image_url else await read_upload_bytes(user_id, "result")
 
     try:
-        video_bytes = await video_service.generate(image_bytes)
+        with fal_queue.on_ticket(partial(job_service.record_ticket, job.id)):
+            video_path = await get_job_registry().run(
+                user_id,
+                "video",
+                get_admission_controller().run(
+                    "video",
+                    video_service.generate(
+                        image_bytes,
+                        image_url=image_url,
+                        sink=partial(write_upload_stream, user_id, "video"),
+                    ),
+                    user_id=user_id,
+                    priority=decision.priority,
+                ),
+            )
+    except JobCancelled:
+        logger.info("Video generation cancelled by user %s", user_id)
+        await job_service.refund(job.id, status="cancelled")
+        return
     except Exception as exc:  # pragma: no cover - external API errors
         logger.exception("Video generation failed: %s", exc)
-        if not user.is_admin:
-            await user_service.add_credits(user_id, VIDEO_CREDIT_COST)
+        await job_service.refund(job.id, error=str(exc))
         await message.answer(
             "Не удалось сделать видео. Попробуй позже или обнови результат примерки — списанные генерации уже вернул."
         )
         await state.set_state(FittingStates.menu)
         return
 
-    video_path = build_upload_path(user_id, "video")
-    video_path.write_bytes(video_bytes)
-
-    output_video = BufferedInputFile(video_bytes, filename="hype_tuning_flyby.mp4")
-    await message.answer_video(output_video, caption="Видео-пролёт готов! 🎬")
+    video_digest = await storage.upload_digest(user_id, "video")
+    await job_service.set_status(job.id, "completed", result_digest=video_digest)
+    sent = await delivery.send_flyby(message.bot, message.chat.id, video_path)
+    await job_service.set_status(job.id, "delivered")
+    await video_cache_service.remember(
+        cache_key,
+        video_digest=video_digest,
+        telegram_file_id=sent.video.file_id if sent.video else None,
+    )
+    await _finish_flyby(message, state, user_id)
 
-    updated_user = await user_service.get_user(user_id)
-    balance_display = "∞" if updated_user and updated_user.is_admin else str(updated_user.balance if updated_user else 0)
 
-    await message.answer(
-        f"Осталось: {balance_display} генераций. Делись видео с друзьями или запускай новую примерку.",
-        reply_markup=post_result_keyboard(),
+@router.message(F.text == "📎 Оригинал")
+async def send_original_result(message: Message) -> None:
+    result_path = await storage.upload_path(message.from_user.id, "result")
+    if result_path is None:
+        await message.answer("Пока нет свежей примерки. Сначала сгенерируй изображение с новыми дисками.")
+        return
+    extension = await imaging.file_extension(result_path)
+    await message.answer_document(
+        FSInputFile(result_path, filename=f"hype_tuning_original.{extension}"),
+        caption="Оригинал в полном разрешении 📎",
     )
-    await state.set_state(FittingStates.menu)
 
 
 @router.message(FittingStates.wait_car_photo, F.photo)
 async def handle_car_photo(message: Message, state: FSMContext) -> None:
     file_id = message.photo[-1].file_id
-    upload_path = build_upload_path(message.from_user.id, "car")
-    await message.bot.download(file=file_id, destination=str(upload_path))
+    upload_path = await download_upload(message.bot, file_id, message.from_user.id, "car")
     await state.update_data(
         car_photo_file_id=file_id,
         car_photo_path=str(upload_path),
@@ -141,8 +282,7 @@ async def handle_invalid_car(message: Message) -> None:
 @router.message(FittingStates.wait_wheel_photo, F.photo)
 async def handle_wheel_photo(message: Message, state: FSMContext) -> None:
     file_id = message.photo[-1].file_id
-    upload_path = build_upload_path(message.from_user.id, "wheel")
-    await message.bot.download(file=file_id, destination=str(upload_path))
+    upload_path = await download_upload(message.bot, file_id, message.from_user.id, "wheel")
     await state.update_data(
         wheel_photo_file_id=file_id,
         wheel_photo_path=str(upload_path),
@@ -195,7 +335,7 @@ async def confirm_change_wheels(message: Message, state: FSMContext) -> None:
     )
 
 
-@router.message(FittingStates.confirm_generation, F.text == "✅ Запустить")
+@router.message(FittingStates.confirm_generation, F.text == "✅ Запустить", flags={"action_lock": "generation"})
 async def launch_generation(message: Message, state: FSMContext) -> None:
     user = await user_service.get_user(message.from_user.id)
     if not user:
@@ -209,80 +349,114 @@ async def launch_generation(message: Message, state: FSMContext) -> None:
         await state.set_state(FittingStates.shop)
         return
 
+    decision = await _admit(message, "image", user)
+    if decision is None:
+        return
+
     success = await user_service.deduct_credit(message.from_user.id)
     if not success:
         await message.answer("Не удалось списать генерацию. Попробуй позже или пополни баланс.")
         await _send_main_menu(message, message.from_user.id)
         await state.set_state(FittingStates.menu)
         return
+    job = await job_service.create_job(
+        user_id=message.from_user.id,
+        chat_id=message.chat.id,
+        kind="image",
+        credits=0 if user.is_admin else 1,
+    )
 
     data = await state.get_data()
     car_id = data.get("car_photo_file_id")
     wheel_id = data.get("wheel_photo_file_id")
 
     if not car_id or not wheel_id:
+        await job_service.refund(job.id, error="photos missing")
         await message.answer("Фото не нашёл. Начни примерку заново.")
         await _send_main_menu(message, message.from_user.id)
         await state.set_state(FittingStates.menu)
         return
 
-    await message.answer("🎨 Генерирую результат... Дай мне ~45 секунд.")
+    await message.answer(f"🎨 Генерирую результат... Дай мне ~{format_wait(decision.eta)}.{_queue_note(decision)}")
     await state.set_state(FittingStates.generating)
 
     async def _load_photo_bytes(kind: str, file_id: str, path_key: str) -> bytes | None:
-        path_value = data.get(path_key)
-        if path_value:
-            path = Path(path_value)
-            if path.exists():
-                return path.read_bytes()
-
-        cached_bytes = read_upload_bytes(message.from_user.id, kind)  # noqa: FBT003
-        if cached_bytes is not None:
-            return cached_bytes
-
-        buffer = BytesIO()
-        await message.bot.download(file=file_id, destination=buffer)
-        photo_bytes = buffer.getvalue()
-        upload_path = build_upload_path(message.from_user.id, kind)
-        upload_path.write_bytes(photo_bytes)
-        await state.update_data(**{path_key: str(upload_path)})
-        return photo_bytes
-
-    car_bytes = await _load_photo_bytes("car", car_id, "car_photo_path")
-    wheel_bytes = await _load_photo_bytes("wheel", wheel_id, "wheel_photo_path")
-
-    if not car_bytes or not wheel_bytes:
+        with span("load photo", **{"upload.kind": kind}):
+            path_value = data.get(path_key)
+            if path_value:
+                photo_bytes = await storage.read_bytes(Path(path_value))
+                if photo_bytes is not None:
+                    return photo_bytes
+
+            cached_bytes = await read_upload_bytes(message.from_user.id, kind)
+            if cached_bytes is not None:
+                return cached_bytes
+
+            upload_path = await download_upload(message.bot, file_id, message.from_user.id, kind)
+            await state.update_data(**{path_key: str(upload_path)})
+            return await storage.read_bytes(upload_path)
+
+    ai_service = get_ai_service()
+    car_url = wheel_url = None
+    if ai_service.accepts_urls:
+        car_url = await storage.presigned_upload_url(message.from_user.id, "car")
+        wheel_url = await storage.presigned_upload_url(message.from_user.id, "wheel")
+
+    if car_url and wheel_url:
+        # Object storage serves the photos to the provider directly.
+        car_bytes = wheel_bytes = None
+    else:
+        car_bytes = await _load_photo_bytes("car", car_id, "car_photo_path")
+        wheel_bytes = await _load_photo_bytes("wheel", wheel_id, "wheel_photo_path")
+
+    if not (car_url and wheel_url) and (not car_bytes or not wheel_bytes):
+        await job_service.refund(job.id, error="photos unreadable")
         await message.answer("Не удалось обработать фото. Пришли их ещё раз, пожалуйста.")
         await _send_main_menu(message, message.from_user.id)
         await state.set_state(FittingStates.menu)
         return
 
-    ai_service = get_ai_service()
     try:
-        result_bytes = await ai_service.generate(
-            car_photo=car_bytes,
-            wheel_photo=wheel_bytes,
-        )
+        with fal_queue.on_ticket(partial(job_service.record_ticket, job.id)):
+            result_path = await get_job_registry().run(
+                message.from_user.id,
+                "generation",
+                get_admission_controller().run(
+                    "image",
+                    ai_service.generate(
+                        car_photo=car_bytes,
+                        wheel_photo=wheel_bytes,
+                        sink=partial(write_upload_stream, message.from_user.id, "result"),
+                        car_url=car_url,
+                        wheel_url=wheel_url,
+                    ),
+                    user_id=message.from_user.id,
+                    priority=decision.priority,
+                ),
+            )
+    except JobCancelled:
+        logger.info("Generation cancelled by user %s", message.from_user.id)
+        await job_service.refund(job.id, status="cancelled")
+        return
     except Exception as exc:  # pragma: no cover - network/AI failure handling
         logger.exception("AI generation failed: %s", exc)
         await message.answer(
             "К сожалению, не удалось получить результат. Я верну генерацию в ближайшее время."
         )
         await _send_main_menu(message, message.from_user.id)
-        await user_service.add_credits(message.from_user.id, 1)
+        await job_service.refund(job.id, error=str(exc))
         await state.set_state(FittingStates.menu)
         return
 
-    result_path = build_upload_path(message.from_user.id, "result")
-    result_path.write_bytes(result_bytes)
     await state.update_data(result_photo_path=str(result_path))
+    await job_service.set_status(
+        job.id, "completed", result_digest=await storage.upload_digest(message.from_user.id, "result")
+    )
 
-    video_path = build_upload_path(message.from_user.id, "video")
-    if video_path.exists():
-        video_path.unlink(missing_ok=True)
+    await storage.delete_upload(message.from_user.id, "video")
 
-    output_file = BufferedInputFile(result_bytes, filename="hype_tuning_result.jpg")
-    await message.answer_photo(output_file)
+    await delivery.send_result_photo(message.bot, message.chat.id, message.from_user.id, result_path)
+    await job_service.set_status(job.id, "delivered")
 
     user = await user_service.get_user(message.from_user.id)
     balance_display = "∞" if user and user.is_admin else str(user.balance if user else 0)
@@ -5,12 +5,10 @@ import logging
 from aiogram import F, Router
 from aiogram.filters import CommandStart
 from aiogram.fsm.context import FSMContext
-from aiogram.types import CallbackQuery, Message
-from aiogram.enums import ChatMemberStatus
-from aiogram.exceptions import TelegramAPIError
+from aiogram.types import CallbackQuery, ChatMemberUpdated, Message
 
 from ..keyboards.common import start_keyboard, menu_keyboard, subscription_keyboard
-from ..services import user_service
+from ..services import subscription_service, user_service
 from ..states.fitting import FittingStates
 from ..utils.media import default_banner, intro_video
 from bot.config import get_settings
@@ -25,7 +23,7 @@ _settings = get_settings()
 async def cmd_start(message: Message, state: FSMContext) -> None:
     user = await user_service.get_user(message.from_user.id)
 
-    if not await _has_required_subscription(message.bot, message.from_user.id):
+    if not await subscription_service.has_required_subscription(message.bot, message.from_user.id):
         await _prompt_subscription(message)
         await state.set_state(FittingStates.start)
         return
@@ -48,8 +46,9 @@ async def verify_subscription(callback: CallbackQuery, state: FSMContext) -> Non
         await callback.answer("Подписка не требуется.", show_alert=True)
         return
 
-    user = await user_service.get_user(callback.from_user.id)
-    if not await _has_required_subscription(callback.bot, callback.from_user.id):
+    # The user says they have just subscribed, so a cached refusal is stale.
+    subscription_service.forget_refusal(callback.from_user.id)
+    if not await subscription_service.has_required_subscription(callback.bot, callback.from_user.id):
         await callback.answer("Не вижу подписку на канал 😅", show_alert=True)
         return
 
@@ -69,6 +68,15 @@ async def verify_subscription(callback: CallbackQuery, state: FSMContext) -> Non
     await state.set_state(FittingStates.menu)
 
 
+@router.chat_member()
+async def track_channel_membership(update: ChatMemberUpdated) -> None:
+    """Keep the subscription cache fresh; requires the bot to be a channel admin."""
+    if not subscription_service.is_required_channel(update.chat):
+        return
+    member = update.new_chat_member
+    subscription_service.remember(member.user.id, member.status)
+
+
 async def _send_landing_message(message: Message, caption: str, reply_markup) -> None:
     video = intro_video()
     if video:
@@ -144,16 +152,3 @@ async def _prompt_subscription(message: Message) -> None:
         text,
         reply_markup=subscription_keyboard(_channel_link()),
     )
-
-
-async def _has_required_subscription(bot, user_id: int) -> bool:
-    if not _settings.required_channel:
-        return True
-    try:
-        member = await bot.get_chat_member(_settings.required_channel, user_id)
-    except TelegramAPIError as err:
-        logger.warning("Failed to check subscription for %s: %s", user_id, err)
-        return False
-
-    status = getattr(member, "status", None)
-    return status not in {ChatMemberStatus.LEFT, ChatMemberStatus.KICKED}
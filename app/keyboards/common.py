@@ -51,13 +51,22 @@ def confirm_generation_keyboard() -> ReplyKeyboardMarkup:
 def post_result_keyboard() -> ReplyKeyboardMarkup:
     builder = ReplyKeyboardBuilder()
     builder.button(text="🎬 Видео-пролёт")
+    builder.button(text="📎 Оригинал")
     builder.button(text="🔁 Новая примерка")
     builder.button(text="💳 Купить генерации")
     builder.button(text="🏠 В меню")
-    builder.adjust(1, 2, 1)
+    builder.adjust(2, 2, 1)
     return builder.as_markup(resize_keyboard=True)
 
 
+def waitlist_keyboard(kind: str) -> InlineKeyboardMarkup:
+    builder = InlineKeyboardBuilder()
+    builder.button(text="🔔 Сообщить, когда освободится", callback_data=f"waitlist:{kind}")
+    builder.button(text="🏠 В меню", callback_data="menu:back")
+    builder.adjust(1)
+    return builder.as_markup()
+
+
 def shop_keyboard() -> InlineKeyboardMarkup:
     builder = InlineKeyboardBuilder()
     builder.button(text="1 генерация — 199₽", callback_data="shop:one")
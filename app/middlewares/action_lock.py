@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+import logging
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional, Protocol
+
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.flags import get_flag
+from aiogram.types import CallbackQuery, Message, TelegramObject
+
+from bot.config import get_settings
+from ..utils.redis import get_redis
+
+logger = logging.getLogger(__name__)
+_settings = get_settings()
+
+ACTION_LABELS = {
+    "generation": "Генерация",
+    "video": "Видео-пролёт",
+}
+
+_RELEASE_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+class ActionLockBackend(Protocol):
+    async def acquire(self, key: str, value: str, ttl: float) -> Optional[str]:
+        """Take the lock; return ``None`` on success or the current holder value."""
+
+    async def release(self, key: str, value: str) -> None:
+        """Release the lock if it is still held with ``value``."""
+
+
+class MemoryActionLockBackend:
+    """Process-local locks; enough for a single bot instance."""
+
+    def __init__(self) -> None:
+        self._locks: dict[str, tuple[str, float]] = {}
+
+    async def acquire(self, key: str, value: str, ttl: float) -> Optional[str]:
+        now = time.monotonic()
+        current = self._locks.get(key)
+        if current and current[1] > now:
+            return current[0]
+        self._locks[key] = (value, now + ttl)
+        return None
+
+    async def release(self, key: str, value: str) -> None:
+        current = self._locks.get(key)
+        if current and current[0] == value:
+            del self._locks[key]
+
+
+class RedisActionLockBackend:
+    """Locks shared between bot processes through Redis ``SET NX``."""
+
+    def __init__(self, prefix: str = "hypetuning:action_lock:") -> None:
+        self._redis = get_redis()
+        self._prefix = prefix
+
+    async def acquire(self, key: str, value: str, ttl: float) -> Optional[str]:
+        name = self._prefix + key
+        if await self._redis.set(name, value, nx=True, px=int(ttl * 1000)):
+            return None
+        holder = await self._redis.get(name)
+        # The holder may have expired between SET and GET; treat that as busy
+        # for this attempt rather than racing for the key again.
+        return holder or value
+
+    async def release(self, key: str, value: str) -> None:
+        await self._redis.eval(_RELEASE_SCRIPT, 1, self._prefix + key, value)
+
+
+def build_action_lock_backend() -> ActionLockBackend:
+    if _settings.action_lock_backend == "redis":
+        return RedisActionLockBackend()
+    if _settings.action_lock_backend != "memory":
+        logger.warning("Unknown ACTION_LOCK_BACKEND '%s'; using memory", _settings.action_lock_backend)
+    return MemoryActionLockBackend()
+
+
+class ActionLockMiddleware(BaseMiddleware):
+    """Allow one expensive action per user at a time.
+
+    Handlers opt in with ``flags={"action_lock": "<action>"}``. While an action
+    is in flight, any other flagged handler for the same user is skipped and
+    the user is told that the job is still running.
+    """
+
+    def __init__(self, backend: Optional[ActionLockBackend] = None, ttl: Optional[float] = None) -> None:
+        self.backend = backend or build_action_lock_backend()
+        self.ttl = ttl or _settings.action_lock_ttl
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        action = get_flag(data, "action_lock")
+        user = data.get("event_from_user")
+        if not action or user is None:
+            return await handler(event, data)
+
+        key = str(user.id)
+        value = f"{action}:{uuid.uuid4().hex}"
+        holder = await self.backend.acquire(key, value, self.ttl)
+        if holder is not None:
+            running_action = holder.split(":", maxsplit=1)[0]
+            logger.info("User %s requested %s while %s is running", user.id, action, running_action)
+            await _notify_busy(event, running_action)
+            return None
+
+        try:
+            return await handler(event, data)
+        finally:
+            await self.backend.release(key, value)
+
+
+async def _notify_busy(event: TelegramObject, running_action: str) -> None:
+    label = ACTION_LABELS.get(running_action, "Задача")
+    text = f"⏳ {label} уже выполняется. Дождись результата — пришлю его сюда."
+    if isinstance(event, CallbackQuery):
+        await event.answer(text, show_alert=True)
+    elif isinstance(event, Message):
+        await event.answer(text)
@@ -0,0 +1,43 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+
+class InFlightMiddleware(BaseMiddleware):
+    """Outer update middleware that keeps track of updates being handled.
+
+    Shutdown uses it to wait for running handlers (and the generations they
+    started) and to confirm the last received update to Telegram before the
+    next process takes over polling.
+    """
+
+    def __init__(self) -> None:
+        self.tasks: set[asyncio.Task] = set()
+        self.last_update_id: int | None = None
+        self.last_update_at: float | None = None
+
+    def __len__(self) -> int:
+        return len(self.tasks)
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        if isinstance(event, Update):
+            self.last_update_id = max(self.last_update_id or 0, event.update_id)
+            self.last_update_at = time.time()
+        task = asyncio.current_task()
+        if task is None:
+            return await handler(event, data)
+        self.tasks.add(task)
+        try:
+            return await handler(event, data)
+        finally:
+            self.tasks.discard(task)
@@ -0,0 +1,186 @@
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from enum import IntEnum
+from typing import TYPE_CHECKING, Any, Iterator, Optional
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+
+from bot.config import get_settings
+from ..services.metrics import TELEGRAM_RETRIES, register_queue
+from ..utils.rate_limit import Limit, MemoryBucketStore, TokenBucket
+
+if TYPE_CHECKING:
+    from aiogram import Bot
+
+logger = logging.getLogger(__name__)
+_settings = get_settings()
+
+RETRY_ATTEMPTS = 3
+FLUSH_POLL_INTERVAL = 0.1
+_SCHEDULED_PREFIXES = ("send", "copy", "forward", "edit")
+_UNSCHEDULED_METHODS = {"sendChatAction"}
+
+
+class SendPriority(IntEnum):
+    INTERACTIVE = 0
+    BULK = 1
+
+
+_send_priority: ContextVar[SendPriority] = ContextVar("send_priority", default=SendPriority.INTERACTIVE)
+
+
+@contextmanager
+def bulk_sends() -> Iterator[None]:
+    """Mark Telegram sends made inside the block as low-priority bulk traffic."""
+    token = _send_priority.set(SendPriority.BULK)
+    try:
+        yield
+    finally:
+        _send_priority.reset(token)
+
+
+class PriorityRateGate:
+    """Global token bucket that hands out tokens to waiters by priority."""
+
+    def __init__(self, limit: Limit) -> None:
+        self._bucket = TokenBucket(limit)
+        self._waiters: list[tuple[int, int, asyncio.Future[None]]] = []
+        self._sequence = itertools.count()
+        self._paused_until = 0.0
+        self._pump: Optional[asyncio.Task[None]] = None
+        self.depth = {priority: 0 for priority in SendPriority}
+
+    def pause(self, seconds: float) -> None:
+        """Hold every send after Telegram reported a bot-wide flood wait."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    async def acquire(self, priority: SendPriority) -> None:
+        if not self._waiters and time.monotonic() >= self._paused_until and not self._bucket.consume():
+            return
+
+        future: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        self.depth[priority] += 1
+        if self._pump is None or self._pump.done():
+            self._pump = asyncio.create_task(self._run_pump(), name="outbound-rate-gate")
+        try:
+            await future
+        finally:
+            self.depth[priority] -= 1
+
+    async def _run_pump(self) -> None:
+        while self._waiters:
+            paused_for = self._paused_until - time.monotonic()
+            if paused_for > 0:
+                await asyncio.sleep(paused_for)
+                continue
+            wait = self._bucket.consume()
+            if wait:
+                await asyncio.sleep(wait)
+                continue
+            while self._waiters:
+                _, _, future = heapq.heappop(self._waiters)
+                if not future.done():
+                    future.set_result(None)
+                    break
+            else:
+                # Every remaining waiter was cancelled; give the token back.
+                self._bucket.tokens = min(self._bucket.capacity, self._bucket.tokens + 1)
+
+
+class OutboundScheduler(BaseRequestMiddleware):
+    """Session middleware that paces every outgoing Telegram message.
+
+    Sends pass through a global bucket (interactive replies are served before
+    bulk traffic marked with :func:`bulk_sends`) and a per-chat bucket, and
+    ``RetryAfter`` responses are retried transparently after the advised delay.
+    """
+
+    def __init__(self) -> None:
+        # The bot-wide Telegram limit is split between supervisor workers.
+        self.gate = PriorityRateGate(Limit.parse(_settings.outbound_global_limit).share(_settings.workers))
+        self._chat_buckets = MemoryBucketStore()
+        self._private_limit = Limit.parse(_settings.outbound_chat_limit)
+        self._group_limit = Limit.parse(_settings.outbound_group_chat_limit)
+        self.retries = 0
+        self.flood_waits = 0
+        register_queue("outbound_interactive", lambda: self.gate.depth[SendPriority.INTERACTIVE])
+        register_queue("outbound_bulk", lambda: self.gate.depth[SendPriority.BULK])
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "interactive_queue": self.gate.depth[SendPriority.INTERACTIVE],
+            "bulk_queue": self.gate.depth[SendPriority.BULK],
+            "retries": self.retries,
+            "flood_waits": self.flood_waits,
+        }
+
+    async def flush(self, timeout: float) -> bool:
+        """Wait until queued sends went out; ``False`` if ``timeout`` expired first."""
+        deadline = time.monotonic() + timeout
+        while any(self.gate.depth.values()):
+            if time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(FLUSH_POLL_INTERVAL)
+        return True
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: "Bot",
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        chat_id = getattr(method, "chat_id", None)
+        api_method = method.__api_method__
+        if chat_id is None or api_method in _UNSCHEDULED_METHODS or not api_method.startswith(_SCHEDULED_PREFIXES):
+            return await make_request(bot, method)
+
+        priority = _send_priority.get()
+        for attempt in range(1, RETRY_ATTEMPTS + 1):
+            await self._wait_for_chat(chat_id)
+            await self.gate.acquire(priority)
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as exc:
+                self.flood_waits += 1
+                if attempt >= RETRY_ATTEMPTS:
+                    raise
+                self.retries += 1
+                TELEGRAM_RETRIES.inc(method=api_method)
+                logger.warning(
+                    "Telegram flood control on %s to %s; retrying in %ss (attempt %s/%s)",
+                    api_method,
+                    chat_id,
+                    exc.retry_after,
+                    attempt,
+                    RETRY_ATTEMPTS,
+                )
+                self.gate.pause(exc.retry_after)
+                await asyncio.sleep(exc.retry_after)
+        raise RuntimeError("unreachable")  # pragma: no cover
+
+    async def _wait_for_chat(self, chat_id: Any) -> None:
+        is_private = isinstance(chat_id, int) and chat_id > 0
+        limit = self._private_limit if is_private else self._group_limit
+        while wait := await self._chat_buckets.hit(str(chat_id), limit):
+            await asyncio.sleep(wait)
+
+
+_scheduler: OutboundScheduler | None = None
+
+
+def get_outbound_scheduler() -> OutboundScheduler:
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = OutboundScheduler()
+    return _scheduler
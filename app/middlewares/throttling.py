@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+import logging
+import math
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery, Message, TelegramObject
+
+from bot.config import get_settings
+from ..utils.rate_limit import BucketStore, Limit, MemoryBucketStore, RedisBucketStore
+
+logger = logging.getLogger(__name__)
+_settings = get_settings()
+
+COOLDOWN_NOTICE_INTERVAL = 10.0
+
+
+def _parse_group_limits(raw: str) -> dict[str, Limit]:
+    limits: dict[str, Limit] = {}
+    for chunk in raw.split(","):
+        if not chunk.strip():
+            continue
+        group, _, value = chunk.partition("=")
+        try:
+            limits[group.strip()] = Limit.parse(value)
+        except ValueError:
+            logger.warning("Ignoring invalid throttle limit '%s'", chunk)
+    return limits
+
+
+class Throttler:
+    """Shared limiter state for every throttled router.
+
+    Each event is checked against the user's bucket, the user's bucket for the
+    handler group (menu, fitting, payments, admin) and then the global bucket,
+    so a user who is already over their own limit does not spend the shared one.
+    """
+
+    def __init__(self, store: Optional[BucketStore] = None) -> None:
+        self.store = store or self._build_store()
+        self.global_limit = Limit.parse(_settings.throttle_global_limit)
+        self.user_limit = Limit.parse(_settings.throttle_user_limit)
+        self.group_limits = _parse_group_limits(_settings.throttle_group_limits)
+        self._notified_at: dict[int, float] = {}
+
+    @staticmethod
+    def _build_store() -> BucketStore:
+        if _settings.throttle_backend == "redis":
+            return RedisBucketStore()
+        return MemoryBucketStore()
+
+    async def check(self, user_id: int, group: str) -> float:
+        """Return 0 if the event may proceed, otherwise the cooldown in seconds."""
+        wait = await self.store.hit(f"user:{user_id}", self.user_limit)
+        if wait:
+            return wait
+        group_limit = self.group_limits.get(group)
+        if group_limit:
+            wait = await self.store.hit(f"user:{user_id}:{group}", group_limit)
+            if wait:
+                return wait
+        return await self.store.hit("global", self.global_limit)
+
+    def should_notify(self, user_id: int) -> bool:
+        """Send at most one cooldown notice per user per interval."""
+        now = time.monotonic()
+        if now - self._notified_at.get(user_id, 0.0) < COOLDOWN_NOTICE_INTERVAL:
+            return False
+        if len(self._notified_at) > 10_000:
+            self._notified_at = {
+                uid: ts for uid, ts in self._notified_at.items() if now - ts < COOLDOWN_NOTICE_INTERVAL
+            }
+        self._notified_at[user_id] = now
+        return True
+
+    def middleware(self, group: str) -> "ThrottlingMiddleware":
+        return ThrottlingMiddleware(self, group)
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    def __init__(self, throttler: Throttler, group: str) -> None:
+        self.throttler = throttler
+        self.group = group
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        user = data.get("event_from_user")
+        if user is None or user.id in _settings.admin_ids:
+            return await handler(event, data)
+        # Telegram does not resend a dropped payment confirmation: the user would pay for nothing.
+        if isinstance(event, Message) and event.successful_payment is not None:
+            return await handler(event, data)
+
+        wait = await self.throttler.check(user.id, self.group)
+        if not wait:
+            return await handler(event, data)
+
+        logger.info("Throttled user %s in group %s for %.1fs", user.id, self.group, wait)
+        text = f"Слишком много запросов 🙏 Подожди {max(1, math.ceil(wait))} сек. и попробуй снова."
+        if isinstance(event, CallbackQuery):
+            await event.answer(text)
+        elif isinstance(event, Message) and self.throttler.should_notify(user.id):
+            await event.answer(text)
+        return None
@@ -0,0 +1,36 @@
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import BigInteger, DateTime, Integer, String, Text
+from sqlalchemy.orm import Mapped, mapped_column
+
+from .base import Base
+
+
+class Broadcast(Base):
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    created_by: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    text: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    from_chat_id: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True)
+    message_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    status: Mapped[str] = mapped_column(String(32), nullable=False, default="running", index=True)
+    worker_id: Mapped[str] = mapped_column(String(64), nullable=False, default="main", server_default="main")
+    cursor_user_id: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    total: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    sent: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    failed: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    blocked: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    report_chat_id: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True)
+    report_message_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False, default=datetime.utcnow)
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False, default=datetime.utcnow)
+    finished_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+
+    @property
+    def processed(self) -> int:
+        return self.sent + self.failed + self.blocked
+
+    def __repr__(self) -> str:
+        return f"Broadcast(id={self.id}, status={self.status}, sent={self.sent}, cursor={self.cursor_user_id})"
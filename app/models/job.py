@@ -0,0 +1,32 @@
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import BigInteger, DateTime, Integer, String, Text
+from sqlalchemy.orm import Mapped, mapped_column
+
+from .base import Base
+
+
+class Job(Base):
+    """Journal entry for a paid provider job (image generation or fly-by video)."""
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    user_id: Mapped[int] = mapped_column(BigInteger, nullable=False, index=True)
+    chat_id: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    kind: Mapped[str] = mapped_column(String(16), nullable=False)
+    status: Mapped[str] = mapped_column(String(16), nullable=False, default="pending", index=True)
+    worker_id: Mapped[str] = mapped_column(String(64), nullable=False, default="main")
+    credits: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    inputs_json: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    provider_request_id: Mapped[Optional[str]] = mapped_column(String(128), nullable=True)
+    provider_ticket: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    result_digest: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)
+    error: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False, default=datetime.utcnow)
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False, default=datetime.utcnow)
+    finished_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+
+    def __repr__(self) -> str:
+        return f"Job(id={self.id}, kind={self.kind}, status={self.status}, user={self.user_id})"
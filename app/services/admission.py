@@ -0,0 +1,234 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import math
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from enum import IntEnum
+from typing import Awaitable, Literal, Optional, TypeVar
+
+from aiogram import Bot
+
+from bot.config import get_settings
+from ..models.user import User
+from . import payment_service
+from .metrics import register_queue
+from .scheduler import FairQueue, Ticket
+
+logger = logging.getLogger(__name__)
+_settings = get_settings()
+
+WorkKind = Literal["image", "video"]
+
+LATENCY_ALPHA = 0.2
+INITIAL_LATENCY = {"image": 45.0, "video": 120.0}
+
+_T = TypeVar("_T")
+
+
+class Priority(IntEnum):
+    ADMIN = 0
+    PAID = 1
+    FREE = 2
+
+
+async def priority_for(user: User) -> Priority:
+    if user.is_admin:
+        return Priority.ADMIN
+    if await payment_service.has_succeeded_payment(user.id):
+        return Priority.PAID
+    return Priority.FREE
+
+
+@dataclass(slots=True)
+class Decision:
+    admitted: bool
+    priority: Priority
+    wait: float
+    eta: float
+    position: int
+
+
+class WorkPool:
+    """Bounded pool of provider slots for one kind of work.
+
+    Free slots are handed to waiting jobs through a :class:`FairQueue`, so
+    admins go before paying users, paying users before free-trial users,
+    and users of one class take turns. The pool keeps an EWMA of job
+    latency, which turns the queue depth into an expected wait.
+    """
+
+    def __init__(self, kind: WorkKind, capacity: int) -> None:
+        self.kind = kind
+        self.capacity = max(1, capacity)
+        self.latency = INITIAL_LATENCY[kind]
+        self.running = 0
+        self._queue = FairQueue()
+        self._tickets: dict[int, list[Ticket]] = {}
+
+    @property
+    def waiting(self) -> int:
+        return len(self._queue)
+
+    def jobs_ahead(self, priority: Priority) -> int:
+        return self._queue.ahead_of_class(priority)
+
+    def estimated_wait(self, priority: Priority = Priority.FREE) -> float:
+        """Seconds a job of ``priority`` submitted now would wait for a slot."""
+        ahead = self.running + self.jobs_ahead(priority) - self.capacity + 1
+        if ahead <= 0:
+            return 0.0
+        return math.ceil(ahead / self.capacity) * self.latency
+
+    def position(self, user_id: int) -> Optional[int]:
+        """Queue position of the user's oldest waiting job, for UI feedback."""
+        tickets = self._tickets.get(user_id)
+        return self._queue.position(tickets[0]) if tickets else None
+
+    def observe(self, seconds: float) -> None:
+        self.latency += LATENCY_ALPHA * (seconds - self.latency)
+
+    async def _acquire(self, user_id: int, priority: Priority) -> None:
+        if self.running < self.capacity and not self.waiting:
+            self.running += 1
+            return
+        ticket = Ticket(user_id=user_id, priority=priority)
+        self._queue.push(ticket)
+        self._tickets.setdefault(user_id, []).append(ticket)
+        try:
+            # ``_release`` hands the slot over by resolving the future.
+            await ticket.granted
+        except BaseException:
+            if ticket.granted.done() and not ticket.granted.cancelled():
+                self._release()
+            self._queue.remove(ticket)
+            raise
+        finally:
+            tickets = self._tickets[user_id]
+            tickets.remove(ticket)
+            if not tickets:
+                del self._tickets[user_id]
+
+    def _release(self) -> None:
+        while (ticket := self._queue.pop()) is not None:
+            if not ticket.granted.done():
+                ticket.granted.set_result(None)
+                return
+        self.running -= 1
+
+    async def run(self, job: Awaitable[_T], *, user_id: int, priority: Priority) -> _T:
+        try:
+            await self._acquire(user_id, priority)
+        except BaseException:
+            _close(job)
+            raise
+        started = time.monotonic()
+        try:
+            result = await job
+        finally:
+            self._release()
+        self.observe(time.monotonic() - started)
+        return result
+
+
+def _close(job: Awaitable) -> None:
+    # A job cancelled while queued was never started; close it quietly.
+    close = getattr(job, "close", None)
+    if close:
+        close()
+
+
+class AdmissionController:
+    """Decides whether new provider work is accepted and keeps a waitlist.
+
+    Jobs are refused (before any credit is charged) when the expected wait
+    exceeds the limit of the user's priority class; admins are never
+    refused. Refused users can ask to be notified when the queue drains.
+    """
+
+    def __init__(self) -> None:
+        # Provider concurrency is a global budget; each supervisor worker gets a share.
+        self.pools: dict[str, WorkPool] = {
+            "image": WorkPool("image", math.ceil(_settings.image_concurrency / _settings.workers)),
+            "video": WorkPool("video", math.ceil(_settings.video_concurrency / _settings.workers)),
+        }
+        self._max_wait = {
+            Priority.ADMIN: math.inf,
+            Priority.PAID: float(_settings.admission_max_wait_paid),
+            Priority.FREE: float(_settings.admission_max_wait_free),
+        }
+        self._waitlist: dict[str, OrderedDict[int, Bot]] = {kind: OrderedDict() for kind in self.pools}
+        self._notify_tasks: set[asyncio.Task] = set()
+        for kind, pool in self.pools.items():
+            register_queue(f"{kind}_running", lambda pool=pool: pool.running)
+            register_queue(f"{kind}_waiting", lambda pool=pool: pool.waiting)
+
+    def evaluate(self, kind: WorkKind, priority: Priority) -> Decision:
+        pool = self.pools[kind]
+        wait = pool.estimated_wait(priority)
+        return Decision(
+            admitted=wait <= self._max_wait[priority],
+            priority=priority,
+            wait=wait,
+            eta=wait + pool.latency,
+            position=pool.jobs_ahead(priority) + 1 if wait else 0,
+        )
+
+    async def run(self, kind: WorkKind, job: Awaitable[_T], *, user_id: int, priority: Priority) -> _T:
+        try:
+            return await self.pools[kind].run(job, user_id=user_id, priority=priority)
+        finally:
+            self._notify_waitlist(kind)
+
+    def position(self, kind: WorkKind, user_id: int) -> Optional[int]:
+        return self.pools[kind].position(user_id)
+
+    def join_waitlist(self, kind: WorkKind, chat_id: int, bot: Bot) -> None:
+        self._waitlist[kind][chat_id] = bot
+
+    def stats(self) -> dict[str, dict[str, float]]:
+        return {
+            kind: {
+                "running": pool.running,
+                "waiting": pool.waiting,
+                "latency": round(pool.latency, 1),
+                "waitlist": len(self._waitlist[kind]),
+            }
+            for kind, pool in self.pools.items()
+        }
+
+    def _notify_waitlist(self, kind: WorkKind) -> None:
+        waiters = self._waitlist[kind]
+        if not waiters or not self.evaluate(kind, Priority.FREE).admitted:
+            return
+        recipients = list(waiters.items())
+        waiters.clear()
+        task = asyncio.create_task(self._send_notifications(kind, recipients))
+        self._notify_tasks.add(task)
+        task.add_done_callback(self._notify_tasks.discard)
+
+    async def _send_notifications(self, kind: WorkKind, recipients: list[tuple[int, Bot]]) -> None:
+        what = "генерацию" if kind == "image" else "видео-пролёт"
+        for chat_id, bot in recipients:
+            try:
+                await bot.send_message(chat_id, f"🔔 Очередь освободилась — можно запускать {what}.")
+            except Exception:  # pragma: no cover - notification is best effort
+                logger.warning("Failed to notify %s about free %s capacity", chat_id, kind, exc_info=True)
+
+
+_controller: Optional[AdmissionController] = None
+
+
+def get_admission_controller() -> AdmissionController:
+    global _controller
+    if _controller is None:
+        _controller = AdmissionController()
+    return _controller
+
+
+def format_wait(seconds: float) -> str:
+    if seconds < 90:
+        return f"{max(int(round(seconds / 5.0)) * 5, 5)} секунд"
+    return f"{math.ceil(seconds / 60)} мин"
@@ -3,11 +3,18 @@ from __future__ import annotations
 import asyncio
 import base64
 import logging
-from typing import Optional
+from contextlib import contextmanager
+from pathlib import Path
+from typing import AsyncIterable, AsyncIterator, Awaitable, Callable, Iterator, Optional
 
 import aiohttp
 
 from bot.config import get_settings
+from ..utils.fileio import CHUNK_SIZE
+from . import fal_queue
+from .memory import hold
+from .metrics import PROVIDER_RETRIES, PROVIDER_SECONDS, PROVIDER_TIMEOUTS
+from .tracing import span
 
 logger = logging.getLogger(__name__)
 
@@ -22,6 +29,41 @@ GPT_IMAGE15_BACKOFF_BASE = 2
 GPT_IMAGE2_RETRIES = 2  # additional attempts after the first try
 GPT_IMAGE2_BACKOFF_BASE = 2
 
+NANOBANANA_ALIASES = {"nanobanana", "nano-banana", "fal_nanobanana"}
+GPT_IMAGE15_ALIASES = {"gpt_image15", "gpt-image-1.5", "gptimage15", "gpt_image_15"}
+GPT_IMAGE2_ALIASES = {"gpt_image2", "gpt-image-2", "gptimage2", "gpt_image_2"}
+
+# Receives the result as a chunk stream and returns where it was stored.
+ResultSink = Callable[[AsyncIterable[bytes]], Awaitable[Path]]
+
+
+@contextmanager
+def provider_phase(provider: str, phase: str) -> Iterator[None]:
+    """Time one phase of a provider call for ``/metrics`` and the current trace."""
+    with PROVIDER_SECONDS.time(provider=provider, phase=phase), span(f"{provider} {phase}"):
+        yield
+
+
+async def _single_chunk(data: bytes) -> AsyncIterator[bytes]:
+    yield data
+
+
+async def download_result(session: aiohttp.ClientSession, url: str, sink: ResultSink) -> Path:
+    """Pipe a provider result into ``sink`` without holding the whole file."""
+    async with session.get(url, timeout=GENERATION_DOWNLOAD_TIMEOUT) as response:
+        response.raise_for_status()
+        return await sink(response.content.iter_chunked(CHUNK_SIZE))
+
+
+async def collect_fal_image(session: aiohttp.ClientSession, data: dict, sink: ResultSink) -> Path:
+    """Download the image of a finished fal request, e.g. one recovered after a restart."""
+    try:
+        image_url = data["images"][0]["url"]
+    except (KeyError, IndexError, TypeError) as exc:
+        logger.error("Unexpected fal image response: %s", data)
+        raise RuntimeError("Failed to parse fal image response") from exc
+    return await download_result(session, image_url, sink)
+
 
 GENERATION_PROMPT = """Task: Photorealistic rim swap from two photos; новые диски должны быть 1:1 как на фото B, одинаково точные в обеих панелях.
 Inputs:
@@ -61,35 +103,56 @@ class AIService:
     def __init__(self, api_key: Optional[str] = None, provider: Optional[str] = None) -> None:
         self.api_key = api_key or _settings.fal_api_key
         self.provider = (provider or _settings.ai_provider).lower()
-
-    async def generate(self, car_photo: bytes, wheel_photo: bytes) -> bytes:
+        self.output_format = _settings.ai_output_format
+
+    @property
+    def accepts_urls(self) -> bool:
+        """fal providers can fetch inputs by URL instead of inline data URIs."""
+        return self.provider in NANOBANANA_ALIASES | GPT_IMAGE15_ALIASES | GPT_IMAGE2_ALIASES
+
+    async def generate(
+        self,
+        car_photo: Optional[bytes] = None,
+        wheel_photo: Optional[bytes] = None,
+        *,
+        sink: ResultSink,
+        car_url: Optional[str] = None,
+        wheel_url: Optional[str] = None,
+    ) -> Path:
         if not self.api_key:
             logger.error("FAL API key not configured; aborting generation")
             raise RuntimeError("FAL API key not configured")
 
-        if self.provider == "gemini":
-            return await self._call_gemini(car_photo, wheel_photo)
-        if self.provider in {"chatgpt", "openai"}:
-            return await self._call_openai(car_photo, wheel_photo)
-        if self.provider in {"gpt_image15", "gpt-image-1.5", "gptimage15", "gpt_image_15"}:
-            return await self._call_gpt_image15(car_photo, wheel_photo)
-        if self.provider in {"gpt_image2", "gpt-image-2", "gptimage2", "gpt_image_2"}:
-            return await self._call_gpt_image2(car_photo, wheel_photo)
-        if self.provider in {"nanobanana", "nano-banana", "fal_nanobanana"}:
-            return await self._call_nanobanana(car_photo, wheel_photo)
+        with hold("photo", car_photo, wheel_photo):
+            if self.provider in GPT_IMAGE15_ALIASES:
+                return await self._call_gpt_image15(car_photo, wheel_photo, sink, car_url, wheel_url)
+            if self.provider in GPT_IMAGE2_ALIASES:
+                return await self._call_gpt_image2(car_photo, wheel_photo, sink, car_url, wheel_url)
+            if self.provider in NANOBANANA_ALIASES:
+                return await self._call_nanobanana(car_photo, wheel_photo, sink, car_url, wheel_url)
+
+            if car_photo is None or wheel_photo is None:
+                raise RuntimeError(f"AI provider '{self.provider}' needs image bytes")
+            if self.provider == "gemini":
+                return await self._call_gemini(car_photo, wheel_photo, sink)
+            if self.provider in {"chatgpt", "openai"}:
+                return await self._call_openai(car_photo, wheel_photo, sink)
 
         logger.error("Unknown AI provider '%s'", self.provider)
         raise RuntimeError(f"Unknown AI provider '{self.provider}'")
 
-    async def _call_gemini(self, car_photo: bytes, wheel_photo: bytes) -> bytes:
+    async def _call_gemini(self, car_photo: bytes, wheel_photo: bytes, sink: ResultSink) -> Path:
         endpoint = "https://generativelanguage.googleapis.com/v1beta/models/gemini-pro-vision:generateContent"
+        with provider_phase("gemini", "encode"):
+            car_data = base64.b64encode(car_photo).decode()
+            wheel_data = base64.b64encode(wheel_photo).decode()
         payload = {
             "contents": [
                 {
                     "parts": [
                         {"text": GENERATION_PROMPT},
-                        {"inline_data": {"mime_type": "image/jpeg", "data": base64.b64encode(car_photo).decode()}},
-                        {"inline_data": {"mime_type": "image/jpeg", "data": base64.b64encode(wheel_photo).decode()}},
+                        {"inline_data": {"mime_type": "image/jpeg", "data": car_data}},
+                        {"inline_data": {"mime_type": "image/jpeg", "data": wheel_data}},
                     ]
                 }
             ]
@@ -100,18 +163,20 @@ class AIService:
         }
 
         async with aiohttp.ClientSession() as session:
-            async with session.post(endpoint, json=payload, headers=headers, timeout=60) as response:
-                response.raise_for_status()
-                data = await response.json()
+            with provider_phase("gemini", "request"):
+                async with session.post(endpoint, json=payload, headers=headers, timeout=60) as response:
+                    response.raise_for_status()
+                    data = await response.json()
 
         try:
             image_data = data["candidates"][0]["content"]["parts"][0]["inline_data"]["data"]
         except (KeyError, IndexError) as exc:
             logger.error("Unexpected Gemini response: %s", data)
             raise RuntimeError("Failed to parse Gemini response") from exc
-        return base64.b64decode(image_data)
+        with provider_phase("gemini", "download"):
+            return await sink(_single_chunk(base64.b64decode(image_data)))
 
-    async def _call_openai(self, car_photo: bytes, wheel_photo: bytes) -> bytes:
+    async def _call_openai(self, car_photo: bytes, wheel_photo: bytes, sink: ResultSink) -> Path:
         endpoint = "https://api.openai.com/v1/images/edits"
         form_data = aiohttp.FormData()
         form_data.add_field("prompt", GENERATION_PROMPT)
@@ -124,19 +189,28 @@ class AIService:
         }
 
         async with aiohttp.ClientSession() as session:
-            async with session.post(endpoint, data=form_data, headers=headers, timeout=60) as response:
-                response.raise_for_status()
-                data = await response.json()
+            with provider_phase("openai", "request"):
+                async with session.post(endpoint, data=form_data, headers=headers, timeout=60) as response:
+                    response.raise_for_status()
+                    data = await response.json()
 
         try:
             image_data = data["data"][0]["b64_json"]
         except (KeyError, IndexError) as exc:
             logger.error("Unexpected OpenAI response: %s", data)
             raise RuntimeError("Failed to parse OpenAI response") from exc
-        return base64.b64decode(image_data)
-
-    async def _call_nanobanana(self, car_photo: bytes, wheel_photo: bytes) -> bytes:
-        endpoint = "https://fal.run/fal-ai/nano-banana-pro/edit"
+        with provider_phase("openai", "download"):
+            return await sink(_single_chunk(base64.b64decode(image_data)))
+
+    async def _call_nanobanana(
+        self,
+        car_photo: Optional[bytes],
+        wheel_photo: Optional[bytes],
+        sink: ResultSink,
+        car_url: Optional[str] = None,
+        wheel_url: Optional[str] = None,
+    ) -> Path:
+        model = "fal-ai/nano-banana-pro/edit"
 
         def _detect_mime(image: bytes) -> str:
             if image.startswith(b"\x89PNG"):
@@ -150,31 +224,28 @@ class AIService:
             mime = _detect_mime(image)
             return f"data:{mime};base64,{encoded}"
 
+        with provider_phase("nanobanana", "encode"):
+            image_urls = [car_url or _to_data_uri(car_photo), wheel_url or _to_data_uri(wheel_photo)]
         payload = {
             "prompt": GENERATION_PROMPT,
-            "image_urls": [_to_data_uri(car_photo), _to_data_uri(wheel_photo)],
+            "image_urls": image_urls,
             "num_images": 1,
-            "output_format": "png",
+            "output_format": self.output_format,
             "aspect_ratio": "4:3",
             "resolution": "1K",
         }
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Key {self.api_key}",
-        }
-
         async with aiohttp.ClientSession() as session:
             attempts = NANOBANANA_RETRIES + 1
             for attempt in range(1, attempts + 1):
                 try:
-                    async with session.post(
-                        endpoint,
-                        json=payload,
-                        headers=headers,
-                        timeout=GENERATION_REQUEST_TIMEOUT,
-                    ) as response:
-                        response.raise_for_status()
-                        data = await response.json()
+                    with provider_phase("nanobanana", "request"):
+                        data = await fal_queue.run(
+                            session,
+                            model,
+                            payload,
+                            api_key=self.api_key,
+                            timeout=GENERATION_REQUEST_TIMEOUT,
+                        )
 
                     try:
                         image_url = data["images"][0]["url"]
@@ -182,13 +253,14 @@ class AIService:
                         logger.error("Unexpected Nano Banana response: %s", data)
                         raise RuntimeError("Failed to parse Nano Banana response") from exc
 
-                    async with session.get(image_url, timeout=GENERATION_DOWNLOAD_TIMEOUT) as image_response:
-                        image_response.raise_for_status()
-                        return await image_response.read()
+                    with provider_phase("nanobanana", "download"):
+                        return await download_result(session, image_url, sink)
                 except asyncio.TimeoutError:
+                    PROVIDER_TIMEOUTS.inc(provider="nanobanana")
                     if attempt >= attempts:
                         logger.error("Nano Banana request timed out after %s attempts", attempts)
                         raise
+                    PROVIDER_RETRIES.inc(provider="nanobanana")
                     sleep_for = NANOBANANA_BACKOFF_BASE ** attempt
                     logger.warning(
                         "Nano Banana request timeout (attempt %s/%s). Retrying in %ss",
@@ -198,8 +270,15 @@ class AIService:
                     )
                     await asyncio.sleep(sleep_for)
 
-    async def _call_gpt_image15(self, car_photo: bytes, wheel_photo: bytes) -> bytes:
-        endpoint = "https://fal.run/fal-ai/gpt-image-1.5/edit"
+    async def _call_gpt_image15(
+        self,
+        car_photo: Optional[bytes],
+        wheel_photo: Optional[bytes],
+        sink: ResultSink,
+        car_url: Optional[str] = None,
+        wheel_url: Optional[str] = None,
+    ) -> Path:
+        model = "fal-ai/gpt-image-1.5/edit"
 
         def _detect_mime(image: bytes) -> str:
             if image.startswith(b"\x89PNG"):
@@ -213,33 +292,30 @@ class AIService:
             mime = _detect_mime(image)
             return f"data:{mime};base64,{encoded}"
 
+        with provider_phase("gpt_image15", "encode"):
+            image_urls = [car_url or _to_data_uri(car_photo), wheel_url or _to_data_uri(wheel_photo)]
         payload = {
             "prompt": GENERATION_PROMPT,
-            "image_urls": [_to_data_uri(car_photo), _to_data_uri(wheel_photo)],
+            "image_urls": image_urls,
             "image_size": "auto",
             "background": "auto",
             "quality": "high",
             "input_fidelity": "high",
             "num_images": 1,
-            "output_format": "png",
-        }
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Key {self.api_key}",
+            "output_format": self.output_format,
         }
-
         async with aiohttp.ClientSession() as session:
             attempts = GPT_IMAGE15_RETRIES + 1
             for attempt in range(1, attempts + 1):
                 try:
-                    async with session.post(
-                        endpoint,
-                        json=payload,
-                        headers=headers,
-                        timeout=GENERATION_REQUEST_TIMEOUT,
-                    ) as response:
-                        response.raise_for_status()
-                        data = await response.json()
+                    with provider_phase("gpt_image15", "request"):
+                        data = await fal_queue.run(
+                            session,
+                            model,
+                            payload,
+                            api_key=self.api_key,
+                            timeout=GENERATION_REQUEST_TIMEOUT,
+                        )
 
                     try:
                         image_url = data["images"][0]["url"]
@@ -247,13 +323,14 @@ class AIService:
                         logger.error("Unexpected GPT Image 1.5 response: %s", data)
                         raise RuntimeError("Failed to parse GPT Image 1.5 response") from exc
 
-                    async with session.get(image_url, timeout=GENERATION_DOWNLOAD_TIMEOUT) as image_response:
-                        image_response.raise_for_status()
-                        return await image_response.read()
+                    with provider_phase("gpt_image15", "download"):
+                        return await download_result(session, image_url, sink)
                 except asyncio.TimeoutError:
+                    PROVIDER_TIMEOUTS.inc(provider="gpt_image15")
                     if attempt >= attempts:
                         logger.error("GPT Image 1.5 request timed out after %s attempts", attempts)
                         raise
+                    PROVIDER_RETRIES.inc(provider="gpt_image15")
                     sleep_for = GPT_IMAGE15_BACKOFF_BASE ** attempt
                     logger.warning(
                         "GPT Image 1.5 request timeout (attempt %s/%s). Retrying in %ss",
@@ -264,8 +341,15 @@ class AIService:
                     await asyncio.sleep(sleep_for)
 
 
-    async def _call_gpt_image2(self, car_photo: bytes, wheel_photo: bytes) -> bytes:
-        endpoint = "https://fal.run/openai/gpt-image-2/edit"
+    async def _call_gpt_image2(
+        self,
+        car_photo: Optional[bytes],
+        wheel_photo: Optional[bytes],
+        sink: ResultSink,
+        car_url: Optional[str] = None,
+        wheel_url: Optional[str] = None,
+    ) -> Path:
+        model = "openai/gpt-image-2/edit"
 
         def _detect_mime(image: bytes) -> str:
             if image.startswith(b"\x89PNG"):
@@ -279,31 +363,28 @@ class AIService:
             mime = _detect_mime(image)
             return f"data:{mime};base64,{encoded}"
 
+        with provider_phase("gpt_image2", "encode"):
+            image_urls = [car_url or _to_data_uri(car_photo), wheel_url or _to_data_uri(wheel_photo)]
         payload = {
             "prompt": GENERATION_PROMPT,
-            "image_urls": [_to_data_uri(car_photo), _to_data_uri(wheel_photo)],
+            "image_urls": image_urls,
             "image_size": "auto",
             "quality": "high",
             "num_images": 1,
-            "output_format": "png",
-        }
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Key {self.api_key}",
+            "output_format": self.output_format,
         }
-
         async with aiohttp.ClientSession() as session:
             attempts = GPT_IMAGE2_RETRIES + 1
             for attempt in range(1, attempts + 1):
                 try:
-                    async with session.post(
-                        endpoint,
-                        json=payload,
-                        headers=headers,
-                        timeout=GENERATION_REQUEST_TIMEOUT,
-                    ) as response:
-                        response.raise_for_status()
-                        data = await response.json()
+                    with provider_phase("gpt_image2", "request"):
+                        data = await fal_queue.run(
+                            session,
+                            model,
+                            payload,
+                            api_key=self.api_key,
+                            timeout=GENERATION_REQUEST_TIMEOUT,
+                        )
 
                     try:
                         image_url = data["images"][0]["url"]
@@ -311,13 +392,14 @@ class AIService:
                         logger.error("Unexpected GPT Image 2 response: %s", data)
                         raise RuntimeError("Failed to parse GPT Image 2 response") from exc
 
-                    async with session.get(image_url, timeout=GENERATION_DOWNLOAD_TIMEOUT) as image_response:
-                        image_response.raise_for_status()
-                        return await image_response.read()
+                    with provider_phase("gpt_image2", "download"):
+                        return await download_result(session, image_url, sink)
                 except asyncio.TimeoutError:
+                    PROVIDER_TIMEOUTS.inc(provider="gpt_image2")
                     if attempt >= attempts:
                         logger.error("GPT Image 2 request timed out after %s attempts", attempts)
                         raise
+                    PROVIDER_RETRIES.inc(provider="gpt_image2")
                     sleep_for = GPT_IMAGE2_BACKOFF_BASE ** attempt
                     logger.warning(
                         "GPT Image 2 request timeout (attempt %s/%s). Retrying in %ss",
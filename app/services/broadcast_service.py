@@ -0,0 +1,308 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import Literal, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramBadRequest,
+    TelegramForbiddenError,
+    TelegramNetworkError,
+    TelegramRetryAfter,
+    TelegramServerError,
+)
+from sqlalchemy import select
+
+from bot.config import get_settings
+from ..database import session_factory
+from ..middlewares.outbound import bulk_sends
+from ..models.broadcast import Broadcast
+from ..utils.rate_limit import Limit, TokenBucket
+from . import user_service
+
+logger = logging.getLogger(__name__)
+_settings = get_settings()
+
+BATCH_SIZE = 200
+SEND_ATTEMPTS = 3
+PROGRESS_INTERVAL = 5.0
+NETWORK_BACKOFF = 2.0
+
+DeliveryOutcome = Literal["sent", "failed", "blocked"]
+
+
+async def create_campaign(
+    *,
+    created_by: int,
+    text: str | None = None,
+    from_chat_id: int | None = None,
+    message_id: int | None = None,
+) -> Broadcast:
+    total = await user_service.count_recipients()
+    async with session_factory() as session:
+        campaign = Broadcast(
+            created_by=created_by,
+            text=text,
+            from_chat_id=from_chat_id,
+            message_id=message_id,
+            status="running",
+            worker_id=_settings.worker_id,
+            total=total,
+        )
+        session.add(campaign)
+        await session.flush()
+        return campaign
+
+
+async def get_campaign(campaign_id: int) -> Optional[Broadcast]:
+    async with session_factory() as session:
+        return await session.get(Broadcast, campaign_id)
+
+
+async def list_campaigns(limit: int = 10) -> list[Broadcast]:
+    async with session_factory() as session:
+        result = await session.execute(select(Broadcast).order_by(Broadcast.id.desc()).limit(limit))
+        return list(result.scalars().all())
+
+
+async def set_status(campaign_id: int, status: str) -> Optional[Broadcast]:
+    async with session_factory() as session:
+        campaign = await session.get(Broadcast, campaign_id)
+        if not campaign:
+            return None
+        campaign.status = status
+        campaign.updated_at = datetime.utcnow()
+        if status == "running":
+            # Whoever resumes a campaign owns it after a restart.
+            campaign.worker_id = _settings.worker_id
+        if status in {"completed", "cancelled"}:
+            campaign.finished_at = datetime.utcnow()
+        return campaign
+
+
+async def set_report_message(campaign_id: int, chat_id: int, message_id: int) -> None:
+    async with session_factory() as session:
+        campaign = await session.get(Broadcast, campaign_id)
+        if campaign:
+            campaign.report_chat_id = chat_id
+            campaign.report_message_id = message_id
+
+
+def runs_elsewhere(campaign: Broadcast) -> bool:
+    """Whether another supervisor worker is sending this campaign."""
+    return campaign.status == "running" and campaign.worker_id != _settings.worker_id
+
+
+def _owned(stored: Optional[Broadcast]) -> bool:
+    return stored is not None and stored.status == "running" and stored.worker_id == _settings.worker_id
+
+
+async def _save_progress(campaign: Broadcast) -> bool:
+    """Persist the cursor and counters; ``False`` once the campaign is no longer ours to run.
+
+    Under the supervisor ``/broadcast_stop`` and ``/broadcast_resume`` may be
+    handled by another worker, which only changes the stored status or owner.
+    A paused campaign still records the page just sent; one taken over by
+    another worker is left to its new owner.
+    """
+    async with session_factory() as session:
+        stored = await session.get(Broadcast, campaign.id)
+        if stored is None or stored.worker_id != _settings.worker_id:
+            return False
+        stored.cursor_user_id = campaign.cursor_user_id
+        stored.sent = campaign.sent
+        stored.failed = campaign.failed
+        stored.blocked = campaign.blocked
+        stored.updated_at = datetime.utcnow()
+        return stored.status == "running"
+
+
+async def _complete(campaign_id: int) -> bool:
+    """Mark the campaign completed unless it was paused or taken over meanwhile."""
+    async with session_factory() as session:
+        stored = await session.get(Broadcast, campaign_id)
+        if not _owned(stored):
+            return False
+        stored.status = "completed"
+        stored.updated_at = stored.finished_at = datetime.utcnow()
+        return True
+
+
+def format_progress(campaign: Broadcast) -> str:
+    titles = {
+        "running": "идёт",
+        "paused": "на паузе",
+        "completed": "завершена",
+        "cancelled": "отменена",
+    }
+    return (
+        f"📣 Рассылка #{campaign.id} — {titles.get(campaign.status, campaign.status)}\n"
+        f"Обработано: {campaign.processed} из ~{campaign.total}\n"
+        f"Успешно: {campaign.sent}, ошибок: {campaign.failed}, заблокировали бота: {campaign.blocked}"
+    )
+
+
+class BroadcastService:
+    """Runs broadcast campaigns as background tasks.
+
+    Recipients are streamed from the DB by ``User.id`` keyset pages; after
+    every page the cursor and counters are persisted, so an interrupted
+    campaign resumes from the last finished page.
+    """
+
+    def __init__(self, rate: float | None = None, concurrency: int | None = None) -> None:
+        rate = rate or _settings.broadcast_rate
+        self._bucket = TokenBucket(Limit(rate=rate, burst=rate))
+        self._concurrency = concurrency or _settings.broadcast_concurrency
+        self._tasks: dict[int, asyncio.Task[None]] = {}
+
+    def is_running(self, campaign_id: int) -> bool:
+        task = self._tasks.get(campaign_id)
+        return bool(task and not task.done())
+
+    def start(self, bot: Bot, campaign_id: int) -> bool:
+        if self.is_running(campaign_id):
+            return False
+        task = asyncio.create_task(self._run(bot, campaign_id), name=f"broadcast-{campaign_id}")
+        self._tasks[campaign_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(campaign_id, None))
+        return True
+
+    async def pause(self, campaign_id: int) -> Optional[Broadcast]:
+        campaign = await set_status(campaign_id, "paused")
+        task = self._tasks.get(campaign_id)
+        if task:
+            task.cancel()
+        return campaign
+
+    async def shutdown(self) -> None:
+        """Stop running campaigns without pausing them, so the next process resumes them."""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def resume_unfinished(self, bot: Bot) -> None:
+        """Restart campaigns that were running when this worker stopped."""
+        async with session_factory() as session:
+            result = await session.execute(
+                select(Broadcast.id).where(Broadcast.status == "running", Broadcast.worker_id == _settings.worker_id)
+            )
+            campaign_ids = list(result.scalars().all())
+        for campaign_id in campaign_ids:
+            logger.info("Resuming broadcast #%s after restart", campaign_id)
+            self.start(bot, campaign_id)
+
+    async def _run(self, bot: Bot, campaign_id: int) -> None:
+        campaign = await get_campaign(campaign_id)
+        if not campaign:
+            return
+        if campaign.status == "paused":
+            campaign = await set_status(campaign_id, "running")
+        if campaign.status != "running":
+            return
+        if runs_elsewhere(campaign):
+            # Pausing and resuming moves it to this worker.
+            logger.info("Broadcast #%s is running on %s; not starting it here", campaign.id, campaign.worker_id)
+            return
+
+        logger.info("Broadcast #%s started from user id %s", campaign.id, campaign.cursor_user_id)
+        semaphore = asyncio.Semaphore(self._concurrency)
+        reported_at = 0.0
+
+        async def _guarded(chat_id: int) -> DeliveryOutcome:
+            async with semaphore:
+                return await self._deliver(bot, campaign, chat_id)
+
+        try:
+            with bulk_sends():
+                while True:
+                    batch = await user_service.list_recipient_batch(campaign.cursor_user_id, BATCH_SIZE)
+                    if not batch:
+                        break
+                    outcomes = await asyncio.gather(*(_guarded(telegram_id) for _, telegram_id in batch))
+
+                    blocked_ids = [
+                        telegram_id for (_, telegram_id), outcome in zip(batch, outcomes) if outcome == "blocked"
+                    ]
+                    campaign.sent += outcomes.count("sent")
+                    campaign.failed += outcomes.count("failed")
+                    campaign.blocked += len(blocked_ids)
+                    campaign.cursor_user_id = batch[-1][0]
+                    await user_service.mark_blocked(blocked_ids)
+                    if not await _save_progress(campaign):
+                        logger.info("Broadcast #%s was paused or moved to another worker; stopping", campaign.id)
+                        return
+
+                    if time.monotonic() - reported_at >= PROGRESS_INTERVAL:
+                        reported_at = time.monotonic()
+                        await self._report(bot, campaign)
+        except asyncio.CancelledError:
+            logger.info("Broadcast #%s interrupted at user id %s", campaign.id, campaign.cursor_user_id)
+            raise
+
+        if not await _complete(campaign.id):
+            logger.info("Broadcast #%s was paused or moved to another worker before completing", campaign.id)
+            return
+        campaign.status = "completed"
+        logger.info("Broadcast #%s completed: %s", campaign.id, campaign)
+        await self._report(bot, campaign)
+
+    async def _throttle(self) -> None:
+        while wait := self._bucket.consume():
+            await asyncio.sleep(wait)
+
+    async def _deliver(self, bot: Bot, campaign: Broadcast, chat_id: int) -> DeliveryOutcome:
+        for attempt in range(1, SEND_ATTEMPTS + 1):
+            await self._throttle()
+            try:
+                if campaign.message_id and campaign.from_chat_id:
+                    await bot.copy_message(chat_id, campaign.from_chat_id, campaign.message_id)
+                else:
+                    await bot.send_message(chat_id, campaign.text or "")
+                return "sent"
+            except TelegramRetryAfter as exc:
+                # The outbound scheduler already paused all sends and retried; it gave up on this chat.
+                logger.warning(
+                    "Broadcast #%s to %s still flood-limited after retries (%ss)", campaign.id, chat_id, exc.retry_after
+                )
+                return "failed"
+            except TelegramForbiddenError:
+                return "blocked"
+            except TelegramBadRequest as exc:
+                if "chat not found" in exc.message.lower():
+                    return "blocked"
+                logger.warning("Broadcast #%s to %s rejected: %s", campaign.id, chat_id, exc.message)
+                return "failed"
+            except (TelegramNetworkError, TelegramServerError) as exc:
+                logger.warning("Broadcast #%s to %s failed (attempt %s): %s", campaign.id, chat_id, attempt, exc)
+                await asyncio.sleep(NETWORK_BACKOFF * attempt)
+        return "failed"
+
+    async def _report(self, bot: Bot, campaign: Broadcast) -> None:
+        if not campaign.report_chat_id or not campaign.report_message_id:
+            return
+        try:
+            await bot.edit_message_text(
+                format_progress(campaign),
+                chat_id=campaign.report_chat_id,
+                message_id=campaign.report_message_id,
+            )
+        except TelegramBadRequest:
+            # "message is not modified" and deleted report messages are harmless.
+            pass
+        except Exception:  # pragma: no cover - progress reporting is best effort
+            logger.exception("Failed to update broadcast #%s progress", campaign.id)
+
+
+_service: BroadcastService | None = None
+
+
+def get_broadcast_service() -> BroadcastService:
+    global _service
+    if _service is None:
+        _service = BroadcastService()
+    return _service
@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+import logging
+from pathlib import Path
+from typing import Any
+
+from aiogram import Bot
+from aiogram.types import BufferedInputFile, FSInputFile, Message
+
+from ..utils import ffmpeg, imaging
+from .memory import hold
+from ..utils.storage import delete_upload, write_upload_bytes
+
+logger = logging.getLogger(__name__)
+
+
+async def send_result_photo(bot: Bot, chat_id: int, user_id: int, result_path: Path, **kwargs: Any) -> Message:
+    """Send a fitting result as a Telegram-sized photo, or as a file if it cannot be decoded."""
+    # Telegram re-compresses photos anyway, so send a right-sized JPEG and keep
+    # the provider original for the video fly-by and the "📎 Оригинал" button.
+    try:
+        preview = await imaging.telegram_photo(result_path)
+    except (OSError, ValueError) as exc:
+        # The job is already completed and paid for: deliver the bytes the provider sent.
+        logger.warning("Cannot decode result %s for a photo preview (%s); sending it as a file", result_path, exc)
+        await delete_upload(user_id, "preview")
+        extension = await imaging.file_extension(result_path)
+        document = FSInputFile(result_path, filename=f"hype_tuning_result.{extension}")
+        return await bot.send_document(chat_id, document, **kwargs)
+    if preview is not None:
+        with hold("preview", preview):
+            photo_path = await write_upload_bytes(user_id, "preview", preview)
+        del preview
+    else:
+        photo_path = result_path
+        await delete_upload(user_id, "preview")
+    return await bot.send_photo(chat_id, FSInputFile(photo_path, filename="hype_tuning_result.jpg"), **kwargs)
+
+
+async def send_flyby(bot: Bot, chat_id: int, video_path: Path, **kwargs: Any) -> Message:
+    """Send a fly-by video as streamable, with probed metadata and a thumbnail."""
+    info = await ffmpeg.describe(video_path)
+    return await bot.send_video(
+        chat_id,
+        FSInputFile(video_path, filename="hype_tuning_flyby.mp4"),
+        caption="Видео-пролёт готов! 🎬",
+        width=info.width,
+        height=info.height,
+        duration=info.duration,
+        thumbnail=BufferedInputFile(info.thumbnail, filename="flyby_thumb.jpg") if info.thumbnail else None,
+        supports_streaming=True,
+        **kwargs,
+    )
@@ -0,0 +1,134 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Iterator, Optional
+
+import aiohttp
+
+from bot.config import get_settings
+from .memory import hold
+from .tracing import span
+
+logger = logging.getLogger(__name__)
+_settings = get_settings()
+
+SUBMIT_TIMEOUT = 30
+POLL_TIMEOUT = 15
+CANCEL_TIMEOUT = 10
+POLL_INTERVAL_MIN = 0.5
+POLL_INTERVAL_MAX = 5.0
+# Cancellation message marking a deliberate abort (see ``JobRegistry.cancel``).
+# Any other cancellation, e.g. a shutdown, leaves the request running on fal
+# so the job journal can collect the result after the restart.
+USER_CANCEL = "cancelled by user"
+
+TicketListener = Callable[[dict[str, Any]], Awaitable[None]]
+_ticket_listener: ContextVar[Optional[TicketListener]] = ContextVar("fal_ticket_listener", default=None)
+
+
+@contextmanager
+def on_ticket(listener: TicketListener) -> Iterator[None]:
+    """Report every request submitted in this context (e.g. to the job journal)."""
+    token = _ticket_listener.set(listener)
+    try:
+        yield
+    finally:
+        _ticket_listener.reset(token)
+
+
+async def _poll_until_done(session: aiohttp.ClientSession, status_url: str, headers: dict[str, str]) -> None:
+    interval = POLL_INTERVAL_MIN
+    while True:
+        async with session.get(status_url, headers=headers, timeout=POLL_TIMEOUT) as response:
+            response.raise_for_status()
+            status = (await response.json()).get("status")
+        if status == "COMPLETED":
+            return
+        await asyncio.sleep(interval)
+        interval = min(interval * 1.5, POLL_INTERVAL_MAX)
+
+
+async def _fetch_result(
+    session: aiohttp.ClientSession,
+    ticket: dict[str, Any],
+    headers: dict[str, str],
+) -> dict[str, Any]:
+    with span("fal wait", **{"fal.request_id": ticket.get("request_id", "")}):
+        await _poll_until_done(session, ticket["status_url"], headers)
+    with span("fal result"):
+        async with session.get(ticket["response_url"], headers=headers, timeout=POLL_TIMEOUT) as response:
+            response.raise_for_status()
+            return await response.json()
+
+
+async def _cancel(session: aiohttp.ClientSession, ticket: dict[str, Any], headers: dict[str, str]) -> None:
+    try:
+        async with session.put(ticket["cancel_url"], headers=headers, timeout=CANCEL_TIMEOUT) as response:
+            # 400 means the request already finished; nothing left to stop.
+            logger.info("fal request %s cancel: HTTP %s", ticket.get("request_id"), response.status)
+    except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
+        logger.warning("Failed to cancel fal request %s: %s", ticket.get("request_id"), exc)
+
+
+def _inline_data(payload: dict[str, Any]) -> list[str]:
+    """Data URIs embedded in a request payload."""
+    values: list[Any] = []
+    for value in payload.values():
+        values.extend(value if isinstance(value, list) else [value])
+    return [value for value in values if isinstance(value, str) and value.startswith("data:")]
+
+
+async def run(
+    session: aiohttp.ClientSession,
+    model: str,
+    payload: dict[str, Any],
+    *,
+    api_key: str,
+    timeout: float,
+) -> dict[str, Any]:
+    """Run ``model`` through the fal queue API and return its output.
+
+    Unlike a blocking ``fal.run`` call, a queued request can be stopped: if
+    the user cancels the job or ``timeout`` expires, the request is cancelled
+    on fal's side too, so abandoned jobs stop occupying provider concurrency.
+    """
+    headers = {"Authorization": f"Key {api_key}", "Content-Type": "application/json"}
+    url = f"{_settings.fal_queue_url.rstrip('/')}/{model}"
+    # The caller keeps the payload, and its data URIs, until the result arrives.
+    with hold("data_uri", *_inline_data(payload)):
+        # Serialised straight to bytes: ``json=`` would keep a str and a bytes copy of the data URIs.
+        body = json.dumps(payload).encode()
+        with span("fal submit", **{"fal.model": model}), hold("request_body", body):
+            async with session.post(url, data=body, headers=headers, timeout=SUBMIT_TIMEOUT) as response:
+                response.raise_for_status()
+                ticket = await response.json()
+        del body
+
+        listener = _ticket_listener.get()
+        if listener is not None:
+            await listener(ticket)
+        return await resume(session, ticket, api_key=api_key, timeout=timeout)
+
+
+async def resume(
+    session: aiohttp.ClientSession,
+    ticket: dict[str, Any],
+    *,
+    api_key: str,
+    timeout: float,
+) -> dict[str, Any]:
+    """Wait for an already submitted request, e.g. one recovered after a restart."""
+    headers = {"Authorization": f"Key {api_key}"}
+    try:
+        return await asyncio.wait_for(_fetch_result(session, ticket, headers), timeout)
+    except asyncio.CancelledError as exc:
+        if USER_CANCEL in exc.args:
+            await _cancel(session, ticket, headers)
+        raise
+    except Exception:
+        await _cancel(session, ticket, headers)
+        raise
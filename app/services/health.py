@@ -0,0 +1,235 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from functools import partial
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, Optional
+
+from bot.config import get_settings
+from .lifecycle import Lifecycle
+from .metrics import Counter, Gauge, LabelValues
+
+logger = logging.getLogger(__name__)
+_settings = get_settings()
+
+PROBE_INTERVAL = 0.5
+# Reported lag decays so a single hiccup does not mark the worker unhealthy for long.
+LAG_DECAY = 0.8
+# Probe samples kept for percentiles: five minutes at the default interval.
+LAG_WINDOW = 600
+LAG_QUANTILES = (0.5, 0.9, 0.99)
+WATCHDOG_INTERVAL = 0.05
+STACK_DEPTH = 12
+_REPO_ROOT = Path(__file__).resolve().parents[2]
+
+
+@dataclass(slots=True)
+class BlockEvent:
+    """One period in which the event loop did not run callbacks."""
+
+    duration: float
+    site: str
+    stack: str
+
+
+def _blocking_site(frame: Any) -> str:
+    """Innermost frame of our own code, so library internals group by caller."""
+    site = None
+    while frame is not None:
+        path = Path(os.path.realpath(frame.f_code.co_filename))
+        if _REPO_ROOT in path.parents:
+            return f"{path.relative_to(_REPO_ROOT)}:{frame.f_lineno} {frame.f_code.co_name}"
+        site = site or f"{path.name}:{frame.f_lineno} {frame.f_code.co_name}"
+        frame = frame.f_back
+    return site or "unknown"
+
+
+class BlockingWatchdog(threading.Thread):
+    """Catches the event loop in the act of blocking.
+
+    A daemon thread pings the loop with ``call_soon_threadsafe``; when the
+    ping is not answered within ``threshold`` the loop thread is stuck in
+    one callback, so its stack at that moment shows the blocking code
+    (``open().read()``, base64 of a large photo, a logging handler write).
+    Unlike asyncio debug mode this costs one wake-up per interval.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, threshold: float) -> None:
+        super().__init__(name="loop-watchdog", daemon=True)
+        self.loop = loop
+        self.threshold = threshold
+        self.listeners: list[Callable[[BlockEvent], None]] = []
+        self._loop_thread = threading.get_ident()
+        self._stopped = threading.Event()
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    def run(self) -> None:
+        while not self._stopped.wait(WATCHDOG_INTERVAL):
+            answered = threading.Event()
+            sent = time.monotonic()
+            try:
+                self.loop.call_soon_threadsafe(answered.set)
+            except RuntimeError:  # loop closed
+                return
+            if answered.wait(self.threshold):
+                continue
+            frame = sys._current_frames().get(self._loop_thread)
+            site = _blocking_site(frame)
+            stack = "".join(traceback.format_stack(frame, limit=STACK_DEPTH)) if frame else ""
+            while not answered.wait(1.0):
+                if self._stopped.is_set():
+                    return
+            event = BlockEvent(duration=time.monotonic() - sent, site=site, stack=stack)
+            for listener in list(self.listeners):
+                listener(event)
+
+
+class LoopMonitor:
+    """Measures event-loop lag as the overshoot of a periodic sleep.
+
+    A loop busy with blocking work (synchronous disk or CPU-heavy code)
+    wakes the probe late; the overshoot is what every other coroutine waited.
+    With ``LOOP_BLOCK_THRESHOLD`` set, a :class:`BlockingWatchdog` also logs
+    where the loop was stuck.
+    """
+
+    def __init__(self, interval: float = PROBE_INTERVAL) -> None:
+        self.interval = interval
+        self.lag = 0.0
+        self.max_lag = 0.0
+        self.samples: deque[float] = deque(maxlen=LAG_WINDOW)
+        self.watchdog: Optional[BlockingWatchdog] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name="loop-monitor")
+        loop = asyncio.get_running_loop()
+        threshold = _settings.loop_block_threshold
+        if _settings.loop_debug and threshold:
+            # asyncio then logs every callback slower than the threshold by its handle.
+            loop.set_debug(True)
+            loop.slow_callback_duration = threshold
+        if threshold and self.watchdog is None:
+            self.watchdog = BlockingWatchdog(loop, threshold)
+            # Report from the loop thread; metrics and handlers are not thread-safe.
+            self.watchdog.listeners.append(partial(loop.call_soon_threadsafe, _report_block))
+            self.watchdog.start()
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+        if self.watchdog is not None:
+            self.watchdog.stop()
+            self.watchdog = None
+
+    def percentiles(self) -> dict[float, float]:
+        ordered = sorted(self.samples)
+        if not ordered:
+            return {}
+        return {q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] for q in LAG_QUANTILES}
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            overshoot = max(0.0, loop.time() - started - self.interval)
+            self.samples.append(overshoot)
+            self.lag = max(overshoot, self.lag * LAG_DECAY)
+            self.max_lag = max(self.max_lag, overshoot)
+
+
+def _report_block(event: BlockEvent) -> None:
+    LOOP_BLOCKS.inc(site=event.site)
+    logger.warning("Event loop blocked for %.3fs at %s\n%s", event.duration, event.site, event.stack.rstrip())
+
+
+@asynccontextmanager
+async def assert_no_blocking(threshold: float = 0.1) -> AsyncIterator[list[BlockEvent]]:
+    """Fail with ``AssertionError`` if the loop blocks longer than ``threshold`` inside the block.
+
+    Meant for benchmarks and load tests::
+
+        async with assert_no_blocking(0.05):
+            await run_scenario()
+    """
+    loop = asyncio.get_running_loop()
+    watchdog = BlockingWatchdog(loop, threshold)
+    events: list[BlockEvent] = []
+    watchdog.listeners.append(events.append)
+    watchdog.start()
+    try:
+        yield events
+    finally:
+        # Let a pending ping through so a block that just ended is still reported.
+        await asyncio.sleep(0)
+        watchdog.stop()
+        await loop.run_in_executor(None, watchdog.join)
+    if events:
+        worst = max(events, key=lambda event: event.duration)
+        raise AssertionError(
+            f"Event loop blocked {len(events)} time(s) over {threshold}s; "
+            f"worst {worst.duration:.3f}s at {worst.site}\n{worst.stack}"
+        )
+
+
+_monitor: Optional[LoopMonitor] = None
+_started_at = time.time()
+
+
+def get_loop_monitor() -> LoopMonitor:
+    global _monitor
+    if _monitor is None:
+        _monitor = LoopMonitor()
+    return _monitor
+
+
+def _collect_lag() -> dict[LabelValues, float]:
+    monitor = get_loop_monitor()
+    values = {(str(q),): lag for q, lag in monitor.percentiles().items()}
+    values[("max",)] = monitor.max_lag
+    return values
+
+
+LOOP_LAG = Gauge(
+    "bot_loop_lag_seconds",
+    "Event loop scheduling lag over the last five minutes.",
+    ["quantile"],
+    collect=_collect_lag,
+)
+LOOP_BLOCKS = Counter("bot_loop_blocked_total", "Callbacks that blocked the event loop, by code site.", ["site"])
+
+
+def snapshot(lifecycle: Lifecycle) -> dict[str, Any]:
+    """Health report served on ``/health`` and aggregated by the supervisor."""
+    monitor = get_loop_monitor()
+    last_update_at = lifecycle.inflight.last_update_at
+    if lifecycle.draining:
+        status = "draining"
+    elif monitor.lag > _settings.health_max_lag:
+        status = "lagging"
+    else:
+        status = "ok"
+    return {
+        "status": status,
+        "pid": os.getpid(),
+        "worker_id": _settings.worker_id,
+        "uptime": round(time.time() - _started_at, 1),
+        "loop_lag": round(monitor.lag, 3),
+        "max_loop_lag": round(monitor.max_lag, 3),
+        "loop_lag_p99": round(monitor.percentiles().get(0.99, 0.0), 3),
+        "last_update_at": last_update_at,
+        "in_flight": len(lifecycle.inflight),
+    }
@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Awaitable, TypeVar
+
+from .fal_queue import USER_CANCEL
+
+logger = logging.getLogger(__name__)
+
+_T = TypeVar("_T")
+
+
+class JobCancelled(Exception):
+    """Raised to the job owner when the user cancelled the job."""
+
+
+class JobRegistry:
+    """Per-user registry of running provider jobs that can be cancelled.
+
+    The expensive part of a handler (the provider call and result download)
+    runs in its own task. Cancelling that task aborts the in-flight HTTP
+    request and cancels queued fal requests, while the handler itself keeps
+    running and can refund credits.
+    """
+
+    def __init__(self) -> None:
+        self._jobs: dict[int, dict[str, asyncio.Task]] = {}
+
+    async def run(self, user_id: int, action: str, job: Awaitable[_T]) -> _T:
+        task = asyncio.ensure_future(job)
+        self._jobs.setdefault(user_id, {})[action] = task
+        try:
+            return await task
+        except asyncio.CancelledError:
+            current = asyncio.current_task()
+            if task.cancelled() and not (current and current.cancelling()):
+                raise JobCancelled(action) from None
+            task.cancel()
+            raise
+        finally:
+            user_jobs = self._jobs.get(user_id, {})
+            if user_jobs.get(action) is task:
+                del user_jobs[action]
+            if not user_jobs:
+                self._jobs.pop(user_id, None)
+
+    def active(self, user_id: int) -> list[str]:
+        return list(self._jobs.get(user_id, {}))
+
+    def cancel(self, user_id: int) -> list[str]:
+        """Cancel every running job of the user; return the cancelled actions."""
+        cancelled = []
+        for action, task in list(self._jobs.get(user_id, {}).items()):
+            if task.cancel(USER_CANCEL):
+                cancelled.append(action)
+        if cancelled:
+            logger.info("Cancelled %s for user %s", ", ".join(cancelled), user_id)
+        return cancelled
+
+
+_registry: JobRegistry | None = None
+
+
+def get_job_registry() -> JobRegistry:
+    global _registry
+    if _registry is None:
+        _registry = JobRegistry()
+    return _registry
@@ -0,0 +1,212 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+from datetime import datetime, timedelta
+from functools import partial
+from pathlib import Path
+from typing import Any, Literal, Optional
+
+import aiohttp
+from aiogram import Bot
+from sqlalchemy import select
+
+from bot.config import get_settings
+from ..database import session_factory
+from ..keyboards.common import post_result_keyboard
+from ..models.job import Job
+from ..models.user import User
+from ..utils import storage
+from . import delivery, fal_queue, memory, video_cache_service
+from .ai_service import GENERATION_REQUEST_TIMEOUT, collect_fal_image
+from .lifecycle import is_primary_worker, is_retired_worker
+from .tracing import start_trace
+from .video_service import get_video_service
+
+logger = logging.getLogger(__name__)
+_settings = get_settings()
+
+JobKind = Literal["image", "video"]
+
+UNFINISHED_STATUSES = ("pending", "submitted", "completed")
+FINAL_STATUSES = {"delivered", "failed", "cancelled"}
+# fal keeps results for a limited time; older journal entries are refunded.
+RECOVERY_MAX_AGE = timedelta(hours=6)
+RECOVERY_TIMEOUT = {"image": GENERATION_REQUEST_TIMEOUT, "video": 600}
+RESULT_SLOT: dict[str, storage.UploadKind] = {"image": "result", "video": "video"}
+
+_recovery_tasks: set[asyncio.Task] = set()
+
+
+async def create_job(
+    *,
+    user_id: int,
+    chat_id: int,
+    kind: JobKind,
+    credits: int,
+    inputs: Optional[dict[str, Any]] = None,
+) -> Job:
+    async with session_factory() as session:
+        job = Job(
+            user_id=user_id,
+            chat_id=chat_id,
+            kind=kind,
+            credits=credits,
+            worker_id=_settings.worker_id,
+            inputs_json=json.dumps(inputs or {}),
+        )
+        session.add(job)
+        await session.flush()
+    memory.start_job(job.id, kind)
+    return job
+
+
+async def record_ticket(job_id: int, ticket: dict[str, Any]) -> None:
+    """Store the provider request so the result can be collected after a restart."""
+    async with session_factory() as session:
+        job = await session.get(Job, job_id)
+        if job:
+            job.status = "submitted"
+            job.provider_request_id = ticket.get("request_id")
+            job.provider_ticket = json.dumps(ticket)
+            job.updated_at = datetime.utcnow()
+
+
+async def set_status(job_id: int, status: str, *, result_digest: Optional[str] = None) -> None:
+    async with session_factory() as session:
+        job = await session.get(Job, job_id)
+        if not job:
+            return
+        job.status = status
+        job.result_digest = result_digest or job.result_digest
+        job.updated_at = datetime.utcnow()
+        if status in FINAL_STATUSES:
+            job.finished_at = datetime.utcnow()
+    if status in FINAL_STATUSES:
+        memory.finish_job(job_id)
+
+
+async def refund(job_id: int, *, status: str = "failed", error: Optional[str] = None) -> int:
+    """Close the job and return its credits in one transaction; return the refund."""
+    memory.finish_job(job_id)
+    async with session_factory() as session:
+        job = await session.get(Job, job_id)
+        if not job or job.status in FINAL_STATUSES:
+            return 0
+        job.status = status
+        job.error = error
+        job.updated_at = job.finished_at = datetime.utcnow()
+        if not job.credits:
+            return 0
+        result = await session.execute(select(User).where(User.telegram_id == job.user_id))
+        user = result.scalar_one_or_none()
+        if user:
+            user.balance += job.credits
+        return job.credits
+
+
+async def list_unfinished() -> list[Job]:
+    """Unfinished jobs of this worker; the primary one also takes those of removed worker slots."""
+    owners = {_settings.worker_id}
+    async with session_factory() as session:
+        if is_primary_worker():
+            result = await session.execute(
+                select(Job.worker_id).where(Job.status.in_(UNFINISHED_STATUSES)).distinct()
+            )
+            # Slots beyond WORKERS are gone after the worker count was lowered.
+            owners.update(
+                worker_id
+                for worker_id in result.scalars()
+                if is_retired_worker(worker_id, _settings.worker_id, _settings.workers)
+            )
+        result = await session.execute(
+            select(Job).where(Job.worker_id.in_(owners), Job.status.in_(UNFINISHED_STATUSES)).order_by(Job.id)
+        )
+        return list(result.scalars().all())
+
+
+async def recover_unfinished(bot: Bot) -> None:
+    """Finish jobs interrupted by a restart: collect, re-deliver or refund."""
+    for job in await list_unfinished():
+        logger.info("Recovering %s", job)
+        task = asyncio.create_task(_recover(bot, job), name=f"job-recovery-{job.id}")
+        _recovery_tasks.add(task)
+        task.add_done_callback(_recovery_tasks.discard)
+
+
+async def _recover(bot: Bot, job: Job) -> None:
+    attributes = {"job.id": job.id, "job.kind": job.kind, "user.id": job.user_id}
+    with start_trace("job recovery", **attributes):
+        memory.start_job(job.id, job.kind)
+        age = datetime.utcnow() - job.created_at.replace(tzinfo=None)
+        try:
+            if job.status == "completed" and job.result_digest:
+                path = await storage.blob_path(job.result_digest)
+            elif job.status == "submitted" and age < RECOVERY_MAX_AGE:
+                path = await _collect(job)
+            else:
+                path = None
+            if path is None:
+                await _refund_interrupted(bot, job)
+                return
+            await _redeliver(bot, job, path)
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            logger.exception("Failed to recover %s", job)
+            await _refund_interrupted(bot, job, error=str(exc))
+
+
+async def _collect(job: Job) -> Optional[Path]:
+    ticket = json.loads(job.provider_ticket or "{}")
+    if not ticket.get("response_url"):
+        return None
+    sink = partial(storage.write_upload_stream, job.user_id, RESULT_SLOT[job.kind])
+    async with aiohttp.ClientSession() as session:
+        data = await fal_queue.resume(
+            session, ticket, api_key=_settings.fal_api_key, timeout=RECOVERY_TIMEOUT[job.kind]
+        )
+        if job.kind == "video":
+            path = await get_video_service().collect(session, data, sink)
+        else:
+            path = await collect_fal_image(session, data, sink)
+    digest = await storage.upload_digest(job.user_id, RESULT_SLOT[job.kind])
+    await set_status(job.id, "completed", result_digest=digest)
+    return path
+
+
+async def _redeliver(bot: Bot, job: Job, path: Path) -> None:
+    if job.kind == "video":
+        sent = await delivery.send_flyby(bot, job.chat_id, path, reply_markup=post_result_keyboard())
+        inputs = json.loads(job.inputs_json or "{}")
+        if inputs.get("cache_key"):
+            await video_cache_service.remember(
+                inputs["cache_key"],
+                video_digest=await storage.upload_digest(job.user_id, "video"),
+                telegram_file_id=sent.video.file_id if sent.video else None,
+            )
+    else:
+        await storage.delete_upload(job.user_id, "video")
+        await delivery.send_result_photo(
+            bot,
+            job.chat_id,
+            job.user_id,
+            path,
+            caption="Бот перезапускался, но твой результат сохранён ✅",
+            reply_markup=post_result_keyboard(),
+        )
+    await set_status(job.id, "delivered")
+    logger.info("Re-delivered %s after restart", job)
+
+
+async def _refund_interrupted(bot: Bot, job: Job, error: Optional[str] = None) -> None:
+    refunded = await refund(job.id, error=error or "interrupted by restart")
+    what = "генерацию" if job.kind == "image" else "видео-пролёт"
+    text = f"⚠️ Бот перезапускался и не смог завершить {what}."
+    if refunded:
+        text += f" Списанные генерации ({refunded}) вернул — запусти ещё раз."
+    try:
+        await bot.send_message(job.chat_id, text, reply_markup=post_result_keyboard())
+    except Exception:  # pragma: no cover - notification is best effort
+        logger.warning("Failed to notify user %s about interrupted %s", job.user_id, job, exc_info=True)
@@ -0,0 +1,224 @@
+from __future__ import annotations
+
+import asyncio
+import fcntl
+import logging
+import os
+import signal
+from contextlib import suppress
+from pathlib import Path
+from typing import Optional
+
+from aiogram import Bot, Dispatcher
+
+from ..middlewares.inflight import InFlightMiddleware
+from .metrics import register_queue
+
+logger = logging.getLogger(__name__)
+
+# Held by the process that polls Telegram; a second poller waits for it.
+POLLING_LOCK_FILE = Path(__file__).resolve().parents[2] / "bot.lock"
+# Set by ``manage_bot.py reload`` and the supervisor: PID of the process being replaced.
+HANDOFF_ENV = "BOT_HANDOFF_PID"
+# Set by the supervisor (``bot.supervisor``) for each worker it runs.
+WORKER_PORT_ENV = "BOT_WORKER_PORT"
+WORKER_SLOT_ENV = "BOT_WORKER_SLOT"
+# Cancellation message for work still running at the drain deadline. Unlike a
+# user cancel it leaves fal requests running for the job journal to collect.
+SHUTDOWN_CANCEL = "bot shutdown"
+
+LOCK_POLL_INTERVAL = 0.2
+EXIT_POLL_INTERVAL = 0.5
+CANCEL_TIMEOUT = 5.0
+
+
+def handoff_pid() -> Optional[int]:
+    value = os.environ.pop(HANDOFF_ENV, "")
+    return int(value) if value.isdigit() and int(value) != os.getpid() else None
+
+
+def worker_port() -> Optional[int]:
+    """Local port of this supervisor worker, or ``None`` when polling alone."""
+    value = os.environ.get(WORKER_PORT_ENV, "")
+    return int(value) if value.isdigit() else None
+
+
+def is_primary_worker() -> bool:
+    """Whether this process runs the bot-wide background jobs."""
+    return os.environ.get(WORKER_SLOT_ENV, "0") == "0"
+
+
+def slot_worker_id(base: str, slot: int) -> str:
+    # Slot 0 keeps the plain id so jobs journaled by a single process are recovered.
+    return base if slot == 0 else f"{base}-{slot}"
+
+
+def is_retired_worker(worker_id: str, base: str, workers: int) -> bool:
+    """Whether ``worker_id`` is a supervisor slot of ``base`` beyond the current ``workers``."""
+    prefix, _, slot = worker_id.rpartition("-")
+    return prefix == base and slot.isdigit() and int(slot) >= workers
+
+
+def _is_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class Lifecycle:
+    """Graceful shutdown and hand-off of Telegram polling between processes.
+
+    The first SIGTERM/SIGINT stops polling and marks the process as draining:
+    new paid jobs are refused, updates that are already being handled get up
+    to ``SHUTDOWN_GRACE`` seconds to finish, and only then the process exits.
+    A second signal cancels the remaining work right away. Work cancelled at
+    the deadline is left to the job journal of the next process.
+    """
+
+    def __init__(self) -> None:
+        self.inflight = InFlightMiddleware()
+        self.draining = False
+        self._stop = asyncio.Event()
+        self._force = asyncio.Event()
+        self._lock_fd: Optional[int] = None
+        register_queue("updates_in_flight", lambda: len(self.inflight))
+
+    def install_signal_handlers(self) -> None:
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            with suppress(NotImplementedError):
+                loop.add_signal_handler(sig, self._on_signal, sig)
+
+    def _on_signal(self, sig: signal.Signals) -> None:
+        if self.draining:
+            logger.warning("Received %s again; cancelling in-flight work", sig.name)
+            self._force.set()
+            return
+        logger.info("Received %s; draining", sig.name)
+        self.request_stop()
+
+    def request_stop(self) -> None:
+        self.draining = True
+        self._stop.set()
+
+    async def take_over(self, predecessor: Optional[int] = None, *, polling: bool = True) -> bool:
+        """Ask ``predecessor`` to drain and take the polling lock from it.
+
+        Supervisor workers pass ``polling=False`` and only signal the
+        predecessor. Returns ``False`` when a stop was requested before the
+        lock was free.
+        """
+        if predecessor is not None:
+            logger.info("Taking over from bot process %s", predecessor)
+            with suppress(ProcessLookupError):
+                os.kill(predecessor, signal.SIGTERM)
+        if not polling:
+            return not self.draining
+
+        fd = os.open(POLLING_LOCK_FILE, os.O_RDWR | os.O_CREAT, 0o644)
+        waiting = False
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                if self.draining:
+                    os.close(fd)
+                    return False
+                if not waiting:
+                    logger.warning("Another bot process is polling; waiting for it to stop")
+                    waiting = True
+                await asyncio.sleep(LOCK_POLL_INTERVAL)
+        os.ftruncate(fd, 0)
+        os.write(fd, f"{os.getpid()}\n".encode())
+        self._lock_fd = fd
+        return True
+
+    def release_polling(self) -> None:
+        if self._lock_fd is None:
+            return
+        fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+        os.close(self._lock_fd)
+        self._lock_fd = None
+
+    async def poll(self, dp: Dispatcher, bot: Bot) -> None:
+        """Run polling until a stop is requested."""
+
+        async def _stop_on_request() -> None:
+            await self._stop.wait()
+            with suppress(RuntimeError):
+                await dp.stop_polling()
+
+        watcher = asyncio.create_task(_stop_on_request(), name="polling-stop")
+        try:
+            await dp.start_polling(bot, handle_signals=False, close_bot_session=False)
+        finally:
+            watcher.cancel()
+            self.request_stop()
+
+    async def wait_for_stop(self) -> None:
+        await self._stop.wait()
+
+    async def confirm_updates(self, bot: Bot) -> None:
+        """Acknowledge received updates so the next poller does not get them again."""
+        if self.inflight.last_update_id is None:
+            return
+        # Let handler tasks of the last batch start and record their ids.
+        await asyncio.sleep(0)
+        try:
+            await bot.get_updates(offset=self.inflight.last_update_id + 1, limit=1, timeout=0)
+        except Exception as exc:
+            logger.warning("Failed to confirm updates before hand-off: %s", exc)
+
+    async def drain(self, timeout: float) -> None:
+        """Wait up to ``timeout`` for in-flight updates, then cancel the rest."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        if self.inflight.tasks:
+            logger.info("Waiting up to %ss for %s in-flight updates", timeout, len(self.inflight))
+        force = asyncio.create_task(self._force.wait())
+        try:
+            while self.inflight.tasks and not self._force.is_set():
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                await asyncio.wait(
+                    {*self.inflight.tasks, force},
+                    timeout=remaining,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+        finally:
+            force.cancel()
+
+        pending = set(self.inflight.tasks)
+        if not pending:
+            return
+        logger.warning("Cancelling %s updates still in flight; their jobs resume after restart", len(pending))
+        for task in pending:
+            task.cancel(SHUTDOWN_CANCEL)
+        await asyncio.wait(pending, timeout=CANCEL_TIMEOUT)
+
+    async def wait_for_exit(self, pid: int, timeout: float) -> None:
+        """Wait until the process we took over from has finished draining."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while _is_alive(pid):
+            if loop.time() >= deadline:
+                logger.warning("Bot process %s is still running after %ss; continuing", pid, timeout)
+                return
+            await asyncio.sleep(EXIT_POLL_INTERVAL)
+        logger.info("Bot process %s has exited", pid)
+
+
+_lifecycle: Optional[Lifecycle] = None
+
+
+def get_lifecycle() -> Lifecycle:
+    global _lifecycle
+    if _lifecycle is None:
+        _lifecycle = Lifecycle()
+    return _lifecycle
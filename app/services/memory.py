@@ -0,0 +1,215 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import resource
+import time
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Iterator, Optional, Union
+
+from .metrics import Gauge, Histogram, LabelValues
+
+RECENT_JOBS = 50
+TRACEMALLOC_FRAMES = 10
+SIZE_BUCKETS = tuple(float(mb * 1024 * 1024) for mb in (1, 2, 5, 10, 20, 50, 100, 200, 500))
+
+Buffer = Union[bytes, bytearray, memoryview, str, int, None]
+
+
+@dataclass(slots=True)
+class JobMemory:
+    """Buffers a generation or fly-by holds while it runs."""
+
+    job_id: int
+    kind: str
+    started_at: float
+    rss_start: int
+    live: int = 0
+    peak: int = 0
+    buffers: int = 0
+    peak_buffers: int = 0
+    rss_end: int = 0
+    finished_at: float = 0.0
+
+
+_current_job: ContextVar[Optional[JobMemory]] = ContextVar("job_memory", default=None)
+_active_jobs: dict[int, JobMemory] = {}
+recent_jobs: deque[JobMemory] = deque(maxlen=RECENT_JOBS)
+_live_bytes: dict[str, int] = {}
+_live_count: dict[str, int] = {}
+
+
+def _size(buffer: Buffer) -> int:
+    if buffer is None:
+        return 0
+    if isinstance(buffer, int):
+        return buffer
+    if isinstance(buffer, memoryview):
+        return buffer.nbytes
+    return len(buffer)
+
+
+def rss_bytes() -> int:
+    """Current resident set size of the process."""
+    try:
+        with open("/proc/self/statm", "rb") as stream:
+            return int(stream.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def max_rss_bytes() -> int:
+    # ru_maxrss is in kilobytes on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def start_job(job_id: int, kind: str) -> None:
+    """Attribute buffers held by the current task (and tasks it starts) to the job."""
+    job = JobMemory(job_id=job_id, kind=kind, started_at=time.time(), rss_start=rss_bytes())
+    _active_jobs[job_id] = job
+    _current_job.set(job)
+
+
+def finish_job(job_id: int) -> None:
+    job = _active_jobs.pop(job_id, None)
+    if job is None:
+        return
+    if _current_job.get() is job:
+        _current_job.set(None)
+    job.finished_at = time.time()
+    job.rss_end = rss_bytes()
+    JOB_PEAK_BYTES.observe(job.peak, kind=job.kind)
+    recent_jobs.append(job)
+
+
+@contextmanager
+def hold(kind: str, *buffers: Buffer) -> Iterator[None]:
+    """Account ``buffers`` as live ``kind`` memory (photo, data_uri, request_body…) for the block."""
+    size = sum(_size(buffer) for buffer in buffers)
+    count = sum(1 for buffer in buffers if _size(buffer))
+    if not count:
+        yield
+        return
+    job = _current_job.get()
+    _live_bytes[kind] = _live_bytes.get(kind, 0) + size
+    _live_count[kind] = _live_count.get(kind, 0) + count
+    if job is not None:
+        job.live += size
+        job.buffers += count
+        job.peak = max(job.peak, job.live)
+        job.peak_buffers = max(job.peak_buffers, job.buffers)
+    try:
+        yield
+    finally:
+        _live_bytes[kind] -= size
+        _live_count[kind] -= count
+        if job is not None:
+            job.live -= size
+            job.buffers -= count
+
+
+def live_buffers() -> dict[str, tuple[int, int]]:
+    """``kind -> (count, bytes)`` of buffers currently held."""
+    return {kind: (_live_count[kind], size) for kind, size in _live_bytes.items() if _live_count[kind]}
+
+
+def active_jobs() -> list[JobMemory]:
+    return list(_active_jobs.values())
+
+
+class HeapTracer:
+    """tracemalloc snapshots on demand, diffed against a baseline.
+
+    tracemalloc slows allocations noticeably, so it only runs between
+    :meth:`start` and :meth:`stop` (the ``/memory`` admin command).
+    """
+
+    def __init__(self) -> None:
+        self._baseline: Optional[tracemalloc.Snapshot] = None
+
+    @property
+    def running(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    async def start(self, frames: int = TRACEMALLOC_FRAMES) -> None:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        self._baseline = await self._snapshot()
+
+    def stop(self) -> None:
+        self._baseline = None
+        tracemalloc.stop()
+
+    async def diff(self, limit: int = 10, *, rebase: bool = False) -> list[str]:
+        """Allocation sites that grew most since the baseline (``rebase`` moves it to now)."""
+        if not tracemalloc.is_tracing() or self._baseline is None:
+            raise RuntimeError("tracemalloc is not running")
+        snapshot = await self._snapshot()
+        stats = snapshot.compare_to(self._baseline, "lineno")[:limit]
+        if rebase:
+            self._baseline = snapshot
+        return [str(stat) for stat in stats]
+
+    async def top(self, limit: int = 10) -> list[str]:
+        snapshot = await self._snapshot()
+        return [str(stat) for stat in snapshot.statistics("lineno")[:limit]]
+
+    @staticmethod
+    async def _snapshot() -> tracemalloc.Snapshot:
+        # Walking every traced block takes a while; keep it off the event loop.
+        snapshot = await asyncio.to_thread(tracemalloc.take_snapshot)
+        return snapshot.filter_traces(
+            (
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            )
+        )
+
+
+_heap_tracer: Optional[HeapTracer] = None
+
+
+def get_heap_tracer() -> HeapTracer:
+    global _heap_tracer
+    if _heap_tracer is None:
+        _heap_tracer = HeapTracer()
+    return _heap_tracer
+
+
+def _collect_process() -> dict[LabelValues, float]:
+    values: dict[LabelValues, float] = {("rss",): float(rss_bytes()), ("max_rss",): float(max_rss_bytes())}
+    if tracemalloc.is_tracing():
+        current, peak = tracemalloc.get_traced_memory()
+        values[("traced",)] = float(current)
+        values[("traced_peak",)] = float(peak)
+    return values
+
+
+PROCESS_MEMORY = Gauge(
+    "bot_process_memory_bytes",
+    "Process memory: rss, max_rss and, while tracemalloc runs, traced and traced_peak.",
+    ["kind"],
+    collect=_collect_process,
+)
+BUFFER_BYTES = Gauge(
+    "bot_buffer_bytes",
+    "Image and video buffers currently held, by kind.",
+    ["kind"],
+    collect=lambda: {(kind,): float(size) for kind, (_, size) in live_buffers().items()},
+)
+BUFFERS = Gauge(
+    "bot_buffers",
+    "Number of image and video buffers currently held, by kind.",
+    ["kind"],
+    collect=lambda: {(kind,): float(count) for kind, (count, _) in live_buffers().items()},
+)
+JOB_PEAK_BYTES = Histogram(
+    "bot_job_peak_buffer_bytes",
+    "Peak buffer memory held by one job.",
+    ["kind"],
+    buckets=SIZE_BUCKETS,
+)
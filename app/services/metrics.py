@@ -0,0 +1,191 @@
+from __future__ import annotations
+
+import bisect
+import math
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterable, Iterator, Optional
+
+LabelValues = tuple[str, ...]
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PROVIDER_BUCKETS = (0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 45.0, 60.0, 90.0, 120.0, 180.0, 300.0, 600.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str]) -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        REGISTRY.append(self)
+
+    def _key(self, labels: dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.labels):
+            raise ValueError(f"{self.name} expects labels {self.labels}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        header = f"# HELP {self.name} {self.documentation}\n# TYPE {self.name} {self.kind}\n"
+        return header + "".join(f"{line}\n" for line in self.samples())
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = ()) -> None:
+        super().__init__(name, documentation, labels)
+        self._values: dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self) -> Iterator[str]:
+        for key, value in sorted(self._values.items()):
+            yield f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"
+
+
+class Gauge(Metric):
+    """Gauge set directly or, with ``collect``, read from live state on every scrape."""
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Iterable[str] = (),
+        collect: Optional[Callable[[], dict[LabelValues, float]]] = None,
+    ) -> None:
+        super().__init__(name, documentation, labels)
+        self._values: dict[LabelValues, float] = {} if self.labels else {(): 0.0}
+        self._collect = collect
+
+    def set(self, value: float, **labels: str) -> None:
+        self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def samples(self) -> Iterator[str]:
+        values = dict(self._values)
+        if self._collect is not None:
+            values.update(self._collect())
+        for key, value in sorted(values.items()):
+            yield f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Iterable[str] = (),
+        buckets: Iterable[float] = LATENCY_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._counts: dict[LabelValues, list[int]] = {}
+        self._sums: dict[LabelValues, float] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        counts = self._counts.get(key)
+        if counts is None:
+            counts = self._counts[key] = [0] * (len(self.buckets) + 1)
+            self._sums[key] = 0.0
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        self._sums[key] += value
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        """Observe the duration of the block, including when it raises."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self) -> Iterator[str]:
+        for key in sorted(self._counts):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, math.inf), self._counts[key]):
+                cumulative += count
+                labels = _format_labels((*self.labels, "le"), (*key, _format_value(bound)))
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labels, key)
+            yield f"{self.name}_sum{labels} {_format_value(self._sums[key])}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+REGISTRY: list[Metric] = []
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    return "".join(metric.render() for metric in REGISTRY)
+
+
+HANDLER_SECONDS = Histogram("bot_handler_seconds", "Time spent in aiogram handlers.", ["handler"])
+HANDLER_ERRORS = Counter("bot_handler_errors_total", "Handlers that raised.", ["handler", "error"])
+
+PROVIDER_SECONDS = Histogram(
+    "bot_provider_seconds",
+    "AI provider latency by phase (encode, request, download, postprocess).",
+    ["provider", "phase"],
+    buckets=PROVIDER_BUCKETS,
+)
+PROVIDER_RETRIES = Counter("bot_provider_retries_total", "Provider calls retried after a timeout.", ["provider"])
+PROVIDER_TIMEOUTS = Counter("bot_provider_timeouts_total", "Provider calls that timed out.", ["provider"])
+
+TELEGRAM_SECONDS = Histogram("bot_telegram_request_seconds", "Telegram Bot API call latency.", ["method"])
+TELEGRAM_ERRORS = Counter("bot_telegram_errors_total", "Failed Telegram Bot API calls.", ["method", "error"])
+TELEGRAM_RETRIES = Counter("bot_telegram_retries_total", "Telegram sends retried after flood control.", ["method"])
+
+DB_SESSIONS = Gauge("bot_db_sessions", "Database sessions currently open.")
+DB_CONNECTIONS = Gauge("bot_db_connections_in_use", "Pooled database connections checked out.")
+DB_QUERY_SECONDS = Histogram("bot_db_query_seconds", "Database statement latency.", ["statement"])
+
+PAYMENTS = Counter("bot_payments_total", "Payment status changes.", ["provider", "status"])
+
+_queue_sources: dict[str, Callable[[], float]] = {}
+
+
+def _collect_queues() -> dict[LabelValues, float]:
+    return {(name,): float(source()) for name, source in _queue_sources.items()}
+
+
+QUEUE_DEPTH = Gauge("bot_queue_depth", "Jobs or messages waiting or running.", ["queue"], collect=_collect_queues)
+
+
+def register_queue(name: str, source: Callable[[], float]) -> None:
+    """Report ``source()`` as ``bot_queue_depth{queue=name}`` on every scrape."""
+    _queue_sources[name] = source
@@ -10,6 +10,7 @@ from sqlalchemy import select
 from ..database import session_factory
 from ..models.payment import Payment
 from ..models.user import User
+from .metrics import PAYMENTS
 
 
 async def record_payment(
@@ -33,6 +34,8 @@ async def record_payment(
         result = await session.execute(select(Payment).where(Payment.payment_id == payment_id))
         payment = result.scalar_one_or_none()
         if payment:
+            if payment.status != status:
+                PAYMENTS.inc(provider=provider, status=status)
             payment.status = status
             payment.amount = amount
             payment.credits = credits
@@ -59,6 +62,7 @@ async def record_payment(
         )
         session.add(payment)
         await session.flush()
+        PAYMENTS.inc(provider=provider, status=status)
         return payment
 
 
@@ -68,6 +72,8 @@ async def update_payment_status(payment_id: str, status: str) -> Optional[Paymen
         payment = result.scalar_one_or_none()
         if not payment:
             return None
+        if payment.status != status:
+            PAYMENTS.inc(provider=payment.provider, status=status)
         payment.status = status
         await session.flush()
         return payment
@@ -77,3 +83,11 @@ async def get_payment(payment_id: str) -> Optional[Payment]:
     async with session_factory() as session:
         result = await session.execute(select(Payment).where(Payment.payment_id == payment_id))
         return result.scalar_one_or_none()
+
+
+async def has_succeeded_payment(user_id: int) -> bool:
+    async with session_factory() as session:
+        result = await session.execute(
+            select(Payment.id).where(Payment.user_id == user_id, Payment.status == "succeeded").limit(1)
+        )
+        return result.first() is not None
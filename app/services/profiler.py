@@ -0,0 +1,178 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from types import FrameType
+from typing import Any, Optional
+
+SAMPLE_INTERVAL = 0.01
+# Task stacks are walked less often: a busy bot has hundreds of tasks.
+TASK_SAMPLE_EVERY = 10
+DEFAULT_DURATION = 60
+MAX_DURATION = 600
+# Distinct stacks kept; further new stacks are folded into one bucket.
+MAX_STACKS = 20_000
+OVERFLOW_STACK = "[too many distinct stacks]"
+# Innermost frames of threads waiting for work: an idle event loop in select(),
+# pool workers and watchdogs blocked on a queue, a lock or an Event.
+IDLE_LEAVES = {
+    ("select", "selectors.py"),
+    ("poll", "selectors.py"),
+    ("wait", "threading.py"),
+    ("get", "queue.py"),
+    ("_worker", "thread.py"),
+}
+
+
+def _label(frame: FrameType) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(";", ",")
+
+
+def _is_idle(label: str) -> bool:
+    name, _, location = label.partition(" (")
+    return (name, location.split(":", 1)[0]) in IDLE_LEAVES
+
+
+def _frame_stack(frame: Optional[FrameType]) -> list[str]:
+    labels = []
+    while frame is not None:
+        labels.append(_label(frame))
+        frame = frame.f_back
+    labels.reverse()
+    return labels
+
+
+def _await_stack(coro: Any) -> list[str]:
+    """Frames of a suspended task, from its coroutine down to the innermost ``await``."""
+    labels = []
+    while coro is not None:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None)
+        if frame is None:
+            break
+        labels.append(_label(frame))
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+    return labels
+
+
+@dataclass(slots=True)
+class Profile:
+    started_at: float
+    duration: float
+    samples: int
+    stacks: Counter
+
+    def collapsed(self) -> str:
+        """Brendan Gregg's folded format, accepted by flamegraph.pl and speedscope."""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def top(self, limit: int = 5) -> list[tuple[str, int]]:
+        """Innermost frames of running threads with the most samples, idle waits excluded."""
+        leaves: Counter = Counter()
+        for stack, count in self.stacks.items():
+            if stack.startswith("thread "):
+                leaf = stack.rsplit(";", 1)[-1]
+                if not _is_idle(leaf):
+                    leaves[leaf] += count
+        return leaves.most_common(limit)
+
+
+class SamplingProfiler:
+    """Statistical wall-clock profiler for the live process.
+
+    A daemon thread snapshots the stack of every thread each
+    ``SAMPLE_INTERVAL`` via ``sys._current_frames`` and, less often, the
+    ``await`` chain of every asyncio task, so coroutines waiting on I/O
+    show up as well as code on the CPU. Nothing is hooked into the
+    interpreter, so the overhead is the sampler thread alone (a few
+    percent of one core) and it is safe to run in production. Thread
+    stacks are rooted at ``thread <name>``, task stacks at ``task <name>``.
+    """
+
+    def __init__(self) -> None:
+        self.started_at: Optional[float] = None
+        self.duration = 0.0
+        self._stacks: Counter = Counter()
+        self._samples = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self, duration: float = DEFAULT_DURATION) -> None:
+        if self.running:
+            raise RuntimeError("Profiler is already running")
+        self._loop = asyncio.get_running_loop()
+        self._stacks = Counter()
+        self._samples = 0
+        self._stop.clear()
+        self.started_at = time.time()
+        self.duration = min(max(duration, 1.0), MAX_DURATION)
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> Profile:
+        if self._thread is None or self.started_at is None:
+            raise RuntimeError("Profiler is not running")
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        return Profile(
+            started_at=self.started_at,
+            duration=time.time() - self.started_at,
+            samples=self._samples,
+            stacks=self._stacks,
+        )
+
+    def _run(self) -> None:
+        own_id = threading.get_ident()
+        deadline = time.monotonic() + self.duration
+        while not self._stop.wait(SAMPLE_INTERVAL) and time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                name = names.get(thread_id, str(thread_id))
+                self._record([f"thread {name}", *_frame_stack(frame)])
+            if self._samples % TASK_SAMPLE_EVERY == 0:
+                self._sample_tasks()
+            self._samples += 1
+
+    def _sample_tasks(self) -> None:
+        if self._loop is None or self._loop.is_closed():
+            return
+        try:
+            tasks = asyncio.all_tasks(self._loop)
+        except RuntimeError:  # the task set changed while it was copied; skip this round
+            return
+        for task in tasks:
+            stack = _await_stack(task.get_coro())
+            if stack:
+                # "Task-812" and "job-recovery-5" group by their name without the counter.
+                name = re.sub(r"-\d+$", "", task.get_name())
+                self._record([f"task {name}", *stack], weight=TASK_SAMPLE_EVERY)
+
+    def _record(self, labels: list[str], weight: int = 1) -> None:
+        stack = ";".join(labels)
+        if stack not in self._stacks and len(self._stacks) >= MAX_STACKS:
+            stack = f"{labels[0]};{OVERFLOW_STACK}"
+        self._stacks[stack] += weight
+
+
+_profiler: Optional[SamplingProfiler] = None
+
+
+def get_profiler() -> SamplingProfiler:
+    global _profiler
+    if _profiler is None:
+        _profiler = SamplingProfiler()
+    return _profiler
@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+import asyncio
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Optional
+
+QUANTUM = 1.0
+
+
+@dataclass(eq=False)
+class Ticket:
+    user_id: int
+    priority: int
+    cost: float = 1.0
+    granted: asyncio.Future = field(default_factory=lambda: asyncio.get_running_loop().create_future())
+
+
+class FairQueue:
+    """Waiting jobs ordered by priority class, fair between users within a class.
+
+    Lower ``priority`` values are always served first. Inside a class users
+    take turns by deficit round-robin: every turn adds ``quantum`` to the
+    user's deficit and a job runs once the deficit covers its cost, so one
+    user queueing many jobs cannot starve the others.
+    """
+
+    def __init__(self, quantum: float = QUANTUM) -> None:
+        self.quantum = quantum
+        self._classes: dict[int, OrderedDict[int, deque[Ticket]]] = {}
+        self._deficit: dict[tuple[int, int], float] = {}
+
+    def __len__(self) -> int:
+        return sum(len(queue) for users in self._classes.values() for queue in users.values())
+
+    def push(self, ticket: Ticket) -> None:
+        users = self._classes.setdefault(ticket.priority, OrderedDict())
+        users.setdefault(ticket.user_id, deque()).append(ticket)
+
+    def pop(self) -> Optional[Ticket]:
+        for priority in sorted(self._classes):
+            users = self._classes[priority]
+            while users:
+                user_id, queue = next(iter(users.items()))
+                key = (priority, user_id)
+                deficit = self._deficit.get(key, 0.0)
+                if deficit < queue[0].cost:
+                    deficit += self.quantum
+                    self._deficit[key] = deficit
+                    if deficit < queue[0].cost:
+                        users.move_to_end(user_id)
+                        continue
+                ticket = queue.popleft()
+                self._deficit[key] = deficit - ticket.cost
+                if not queue:
+                    del users[user_id]
+                    self._deficit.pop(key, None)
+                elif self._deficit[key] < queue[0].cost:
+                    users.move_to_end(user_id)
+                return ticket
+        return None
+
+    def remove(self, ticket: Ticket) -> None:
+        users = self._classes.get(ticket.priority, {})
+        queue = users.get(ticket.user_id)
+        if queue is None or ticket not in queue:
+            return
+        queue.remove(ticket)
+        if not queue:
+            del users[ticket.user_id]
+            self._deficit.pop((ticket.priority, ticket.user_id), None)
+
+    def ahead_of_class(self, priority: int) -> int:
+        """Jobs that a new job of ``priority`` would have to wait behind at most."""
+        return sum(
+            len(queue)
+            for cls, users in self._classes.items()
+            if cls <= priority
+            for queue in users.values()
+        )
+
+    def position(self, ticket: Ticket) -> Optional[int]:
+        """1-based position of ``ticket`` assuming equal-cost round-robin turns."""
+        users = self._classes.get(ticket.priority, {})
+        own = users.get(ticket.user_id)
+        if own is None or ticket not in own:
+            return None
+        index = own.index(ticket)
+        ahead = sum(
+            len(queue)
+            for cls, others in self._classes.items()
+            if cls < ticket.priority
+            for queue in others.values()
+        )
+        order = list(users)
+        me = order.index(ticket.user_id)
+        for offset, user_id in enumerate(order):
+            if offset != me:
+                # Users before us in this round get one more turn than those after.
+                ahead += min(len(users[user_id]), index + 1 if offset < me else index)
+        return ahead + index + 1
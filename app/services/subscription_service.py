@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+import logging
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from aiogram import Bot
+from aiogram.enums import ChatMemberStatus
+from aiogram.exceptions import TelegramAPIError
+from aiogram.types import Chat
+
+from bot.config import get_settings
+
+logger = logging.getLogger(__name__)
+_settings = get_settings()
+
+CACHE_MAX_SIZE = 100_000
+_NOT_SUBSCRIBED = {ChatMemberStatus.LEFT, ChatMemberStatus.KICKED}
+
+
+class SubscriptionCache:
+    """Subscription status per user with separate TTLs for yes and no answers."""
+
+    def __init__(self, positive_ttl: float, negative_ttl: float, max_size: int = CACHE_MAX_SIZE) -> None:
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        self.max_size = max_size
+        self._entries: OrderedDict[int, tuple[bool, float]] = OrderedDict()
+
+    def get(self, user_id: int) -> Optional[bool]:
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        subscribed, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._entries[user_id]
+            return None
+        return subscribed
+
+    def set(self, user_id: int, subscribed: bool) -> None:
+        ttl = self.positive_ttl if subscribed else self.negative_ttl
+        self._entries[user_id] = (subscribed, time.monotonic() + ttl)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: int) -> None:
+        self._entries.pop(user_id, None)
+
+
+_cache = SubscriptionCache(
+    positive_ttl=_settings.subscription_cache_ttl,
+    negative_ttl=_settings.subscription_negative_ttl,
+)
+
+
+def is_subscribed_status(status: Optional[str]) -> bool:
+    return status not in _NOT_SUBSCRIBED
+
+
+def is_required_channel(chat: Chat) -> bool:
+    channel = _settings.required_channel
+    if not channel:
+        return False
+    if channel.lstrip("-").isdigit():
+        return chat.id == int(channel)
+    return (chat.username or "").lower() == channel.lstrip("@").lower()
+
+
+def remember(user_id: int, status: Optional[str]) -> None:
+    """Update the cache from a ``chat_member`` update of the required channel."""
+    _cache.set(user_id, is_subscribed_status(status))
+
+
+def forget_refusal(user_id: int) -> None:
+    """Drop a cached "not subscribed" answer so the next check asks Telegram."""
+    if _cache.get(user_id) is False:
+        _cache.invalidate(user_id)
+
+
+async def has_required_subscription(bot: Bot, user_id: int) -> bool:
+    if not _settings.required_channel:
+        return True
+
+    cached = _cache.get(user_id)
+    if cached is not None:
+        return cached
+
+    try:
+        member = await bot.get_chat_member(_settings.required_channel, user_id)
+    except TelegramAPIError as err:
+        logger.warning("Failed to check subscription for %s: %s", user_id, err)
+        return False
+
+    subscribed = is_subscribed_status(getattr(member, "status", None))
+    _cache.set(user_id, subscribed)
+    return subscribed
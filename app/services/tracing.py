@@ -0,0 +1,246 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Iterator, Optional
+
+from bot.config import get_settings
+
+logger = logging.getLogger(__name__)
+_settings = get_settings()
+
+SERVICE_NAME = "tgbot"
+# Spans beyond this are dropped so a runaway loop cannot grow a trace without bound.
+MAX_SPANS_PER_TRACE = 500
+RECENT_TRACES = 200
+
+_current_span: ContextVar[Optional["Span"]] = ContextVar("trace_span", default=None)
+# One writer thread keeps exported lines in order and off the event loop.
+_export_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="trace-export")
+
+
+@dataclass(slots=True)
+class Span:
+    trace: "Trace"
+    span_id: str
+    parent_id: Optional[str]
+    name: str
+    start_ns: int
+    attributes: dict[str, Any]
+    end_ns: int = 0
+    error: Optional[str] = None
+
+    @property
+    def duration(self) -> float:
+        # Spans of background tasks may still run after their trace was closed.
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e9
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    def to_otlp(self) -> dict[str, Any]:
+        data: dict[str, Any] = {
+            "traceId": self.trace.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [_otlp_attribute(key, value) for key, value in self.attributes.items()],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1},
+        }
+        if self.parent_id:
+            data["parentSpanId"] = self.parent_id
+        return data
+
+
+@dataclass(slots=True)
+class Trace:
+    trace_id: str
+    sampled: bool
+    spans: list[Span] = field(default_factory=list)
+    dropped: int = 0
+
+    @property
+    def root(self) -> Span:
+        return self.spans[0]
+
+    def add(self, span: Span) -> None:
+        if len(self.spans) >= MAX_SPANS_PER_TRACE:
+            self.dropped += 1
+            return
+        self.spans.append(span)
+
+
+def _otlp_attribute(key: str, value: Any) -> dict[str, Any]:
+    if isinstance(value, bool):
+        typed = {"boolValue": value}
+    elif isinstance(value, int):
+        typed = {"intValue": str(value)}
+    elif isinstance(value, float):
+        typed = {"doubleValue": value}
+    else:
+        typed = {"stringValue": str(value)}
+    return {"key": key, "value": typed}
+
+
+def _new_id(length: int) -> str:
+    return os.urandom(length).hex()
+
+
+def _resolve_path(value: str) -> Path:
+    path = Path(value)
+    return path if path.is_absolute() else Path(__file__).resolve().parents[2] / path
+
+
+class Tracer:
+    """Collects spans per trace and keeps the interesting ones.
+
+    Spans of a trace are buffered until its root span ends, then the whole
+    trace is kept if it was head-sampled (``TRACE_SAMPLE_RATE``), ran longer
+    than ``TRACE_SLOW_SECONDS`` or failed. Kept traces are appended to
+    ``TRACE_FILE`` as OTLP/JSON lines (one ``resourceSpans`` export per
+    trace, readable by the OpenTelemetry collector's ``otlpjsonfile``
+    receiver) and remembered for ``/traces``.
+    """
+
+    def __init__(self) -> None:
+        self.sample_rate = _settings.trace_sample_rate
+        self.slow_seconds = _settings.trace_slow_seconds
+        self.path = _resolve_path(_settings.trace_file) if _settings.trace_file else None
+        self.recent: deque[Trace] = deque(maxlen=RECENT_TRACES)
+        self._resource = {
+            "attributes": [
+                _otlp_attribute("service.name", SERVICE_NAME),
+                _otlp_attribute("service.instance.id", _settings.worker_id),
+                _otlp_attribute("process.pid", os.getpid()),
+            ]
+        }
+
+    def finish(self, trace: Trace) -> None:
+        root = trace.root
+        if not (trace.sampled or root.duration >= self.slow_seconds or root.error):
+            return
+        self.recent.append(trace)
+        if self.path is None:
+            return
+        line = json.dumps(self._export(trace), ensure_ascii=False)
+        try:
+            asyncio.get_running_loop().run_in_executor(_export_executor, self._append, line)
+        except RuntimeError:
+            self._append(line)
+
+    def _export(self, trace: Trace) -> dict[str, Any]:
+        return {
+            "resourceSpans": [
+                {
+                    "resource": self._resource,
+                    "scopeSpans": [{"scope": {"name": "bot"}, "spans": [span.to_otlp() for span in trace.spans]}],
+                }
+            ]
+        }
+
+    def _append(self, line: str) -> None:
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with self.path.open("a", encoding="utf-8") as stream:
+                stream.write(line + "\n")
+        except OSError as exc:
+            logger.warning("Failed to export trace to %s: %s", self.path, exc)
+
+    def slowest(self, limit: int) -> list[Trace]:
+        return sorted(self.recent, key=lambda trace: trace.root.duration, reverse=True)[:limit]
+
+    def find(self, trace_id: str) -> Optional[Trace]:
+        for trace in self.recent:
+            if trace.trace_id.startswith(trace_id):
+                return trace
+        return None
+
+
+_tracer: Optional[Tracer] = None
+
+
+def get_tracer() -> Tracer:
+    global _tracer
+    if _tracer is None:
+        _tracer = Tracer()
+    return _tracer
+
+
+@contextmanager
+def _run_span(span: Span) -> Iterator[Span]:
+    token = _current_span.set(span)
+    try:
+        yield span
+    except BaseException as exc:
+        span.error = f"{type(exc).__name__}: {exc}".rstrip(": ")
+        raise
+    finally:
+        span.end_ns = time.time_ns()
+        _current_span.reset(token)
+
+
+@contextmanager
+def start_trace(name: str, **attributes: Any) -> Iterator[Optional[Span]]:
+    """Open a new trace, e.g. for one Telegram update or one recovered job."""
+    if not _settings.tracing_enabled:
+        yield None
+        return
+    trace = Trace(trace_id=_new_id(16), sampled=random.random() < get_tracer().sample_rate)
+    root = Span(trace, _new_id(8), None, name, time.time_ns(), attributes)
+    trace.add(root)
+    try:
+        with _run_span(root):
+            yield root
+    finally:
+        get_tracer().finish(trace)
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Optional[Span]]:
+    """Record a child span of the current trace; a no-op outside of a trace."""
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+    child = Span(parent.trace, _new_id(8), parent.span_id, name, time.time_ns(), attributes)
+    parent.trace.add(child)
+    with _run_span(child):
+        yield child
+
+
+def current_trace_id() -> Optional[str]:
+    current = _current_span.get()
+    return current.trace.trace_id if current else None
+
+
+def format_trace(trace: Trace) -> str:
+    """Indented span tree with durations, for the ``/traces`` admin command."""
+    children: dict[Optional[str], list[Span]] = {}
+    for item in trace.spans:
+        children.setdefault(item.parent_id, []).append(item)
+
+    lines: list[str] = []
+
+    def _walk(parent_id: Optional[str], depth: int) -> None:
+        for item in sorted(children.get(parent_id, []), key=lambda s: s.start_ns):
+            offset = (item.start_ns - trace.root.start_ns) / 1e9
+            mark = " ❌" if item.error else ""
+            lines.append(f"{'  ' * depth}{item.name} — {item.duration:.2f}с (+{offset:.2f}с){mark}")
+            _walk(item.span_id, depth + 1)
+
+    _walk(None, 0)
+    if trace.dropped:
+        lines.append(f"… ещё {trace.dropped} спанов не записано")
+    return "\n".join(lines)
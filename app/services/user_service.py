@@ -2,7 +2,7 @@ from __future__ import annotations
 
 from typing import Optional, Tuple
 
-from sqlalchemy import func, select
+from sqlalchemy import func, select, update
 
 from bot.config import get_settings
 from ..database import session_factory
@@ -19,6 +19,8 @@ async def get_or_create_user(telegram_id: int, username: Optional[str]) -> Tuple
         if user:
             if username and user.username != username:
                 user.username = username
+            if user.is_blocked:
+                user.is_blocked = False
             return user, False
 
         is_admin = telegram_id in _settings.admin_ids
@@ -85,6 +87,33 @@ async def list_users(limit: int = 50) -> list[User]:
         return list(result.scalars().all())
 
 
+async def list_recipient_batch(after_id: int, limit: int) -> list[tuple[int, int]]:
+    """Return ``(id, telegram_id)`` pairs after ``after_id`` using keyset pagination."""
+    async with session_factory() as session:
+        result = await session.execute(
+            select(User.id, User.telegram_id)
+            .where(User.id > after_id, User.is_blocked.is_(False))
+            .order_by(User.id)
+            .limit(limit)
+        )
+        return [(row.id, row.telegram_id) for row in result]
+
+
+async def count_recipients(after_id: int = 0) -> int:
+    async with session_factory() as session:
+        total = await session.scalar(
+            select(func.count(User.id)).where(User.id > after_id, User.is_blocked.is_(False))
+        )
+    return int(total or 0)
+
+
+async def mark_blocked(telegram_ids: list[int]) -> None:
+    if not telegram_ids:
+        return
+    async with session_factory() as session:
+        await session.execute(update(User).where(User.telegram_id.in_(telegram_ids)).values(is_blocked=True))
+
+
 async def get_stats() -> dict[str, int]:
     async with session_factory() as session:
         total_users = await session.scalar(select(func.count(User.id))) or 0
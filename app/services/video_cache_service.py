@@ -0,0 +1,78 @@
+from __future__ import annotations
+
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import delete, select
+
+from bot.config import get_settings
+from ..database import session_factory
+from ..models.video_cache import VideoCache
+
+logger = logging.getLogger(__name__)
+_settings = get_settings()
+
+PRUNE_INTERVAL = 3600
+
+_last_pruned = 0.0
+
+
+async def lookup(cache_key: str) -> Optional[VideoCache]:
+    """Return the cached fly-by for ``cache_key`` and record the hit."""
+    async with session_factory() as session:
+        result = await session.execute(select(VideoCache).where(VideoCache.cache_key == cache_key))
+        entry = result.scalar_one_or_none()
+        if entry:
+            entry.hits += 1
+            entry.last_used_at = datetime.utcnow()
+        return entry
+
+
+async def remember(cache_key: str, *, video_digest: Optional[str], telegram_file_id: Optional[str]) -> None:
+    async with session_factory() as session:
+        result = await session.execute(select(VideoCache).where(VideoCache.cache_key == cache_key))
+        entry = result.scalar_one_or_none()
+        if entry is None:
+            entry = VideoCache(cache_key=cache_key)
+            session.add(entry)
+        entry.video_digest = video_digest or entry.video_digest
+        entry.telegram_file_id = telegram_file_id or entry.telegram_file_id
+        entry.last_used_at = datetime.utcnow()
+    await _prune_if_due()
+
+
+async def forget(cache_key: str) -> None:
+    async with session_factory() as session:
+        await session.execute(delete(VideoCache).where(VideoCache.cache_key == cache_key))
+
+
+async def cached_digests() -> set[str]:
+    """Digests of cached fly-by videos; storage maintenance keeps these blobs."""
+    async with session_factory() as session:
+        result = await session.execute(select(VideoCache.video_digest).where(VideoCache.video_digest.is_not(None)))
+        return set(result.scalars().all())
+
+
+async def forget_digests(digests: set[str]) -> None:
+    """Drop entries whose video blob storage maintenance evicted."""
+    if not digests:
+        return
+    async with session_factory() as session:
+        result = await session.execute(delete(VideoCache).where(VideoCache.video_digest.in_(digests)))
+    if result.rowcount:
+        logger.info("Dropped %s video cache entries with evicted videos", result.rowcount)
+
+
+async def _prune_if_due() -> None:
+    """Drop entries unused for ``VIDEO_CACHE_TTL_DAYS``, at most once an hour."""
+    global _last_pruned
+    if time.monotonic() - _last_pruned < PRUNE_INTERVAL:
+        return
+    _last_pruned = time.monotonic()
+    cutoff = datetime.utcnow() - timedelta(days=_settings.video_cache_ttl_days)
+    async with session_factory() as session:
+        result = await session.execute(delete(VideoCache).where(VideoCache.last_used_at < cutoff))
+    if result.rowcount:
+        logger.info("Pruned %s stale video cache entries", result.rowcount)
@@ -1,17 +1,30 @@
 from __future__ import annotations
 
+import asyncio
 import base64
+import hashlib
 import logging
+import shutil
+import tempfile
+from pathlib import Path
 from typing import Optional
 
 import aiohttp
 
 from bot.config import get_settings
+from ..utils import ffmpeg
+from ..utils.fileio import CHUNK_SIZE, iter_chunks, run_io, write_stream
+from . import fal_queue
+from .ai_service import ResultSink, provider_phase
+from .memory import hold
+from .metrics import PROVIDER_TIMEOUTS
 
 logger = logging.getLogger(__name__)
 
 _SETTINGS = get_settings()
 
+METRICS_PROVIDER = "wan25"
+
 DEFAULT_VIDEO_PROMPT = (
     "###Instruction###\nYou are a photorealistic image-to-video model.\n\n###Input Reference###\n- The provided image shows the same custom car in two halves divided by a thin neon-green horizontal line.\n- The top half is a 3/4 front view, the bottom half is a side profile.\n- Both halves share the same body color, lighting and custom wheels — treat them as one real vehicle.\n\n###Task###\n- Reconstruct the full 3D car based on both views.\n- Produce a cinematic drone fly-around that lasts roughly five seconds.\n- Start near the front 3/4 view, orbit smoothly around the car at door height, and finish near the starting angle.\n- Keep the car centered, maintain realistic lighting, reflections, wheel design and motion blur.\n- The background should stay coherent with the lighting seen in the reference image, but avoid duplicating the split layout.\n\n###Output###\nDeliver a single 5-second MP4 that looks like a stabilized drone performing a 360° orbit of the car."
 )
@@ -26,47 +39,86 @@ class VideoService:
         duration: str = "5",
     ) -> None:
         self.api_key = api_key or _SETTINGS.fal_api_key
-        self.endpoint = "https://fal.run/fal-ai/wan-25-preview/image-to-video"
+        self.model = "fal-ai/wan-25-preview/image-to-video"
         self.resolution = resolution
         self.duration = duration
 
-    async def generate(self, image_bytes: bytes, prompt: Optional[str] = None) -> bytes:
+    def cache_key(self, source_digest: str, prompt: Optional[str] = None) -> str:
+        """Identify a fly-by by everything that determines the provider output."""
+        parts = [self.model, source_digest, prompt or DEFAULT_VIDEO_PROMPT, self.resolution, self.duration]
+        return hashlib.sha256("\x00".join(parts).encode()).hexdigest()
+
+    async def generate(
+        self,
+        image_bytes: Optional[bytes] = None,
+        prompt: Optional[str] = None,
+        *,
+        sink: ResultSink,
+        image_url: Optional[str] = None,
+    ) -> Path:
         if not self.api_key:
             logger.error("FAL API key not configured; aborting video generation")
             raise RuntimeError("FAL API key not configured")
 
+        with provider_phase(METRICS_PROVIDER, "encode"):
+            source_url = image_url or self._to_data_uri(image_bytes)
         payload = {
             "prompt": prompt or DEFAULT_VIDEO_PROMPT,
-            "image_url": self._to_data_uri(image_bytes),
+            "image_url": source_url,
             "resolution": self.resolution,
             "duration": self.duration,
             "enable_safety_checker": True,
             "enable_prompt_expansion": True,
         }
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Key {self.api_key}",
-        }
-
         async with aiohttp.ClientSession() as session:
-            async with session.post(self.endpoint, json=payload, headers=headers, timeout=600) as response:
-                response.raise_for_status()
-                data = await response.json()
-
             try:
-                video_url = data["video"]["url"]
-            except (KeyError, TypeError) as exc:
-                logger.error("Unexpected Wan Pro response: %s", data)
-                raise RuntimeError("Failed to parse Wan Pro response") from exc
-
-            async with session.get(video_url, timeout=600) as video_response:
-                video_response.raise_for_status()
-                return await video_response.read()
+                with hold("photo", image_bytes), provider_phase(METRICS_PROVIDER, "request"):
+                    data = await fal_queue.run(session, self.model, payload, api_key=self.api_key, timeout=600)
+            except asyncio.TimeoutError:
+                PROVIDER_TIMEOUTS.inc(provider=METRICS_PROVIDER)
+                raise
+            return await self.collect(session, data, sink)
+
+    async def collect(self, session: aiohttp.ClientSession, data: dict, sink: ResultSink) -> Path:
+        """Download and post-process the video of a finished fal request."""
+        try:
+            video_url = data["video"]["url"]
+        except (KeyError, TypeError) as exc:
+            logger.error("Unexpected Wan Pro response: %s", data)
+            raise RuntimeError("Failed to parse Wan Pro response") from exc
+
+        if not ffmpeg.available():
+            with provider_phase(METRICS_PROVIDER, "download"):
+                async with session.get(video_url, timeout=600) as video_response:
+                    video_response.raise_for_status()
+                    return await sink(video_response.content.iter_chunked(CHUNK_SIZE))
+
+        workdir = Path(await run_io(tempfile.mkdtemp, None, "flyby-"))
+        try:
+            raw_path = workdir / "raw.mp4"
+            with provider_phase(METRICS_PROVIDER, "download"):
+                async with session.get(video_url, timeout=600) as video_response:
+                    video_response.raise_for_status()
+                    await write_stream(raw_path, video_response.content.iter_chunked(CHUNK_SIZE))
+
+            optimized_path = workdir / "flyby.mp4"
+            with provider_phase(METRICS_PROVIDER, "postprocess"):
+                optimized = await ffmpeg.optimize(raw_path, optimized_path)
+            final_path = optimized_path if optimized else raw_path
+            return await sink(iter_chunks(final_path))
+        finally:
+            await run_io(shutil.rmtree, workdir, True)
 
     @staticmethod
     def _to_data_uri(image: bytes) -> str:
         encoded = base64.b64encode(image).decode()
-        mime = "image/png" if image.startswith(b"\x89PNG") else "image/jpeg"
+        if image.startswith(b"\x89PNG"):
+            mime = "image/png"
+        elif image[:4] == b"RIFF" and image[8:12] == b"WEBP":
+            # Results requested with AI_OUTPUT_FORMAT=webp.
+            mime = "image/webp"
+        else:
+            mime = "image/jpeg"
         return f"data:{mime};base64,{encoded}"
 
 
@@ -37,6 +37,7 @@ class YooKassaService:
             raise RuntimeError("YooKassa credentials are not configured")
         Configuration.account_id = _settings.yookassa_shop_id
         Configuration.secret_key = _settings.yookassa_secret_key
+        Configuration.api_url = _settings.yookassa_api_url
 
     def _build_receipt(
         self,
@@ -0,0 +1,361 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+import uuid
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import AsyncIterable, AsyncIterator, Optional
+from weakref import WeakValueDictionary
+
+from .fileio import remove, run_io, write_bytes, write_stream
+from .object_storage import S3Backend
+
+try:  # Pillow is optional: without it cold previews simply stay uncompressed.
+    from PIL import Image
+except ImportError:  # pragma: no cover - depends on the environment
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+WEBP_SUFFIX = ".webp"
+WEBP_QUALITY = 90
+QUOTA_LOW_WATERMARK = 0.9
+POINTER_SHARDS = 1000
+# Only the Telegram-sized copy: "result" must stay the provider original.
+_COMPRESSIBLE_KINDS = {"preview"}
+
+
+@dataclass(slots=True)
+class BlobPointer:
+    digest: str
+    size: int
+    updated_at: float
+
+
+@dataclass(slots=True)
+class EvictionReport:
+    blobs: int = 0
+    total_bytes: int = 0
+    orphans_removed: int = 0
+    expired_removed: int = 0
+    quota_removed: int = 0
+    pointers_removed: int = 0
+    freed_bytes: int = 0
+    compressed: int = 0
+    # Evicted referenced digests and the users whose pointers still refer to them.
+    evicted: dict[str, set[int]] = field(default_factory=dict, repr=False)
+
+
+class BlobStore:
+    """Content-addressed storage for user media.
+
+    Blobs are keyed by SHA-256 and fanned out as ``blobs/ab/cd/<digest>``, so
+    identical photos uploaded by many users are stored once. Each user has a
+    small JSON pointer record mapping an upload kind to a digest. A blob's
+    mtime is refreshed on every read and serves as the LRU clock for eviction.
+
+    With a ``remote`` backend the bucket is authoritative for blobs and
+    pointers, and ``root`` becomes a local read cache bounded by the quota.
+    """
+
+    def __init__(self, root: Path, remote: Optional[S3Backend] = None) -> None:
+        self.root = root
+        self.remote = remote
+        self._blobs_root = root / "blobs"
+        self._pointers_root = root / "pointers"
+        self._staging_root = root / "staging"
+        self._known_dirs: set[Path] = set()
+        self._user_locks: WeakValueDictionary[int, asyncio.Lock] = WeakValueDictionary()
+
+    # -- layout -----------------------------------------------------------
+
+    @staticmethod
+    def blob_key(digest: str) -> str:
+        return f"blobs/{digest[:2]}/{digest[2:4]}/{digest}"
+
+    @staticmethod
+    def _pointer_key(user_id: int) -> str:
+        return f"pointers/{user_id % POINTER_SHARDS:03d}/{user_id}.json"
+
+    def blob_path(self, digest: str) -> Path:
+        return self.root / self.blob_key(digest)
+
+    def _pointer_path(self, user_id: int) -> Path:
+        return self.root / self._pointer_key(user_id)
+
+    def _ensure_dir(self, directory: Path) -> None:
+        if directory in self._known_dirs:
+            return
+        directory.mkdir(parents=True, exist_ok=True)
+        self._known_dirs.add(directory)
+
+    # -- blobs ------------------------------------------------------------
+
+    def _locate(self, digest: str) -> Optional[Path]:
+        """Return the stored file for ``digest`` and mark it as recently used."""
+        base = self.blob_path(digest)
+        for candidate in (base, base.with_suffix(WEBP_SUFFIX)):
+            try:
+                os.utime(candidate)
+            except FileNotFoundError:
+                continue
+            return candidate
+        return None
+
+    def _adopt(self, staged: Path, digest: str) -> Path:
+        existing = self._locate(digest)
+        if existing is not None:
+            staged.unlink(missing_ok=True)
+            return existing
+        target = self.blob_path(digest)
+        self._ensure_dir(target.parent)
+        os.replace(staged, target)
+        return target
+
+    def _staging_path(self) -> Path:
+        self._ensure_dir(self._staging_root)
+        return self._staging_root / f"{uuid.uuid4().hex}.part"
+
+    async def _publish(self, digest: str, path: Path) -> None:
+        if self.remote is None:
+            return
+        key = self.blob_key(digest)
+        if not await self.remote.exists(key):
+            await self.remote.upload_file(key, path)
+
+    async def put_bytes(self, data: bytes) -> tuple[BlobPointer, Path]:
+        """Store ``data``; return its pointer and the file holding it (maybe a compressed copy)."""
+        digest = await run_io(lambda: hashlib.sha256(data).hexdigest())
+        path = await run_io(self._locate, digest)
+        if path is None:
+            staged = await run_io(self._staging_path)
+            await write_bytes(staged, data)
+            path = await run_io(self._adopt, staged, digest)
+        await self._publish(digest, path)
+        return BlobPointer(digest=digest, size=len(data), updated_at=time.time()), path
+
+    async def put_stream(self, chunks: AsyncIterable[bytes]) -> tuple[BlobPointer, Path]:
+        hasher = hashlib.sha256()
+
+        async def _hashing() -> AsyncIterator[bytes]:
+            async for chunk in chunks:
+                hasher.update(chunk)
+                yield chunk
+
+        staged = await run_io(self._staging_path)
+        size = await write_stream(staged, _hashing())
+        digest = hasher.hexdigest()
+        path = await run_io(self._adopt, staged, digest)
+        await self._publish(digest, path)
+        return BlobPointer(digest=digest, size=size, updated_at=time.time()), path
+
+    async def get_path(self, digest: str) -> Optional[Path]:
+        path = await run_io(self._locate, digest)
+        if path is not None or self.remote is None:
+            return path
+        staged = await run_io(self._staging_path)
+        if not await self.remote.download_to(self.blob_key(digest), staged):
+            return None
+        return await run_io(self._adopt, staged, digest)
+
+    async def presigned_url(self, digest: str, expires: int) -> Optional[str]:
+        """Return a direct download URL when blobs live in object storage."""
+        if self.remote is None:
+            return None
+        return self.remote.presigned_url(self.blob_key(digest), expires)
+
+    # -- pointers ---------------------------------------------------------
+
+    def _user_lock(self, user_id: int) -> asyncio.Lock:
+        lock = self._user_locks.get(user_id)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._user_locks[user_id] = lock
+        return lock
+
+    def _load_pointers(self, user_id: int) -> dict[str, dict]:
+        try:
+            return json.loads(self._pointer_path(user_id).read_text())
+        except FileNotFoundError:
+            return {}
+        except ValueError:
+            logger.warning("Corrupted pointer record for user %s; resetting", user_id)
+            return {}
+
+    async def _read_pointers(self, user_id: int) -> dict[str, dict]:
+        if self.remote is None:
+            return await run_io(self._load_pointers, user_id)
+        payload = await self.remote.get_bytes(self._pointer_key(user_id))
+        return json.loads(payload) if payload else {}
+
+    async def _write_pointers(self, user_id: int, records: dict[str, dict]) -> None:
+        payload = json.dumps(records).encode()
+        if self.remote is not None:
+            key = self._pointer_key(user_id)
+            if records:
+                await self.remote.put_bytes(key, payload, content_type="application/json")
+            else:
+                await self.remote.delete(key)
+        elif records:
+            await write_bytes(self._pointer_path(user_id), payload)
+        else:
+            await remove(self._pointer_path(user_id))
+
+    async def get_pointer(self, user_id: int, kind: str) -> Optional[BlobPointer]:
+        record = (await self._read_pointers(user_id)).get(kind)
+        return BlobPointer(**record) if record else None
+
+    async def set_pointer(self, user_id: int, kind: str, pointer: Optional[BlobPointer]) -> None:
+        async with self._user_lock(user_id):
+            records = await self._read_pointers(user_id)
+            if pointer is None:
+                if records.pop(kind, None) is None:
+                    return
+            else:
+                records[kind] = asdict(pointer)
+            await self._write_pointers(user_id, records)
+
+    # -- maintenance ------------------------------------------------------
+
+    def _references(self) -> tuple[dict[str, set[str]], dict[str, set[int]]]:
+        """Map each referenced digest to its upload kinds and to the users holding it."""
+        kinds: dict[str, set[str]] = {}
+        holders: dict[str, set[int]] = {}
+        for pointer_file in self._pointers_root.glob("*/*.json"):
+            try:
+                records = json.loads(pointer_file.read_text())
+                user_id = int(pointer_file.stem)
+            except (OSError, ValueError):
+                continue
+            for kind, record in records.items():
+                kinds.setdefault(record["digest"], set()).add(kind)
+                holders.setdefault(record["digest"], set()).add(user_id)
+        return kinds, holders
+
+    async def drop_pointers(self, evicted: dict[str, set[int]]) -> int:
+        """Remove pointer entries to blobs :meth:`evict` deleted; return how many were removed.
+
+        Runs on the event loop under the users' locks, so a slot set meanwhile
+        is never overwritten; a digest uploaded again since then is kept.
+        """
+        by_user: dict[int, set[str]] = {}
+        for digest, user_ids in evicted.items():
+            for user_id in user_ids:
+                by_user.setdefault(user_id, set()).add(digest)
+        removed = 0
+        for user_id, digests in by_user.items():
+            gone = {digest for digest in digests if await run_io(self._locate, digest) is None}
+            if not gone:
+                continue
+            async with self._user_lock(user_id):
+                records = await self._read_pointers(user_id)
+                kept = {kind: record for kind, record in records.items() if record["digest"] not in gone}
+                if len(kept) == len(records):
+                    continue
+                removed += len(records) - len(kept)
+                await self._write_pointers(user_id, kept)
+        return removed
+
+    def evict(
+        self,
+        *,
+        quota_bytes: int,
+        max_age: float,
+        cold_after: float,
+        orphan_grace: float = 3600,
+        pinned: frozenset[str] = frozenset(),
+    ) -> EvictionReport:
+        """Enforce age and quota limits and compress cold previews. Blocking.
+
+        ``pinned`` digests are referenced from outside the pointers (the video
+        cache) and count as referenced. Blobs removed for age or quota that are
+        referenced are listed in ``report.evicted``; pass it to
+        :meth:`drop_pointers` on the event loop.
+        With a remote backend only the local cache quota is enforced; retention
+        in the bucket is left to its lifecycle rules.
+        """
+        report = EvictionReport()
+        now = time.time()
+        referenced, holders = self._references() if self.remote is None else ({}, {})
+        if self.remote is None:
+            for digest in pinned:
+                referenced.setdefault(digest, set()).add("pinned")
+
+        for staged in self._staging_root.glob("*.part"):
+            try:
+                if now - staged.stat().st_mtime > orphan_grace:
+                    staged.unlink()
+            except FileNotFoundError:
+                continue
+
+        survivors: list[tuple[float, int, Path]] = []
+        for path in self._blobs_root.glob("*/*/*"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            report.blobs += 1
+            digest = path.name.split(".", maxsplit=1)[0]
+            idle = now - stat.st_mtime
+            kinds = referenced.get(digest)
+
+            if self.remote is not None:
+                survivors.append((stat.st_mtime, stat.st_size, path))
+                continue
+            if not kinds and idle > orphan_grace:
+                report.orphans_removed += 1
+            elif idle > max_age:
+                report.expired_removed += 1
+                report.evicted[digest] = holders.get(digest, set())
+            else:
+                size = stat.st_size
+                if kinds and kinds <= _COMPRESSIBLE_KINDS and idle > cold_after and path.suffix != WEBP_SUFFIX:
+                    compressed = _compress_to_webp(path, stat.st_mtime)
+                    if compressed is not None:
+                        report.compressed += 1
+                        report.freed_bytes += size - compressed.stat().st_size
+                        path, size = compressed, compressed.stat().st_size
+                survivors.append((stat.st_mtime, size, path))
+                continue
+
+            path.unlink(missing_ok=True)
+            report.freed_bytes += stat.st_size
+
+        report.total_bytes = sum(size for _, size, _ in survivors)
+        if report.total_bytes > quota_bytes:
+            target = int(quota_bytes * QUOTA_LOW_WATERMARK)
+            for _, size, path in sorted(survivors):
+                if report.total_bytes <= target:
+                    break
+                path.unlink(missing_ok=True)
+                report.total_bytes -= size
+                report.freed_bytes += size
+                report.quota_removed += 1
+                digest = path.name.split(".", maxsplit=1)[0]
+                if digest in referenced:
+                    report.evicted[digest] = holders.get(digest, set())
+        return report
+
+
+def _compress_to_webp(path: Path, mtime: float) -> Optional[Path]:
+    if Image is None:
+        return None
+    target = path.with_suffix(WEBP_SUFFIX)
+    try:
+        with Image.open(path) as image:
+            image.save(target, format="WEBP", quality=WEBP_QUALITY, method=4)
+    except OSError:
+        logger.warning("Failed to compress blob %s", path.name, exc_info=True)
+        target.unlink(missing_ok=True)
+        return None
+    if target.stat().st_size >= path.stat().st_size:
+        target.unlink()
+        return None
+    os.utime(target, (mtime, mtime))
+    path.unlink()
+    return target
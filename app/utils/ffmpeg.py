@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import shutil
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional
+
+from bot.config import get_settings
+
+logger = logging.getLogger(__name__)
+_settings = get_settings()
+
+FFMPEG_TIMEOUT = 300
+THUMBNAIL_SIDE = 320
+THUMBNAIL_OFFSET = 0.5
+# Telegram wants thumbnails within 320x320 on both sides, portrait fly-bys included.
+_THUMBNAIL_SCALE = (
+    f"scale='min({THUMBNAIL_SIDE},iw)':'min({THUMBNAIL_SIDE},ih)'"
+    ":force_original_aspect_ratio=decrease:force_divisible_by=2"
+)
+
+# Bounds how many ffmpeg/ffprobe processes run at once across all jobs.
+_slots = asyncio.Semaphore(_settings.ffmpeg_workers)
+
+
+@dataclass(slots=True)
+class VideoInfo:
+    width: Optional[int] = None
+    height: Optional[int] = None
+    duration: Optional[int] = None
+    thumbnail: Optional[bytes] = None
+
+
+@lru_cache()
+def available() -> bool:
+    found = bool(shutil.which(_settings.ffmpeg_binary) and shutil.which(_settings.ffprobe_binary))
+    if not found:
+        logger.warning("ffmpeg/ffprobe not found; videos are sent without post-processing")
+    return found
+
+
+async def _run(*args: str) -> bytes:
+    async with _slots:
+        process = await asyncio.create_subprocess_exec(
+            *args,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        try:
+            stdout, stderr = await asyncio.wait_for(process.communicate(), FFMPEG_TIMEOUT)
+        except BaseException:
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+            raise
+    if process.returncode != 0:
+        tail = stderr.decode(errors="replace")[-500:]
+        raise RuntimeError(f"{Path(args[0]).name} exited with {process.returncode}: {tail}")
+    return stdout
+
+
+async def optimize(source: Path, target: Path) -> bool:
+    """Write a streamable copy of ``source`` to ``target``.
+
+    The moov atom is moved to the front so playback starts before the
+    download finishes. With ``VIDEO_BITRATE`` set the video is re-encoded to
+    that target, otherwise the streams are copied as is. Returns False when
+    ffmpeg is unavailable or fails; ``source`` is then the file to use.
+    """
+    if not available():
+        return False
+    if _settings.video_bitrate:
+        bitrate = _settings.video_bitrate
+        codec_args = [
+            "-c:v", "libx264", "-preset", "veryfast", "-pix_fmt", "yuv420p",
+            "-b:v", bitrate, "-maxrate", bitrate, "-bufsize", bitrate,
+            "-c:a", "aac", "-b:a", "128k",
+        ]
+    else:
+        codec_args = ["-c", "copy"]
+    try:
+        await _run(
+            _settings.ffmpeg_binary, "-nostdin", "-v", "error", "-y", "-i", str(source),
+            *codec_args, "-movflags", "+faststart", str(target),
+        )
+    except (OSError, RuntimeError, asyncio.TimeoutError):
+        logger.warning("ffmpeg failed to optimize %s", source.name, exc_info=True)
+        return False
+    return True
+
+
+async def describe(path: Path) -> VideoInfo:
+    """Probe dimensions and duration and grab a JPEG thumbnail for Telegram."""
+    info = VideoInfo()
+    if not available():
+        return info
+    try:
+        payload = json.loads(
+            await _run(
+                _settings.ffprobe_binary, "-v", "error", "-select_streams", "v:0",
+                "-show_entries", "stream=width,height:format=duration", "-of", "json", str(path),
+            )
+        )
+        stream = (payload.get("streams") or [{}])[0]
+        info.width = stream.get("width")
+        info.height = stream.get("height")
+        duration = payload.get("format", {}).get("duration")
+        info.duration = round(float(duration)) if duration else None
+        info.thumbnail = await _run(
+            _settings.ffmpeg_binary, "-nostdin", "-v", "error", "-ss", str(THUMBNAIL_OFFSET), "-i", str(path),
+            "-frames:v", "1", "-vf", _THUMBNAIL_SCALE,
+            "-f", "image2pipe", "-vcodec", "mjpeg", "-",
+        ) or None
+    except (OSError, RuntimeError, ValueError, asyncio.TimeoutError):
+        logger.warning("ffprobe failed for %s", path.name, exc_info=True)
+    return info
@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import IO, Any, AsyncIterable, AsyncIterator, Callable, Optional, TypeVar
+
+from bot.config import get_settings
+from ..services.tracing import span
+
+CHUNK_SIZE = 256 * 1024
+
+_T = TypeVar("_T")
+_executor = ThreadPoolExecutor(
+    max_workers=get_settings().storage_io_workers,
+    thread_name_prefix="storage-io",
+)
+
+
+async def run_io(func: Callable[..., _T], *args: Any) -> _T:
+    """Run blocking file I/O on the storage pool instead of the event loop."""
+    loop = asyncio.get_running_loop()
+    with span(f"io {getattr(func, '__name__', 'call')}"):
+        return await loop.run_in_executor(_executor, partial(func, *args))
+
+
+def _read_file(path: Path) -> Optional[bytes]:
+    try:
+        return path.read_bytes()
+    except FileNotFoundError:
+        return None
+
+
+def _open_temp(path: Path) -> tuple[IO[bytes], str]:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, temp_name = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    return os.fdopen(fd, "wb"), temp_name
+
+
+def _commit_temp(stream: IO[bytes], temp_name: str, path: Path) -> None:
+    stream.flush()
+    os.fsync(stream.fileno())
+    stream.close()
+    os.replace(temp_name, path)
+
+
+def _discard_temp(stream: IO[bytes], temp_name: str) -> None:
+    stream.close()
+    try:
+        os.unlink(temp_name)
+    except FileNotFoundError:
+        pass
+
+
+def _write_file_atomic(path: Path, data: bytes) -> None:
+    stream, temp_name = _open_temp(path)
+    try:
+        stream.write(data)
+    except BaseException:
+        _discard_temp(stream, temp_name)
+        raise
+    _commit_temp(stream, temp_name, path)
+
+
+def _unlink(path: Path) -> None:
+    path.unlink(missing_ok=True)
+
+
+async def read_bytes(path: Path) -> Optional[bytes]:
+    return await run_io(_read_file, path)
+
+
+async def write_bytes(path: Path, data: bytes) -> None:
+    """Write ``data`` to a temp file next to ``path`` and rename it into place."""
+    await run_io(_write_file_atomic, path, data)
+
+
+async def iter_chunks(path: Path, chunk_size: int = CHUNK_SIZE) -> AsyncIterator[bytes]:
+    stream = await run_io(open, path, "rb")
+    try:
+        while chunk := await run_io(stream.read, chunk_size):
+            yield chunk
+    finally:
+        await run_io(stream.close)
+
+
+async def write_stream(path: Path, chunks: AsyncIterable[bytes]) -> int:
+    """Atomically write an async stream of chunks to ``path``; return the size."""
+    stream, temp_name = await run_io(_open_temp, path)
+    size = 0
+    try:
+        async for chunk in chunks:
+            await run_io(stream.write, chunk)
+            size += len(chunk)
+    except BaseException:
+        await run_io(_discard_temp, stream, temp_name)
+        raise
+    await run_io(_commit_temp, stream, temp_name, path)
+    return size
+
+
+async def remove(path: Path) -> None:
+    await run_io(_unlink, path)
@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import asyncio
+import io
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import Any, Callable, Optional, TypeVar
+
+from bot.config import get_settings
+
+try:  # Pillow is optional: without it results are delivered as the provider sent them.
+    from PIL import Image
+except ImportError:  # pragma: no cover - depends on the environment
+    Image = None
+
+_settings = get_settings()
+
+TELEGRAM_PHOTO_LIMIT = 10 * 1024 * 1024
+TELEGRAM_PHOTO_QUALITY = 87
+_EXTENSIONS = {"png": "png", "jpeg": "jpg", "webp": "webp"}
+
+_T = TypeVar("_T")
+# Pillow releases the GIL while decoding and encoding, so threads are enough
+# to keep re-encoding off the event loop without pickling images between processes.
+_executor = ThreadPoolExecutor(max_workers=_settings.image_workers, thread_name_prefix="imaging")
+
+
+async def _run(func: Callable[..., _T], *args: Any) -> _T:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, partial(func, *args))
+
+
+def detect_format(head: bytes) -> str:
+    if head.startswith(b"\x89PNG"):
+        return "png"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    return "jpeg"
+
+
+def _sniff(path: Path) -> str:
+    with path.open("rb") as stream:
+        return detect_format(stream.read(12))
+
+
+async def file_extension(path: Path) -> str:
+    """Extension matching the actual image format of ``path``."""
+    return _EXTENSIONS[await _run(_sniff, path)]
+
+
+def _render_telegram_photo(path: Path, max_side: int) -> Optional[bytes]:
+    size = path.stat().st_size
+    with Image.open(path) as image:
+        if image.format == "JPEG" and max(image.size) <= max_side and size <= TELEGRAM_PHOTO_LIMIT:
+            return None
+        image.thumbnail((max_side, max_side))
+        buffer = io.BytesIO()
+        image.convert("RGB").save(
+            buffer,
+            format="JPEG",
+            quality=TELEGRAM_PHOTO_QUALITY,
+            optimize=True,
+            progressive=True,
+        )
+    return buffer.getvalue()
+
+
+async def telegram_photo(path: Path) -> Optional[bytes]:
+    """Re-encode a result into a JPEG sized for Telegram photos.
+
+    Returns ``None`` when the file can be sent as is (already a JPEG within
+    Telegram's limits) or when Pillow is not installed.
+    """
+    if Image is None:
+        return None
+    return await _run(_render_telegram_photo, path, _settings.telegram_photo_max_side)
@@ -0,0 +1,178 @@
+from __future__ import annotations
+
+import atexit
+import json
+import logging
+import queue
+import time
+import traceback
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from pathlib import Path
+from typing import Optional
+
+from bot.config import get_settings
+from ..services.tracing import current_trace_id
+from .rate_limit import Limit, TokenBucket
+
+TEXT_FORMAT = "%(asctime)s [%(levelname)s] %(name)s: %(message)s"
+# Tracebacks are kept longer than messages: the useful frames are at the end.
+MAX_EXCEPTION_LENGTH = 8000
+QUEUE_SIZE = 10_000
+
+
+def _truncate(text: str, limit: int) -> str:
+    if limit <= 0 or len(text) <= limit:
+        return text
+    return f"{text[:limit]}… [{len(text) - limit} chars truncated]"
+
+
+class SizeAndTimeRotatingFileHandler(RotatingFileHandler):
+    """Rotates when the file exceeds ``maxBytes`` or every ``interval`` seconds.
+
+    Backups are numbered like :class:`RotatingFileHandler` (``bot.log.1`` is
+    the newest), so a size rollover within one period never overwrites the
+    file of an earlier rollover.
+    """
+
+    def __init__(self, filename: Path, *, max_bytes: int, backup_count: int, interval: float) -> None:
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8")
+        self.interval = interval
+        self.rollover_at = time.time() + interval if interval > 0 else float("inf")
+
+    def shouldRollover(self, record: logging.LogRecord) -> int:
+        if time.time() >= self.rollover_at:
+            return 1
+        return super().shouldRollover(record)
+
+    def doRollover(self) -> None:
+        super().doRollover()
+        if self.interval > 0:
+            self.rollover_at = time.time() + self.interval
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message, trace id, exception."""
+
+    def __init__(self, worker_id: str) -> None:
+        super().__init__()
+        self.worker_id = worker_id
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "worker": self.worker_id,
+            "pid": record.process,
+        }
+        trace_id = getattr(record, "trace_id", None)
+        if trace_id:
+            entry["trace_id"] = trace_id
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class RateLimitFilter(logging.Filter):
+    """Drops records of a logger that logs faster than ``limit``.
+
+    A provider outage otherwise writes the same traceback for every job.
+    The next record let through reports how many were dropped meanwhile.
+    """
+
+    def __init__(self, limit: Limit) -> None:
+        super().__init__()
+        self.limit = limit
+        self._buckets: dict[str, TokenBucket] = {}
+        self._dropped: dict[str, int] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        bucket = self._buckets.get(record.name)
+        if bucket is None:
+            bucket = self._buckets[record.name] = TokenBucket(self.limit)
+        if bucket.consume():
+            self._dropped[record.name] = self._dropped.get(record.name, 0) + 1
+            return False
+        record.suppressed = self._dropped.pop(record.name, 0)
+        return True
+
+
+class ContextQueueHandler(QueueHandler):
+    """Hands records to the listener thread with everything resolved up front.
+
+    The message, traceback and trace id are rendered in the calling thread
+    (they depend on its state) and truncated, so the queue never holds a
+    multi-megabyte provider response.
+    """
+
+    def __init__(self, log_queue: queue.Queue, max_length: int) -> None:
+        super().__init__(log_queue)
+        self.max_length = max_length
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        message = _truncate(record.getMessage(), self.max_length)
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            message = f"{message} [{suppressed} earlier records of this logger suppressed]"
+        exc_text = record.exc_text
+        if record.exc_info and not exc_text:
+            exc_text = "".join(traceback.format_exception(*record.exc_info)).rstrip()
+        prepared = logging.makeLogRecord(record.__dict__)
+        prepared.msg = message
+        prepared.args = None
+        prepared.exc_info = None
+        prepared.exc_text = _truncate(exc_text, MAX_EXCEPTION_LENGTH) if exc_text else None
+        prepared.trace_id = current_trace_id()
+        return prepared
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # Never block the event loop on logging; losing a line is the lesser evil.
+            pass
+
+
+def setup_logging(logs_dir: Path, filename: Optional[str] = None) -> QueueListener:
+    """Route all logging through a queue to a rotating file and the console.
+
+    Each worker gets its own file (``bot.log`` or ``bot-<WORKER_ID>.log``):
+    rotation is not safe with several processes writing to one file. The
+    listener is stopped at exit, which flushes the queue.
+    """
+    settings = get_settings()
+    logs_dir.mkdir(exist_ok=True)
+    if filename is None:
+        filename = "bot.log" if settings.worker_id == "main" else f"bot-{settings.worker_id}.log"
+
+    file_handler = SizeAndTimeRotatingFileHandler(
+        logs_dir / filename,
+        max_bytes=settings.log_max_mb * 1024 * 1024,
+        backup_count=settings.log_backup_count,
+        interval=settings.log_rotate_hours * 3600,
+    )
+    if settings.log_format == "json":
+        file_handler.setFormatter(JsonFormatter(settings.worker_id))
+    else:
+        file_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+
+    log_queue: queue.Queue = queue.Queue(QUEUE_SIZE)
+    queue_handler = ContextQueueHandler(log_queue, settings.log_max_length)
+    rate_limit: Optional[Limit] = Limit.parse(settings.log_rate_limit) if settings.log_rate_limit else None
+    if rate_limit is not None:
+        queue_handler.addFilter(RateLimitFilter(rate_limit))
+
+    root = logging.getLogger()
+    root.setLevel(settings.log_level.upper())
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+
+    listener = QueueListener(log_queue, console_handler, file_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
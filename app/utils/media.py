@@ -5,6 +5,7 @@ from functools import lru_cache
 from aiogram.types import BufferedInputFile, FSInputFile
 
 from bot.config import BASE_DIR
+from .fileio import run_io
 
 ASSETS_DIR = BASE_DIR / "app" / "assets"
 DEFAULT_BANNER_PATH = BASE_DIR / "lenarst.jpg"
@@ -18,6 +19,12 @@ def _banner_bytes() -> bytes:
     return DEFAULT_BANNER_PATH.read_bytes()
 
 
+async def preload_banners() -> None:
+    """Read banner images on the storage pool so handlers never hit the disk."""
+    for loader in (_banner_bytes, _step1_banner_bytes, _step2_banner_bytes):
+        await run_io(loader)
+
+
 def default_banner() -> BufferedInputFile:
     """Return the default banner image for rich messages."""
     return BufferedInputFile(_banner_bytes(), filename="lenarst.jpg")
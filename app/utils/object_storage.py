@@ -0,0 +1,270 @@
+from __future__ import annotations
+
+import hashlib
+import hmac
+import logging
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional
+from urllib.parse import quote, urlsplit
+from xml.etree import ElementTree
+
+import aiohttp
+from yarl import URL
+
+from .fileio import CHUNK_SIZE, run_io, write_stream
+
+logger = logging.getLogger(__name__)
+
+MULTIPART_THRESHOLD = 16 * 1024 * 1024
+MULTIPART_PART_SIZE = 8 * 1024 * 1024
+REQUEST_TIMEOUT = 120
+UNSIGNED_PAYLOAD = "UNSIGNED-PAYLOAD"
+_EMPTY_SHA256 = hashlib.sha256(b"").hexdigest()
+
+
+def _quote(value: str, safe: str = "-_.~") -> str:
+    return quote(value, safe=safe)
+
+
+def _hmac(key: bytes, message: str) -> bytes:
+    return hmac.new(key, message.encode(), hashlib.sha256).digest()
+
+
+class S3Backend:
+    """Minimal S3-compatible client (AWS, MinIO, Yandex Object Storage, ...).
+
+    Requests are signed with AWS Signature V4 using path-style addressing, so
+    it runs against a local MinIO as well as hosted providers. Only the
+    operations the blob store needs are implemented.
+    """
+
+    def __init__(
+        self,
+        *,
+        endpoint_url: str,
+        bucket: str,
+        access_key: str,
+        secret_key: str,
+        region: str = "us-east-1",
+        public_endpoint_url: str = "",
+    ) -> None:
+        if not endpoint_url or not bucket or not access_key or not secret_key:
+            raise RuntimeError("S3 storage is not configured")
+        self.endpoint_url = endpoint_url.rstrip("/")
+        self.public_endpoint_url = (public_endpoint_url or endpoint_url).rstrip("/")
+        self.bucket = bucket
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.region = region
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    # -- signing ----------------------------------------------------------
+
+    def _canonical_uri(self, key: str) -> str:
+        return "/" + _quote(self.bucket) + "/" + _quote(key, safe="-_.~/")
+
+    def _scope(self, now: datetime) -> str:
+        return f"{now:%Y%m%d}/{self.region}/s3/aws4_request"
+
+    def _signature(self, now: datetime, canonical_request: str) -> str:
+        string_to_sign = "\n".join(
+            [
+                "AWS4-HMAC-SHA256",
+                f"{now:%Y%m%dT%H%M%SZ}",
+                self._scope(now),
+                hashlib.sha256(canonical_request.encode()).hexdigest(),
+            ]
+        )
+        key = _hmac(f"AWS4{self.secret_key}".encode(), f"{now:%Y%m%d}")
+        for part in (self.region, "s3", "aws4_request"):
+            key = _hmac(key, part)
+        return hmac.new(key, string_to_sign.encode(), hashlib.sha256).hexdigest()
+
+    @staticmethod
+    def _canonical_query(query: dict[str, str]) -> str:
+        return "&".join(f"{_quote(name)}={_quote(value)}" for name, value in sorted(query.items()))
+
+    def _signed_request(
+        self,
+        method: str,
+        key: str,
+        query: Optional[dict[str, str]] = None,
+        payload_hash: str = UNSIGNED_PAYLOAD,
+        extra_headers: Optional[dict[str, str]] = None,
+    ) -> tuple[URL, dict[str, str]]:
+        now = datetime.now(timezone.utc)
+        query = query or {}
+        host = urlsplit(self.endpoint_url).netloc
+        headers = {
+            "host": host,
+            "x-amz-content-sha256": payload_hash,
+            "x-amz-date": f"{now:%Y%m%dT%H%M%SZ}",
+            **{name.lower(): value for name, value in (extra_headers or {}).items()},
+        }
+        signed_headers = ";".join(sorted(headers))
+        canonical_request = "\n".join(
+            [
+                method,
+                self._canonical_uri(key),
+                self._canonical_query(query),
+                "".join(f"{name}:{headers[name].strip()}\n" for name in sorted(headers)),
+                signed_headers,
+                payload_hash,
+            ]
+        )
+        headers["Authorization"] = (
+            f"AWS4-HMAC-SHA256 Credential={self.access_key}/{self._scope(now)}, "
+            f"SignedHeaders={signed_headers}, Signature={self._signature(now, canonical_request)}"
+        )
+        del headers["host"]
+        url = self.endpoint_url + self._canonical_uri(key)
+        if query:
+            url += "?" + self._canonical_query(query)
+        return URL(url, encoded=True), headers
+
+    def presigned_url(self, key: str, expires: int) -> str:
+        """Return a GET URL that third parties (e.g. fal) can fetch directly."""
+        now = datetime.now(timezone.utc)
+        query = {
+            "X-Amz-Algorithm": "AWS4-HMAC-SHA256",
+            "X-Amz-Credential": f"{self.access_key}/{self._scope(now)}",
+            "X-Amz-Date": f"{now:%Y%m%dT%H%M%SZ}",
+            "X-Amz-Expires": str(expires),
+            "X-Amz-SignedHeaders": "host",
+        }
+        host = urlsplit(self.public_endpoint_url).netloc
+        canonical_request = "\n".join(
+            [
+                "GET",
+                self._canonical_uri(key),
+                self._canonical_query(query),
+                f"host:{host}\n",
+                "host",
+                UNSIGNED_PAYLOAD,
+            ]
+        )
+        query["X-Amz-Signature"] = self._signature(now, canonical_request)
+        return f"{self.public_endpoint_url}{self._canonical_uri(key)}?{self._canonical_query(query)}"
+
+    # -- requests ---------------------------------------------------------
+
+    def _client(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT))
+        return self._session
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+
+    async def exists(self, key: str) -> bool:
+        url, headers = self._signed_request("HEAD", key)
+        async with self._client().head(url, headers=headers) as response:
+            if response.status == 404:
+                return False
+            response.raise_for_status()
+            return True
+
+    async def put_bytes(self, key: str, data: bytes, content_type: str = "application/octet-stream") -> None:
+        url, headers = self._signed_request(
+            "PUT",
+            key,
+            payload_hash=hashlib.sha256(data).hexdigest(),
+            extra_headers={"Content-Type": content_type},
+        )
+        async with self._client().put(url, data=data, headers=headers) as response:
+            response.raise_for_status()
+
+    async def get_bytes(self, key: str) -> Optional[bytes]:
+        url, headers = self._signed_request("GET", key)
+        async with self._client().get(url, headers=headers) as response:
+            if response.status == 404:
+                return None
+            response.raise_for_status()
+            return await response.read()
+
+    async def download_to(self, key: str, path: Path) -> bool:
+        """Stream an object into ``path``; return False if it does not exist."""
+        url, headers = self._signed_request("GET", key)
+        async with self._client().get(url, headers=headers) as response:
+            if response.status == 404:
+                return False
+            response.raise_for_status()
+            await write_stream(path, response.content.iter_chunked(CHUNK_SIZE))
+        return True
+
+    async def delete(self, key: str) -> None:
+        url, headers = self._signed_request("DELETE", key)
+        async with self._client().delete(url, headers=headers) as response:
+            if response.status != 404:
+                response.raise_for_status()
+
+    async def upload_file(self, key: str, path: Path) -> None:
+        """Upload a local file, switching to multipart uploads for large files."""
+        size = (await run_io(path.stat)).st_size
+        if size < MULTIPART_THRESHOLD:
+            await self._put_file(key, path, size)
+        else:
+            await self._multipart_upload(key, path)
+
+    async def _put_file(self, key: str, path: Path, size: int) -> None:
+        stream = await run_io(open, path, "rb")
+        try:
+
+            async def _chunks():
+                while chunk := await run_io(stream.read, CHUNK_SIZE):
+                    yield chunk
+
+            url, headers = self._signed_request("PUT", key, extra_headers={"Content-Length": str(size)})
+            async with self._client().put(url, data=_chunks(), headers=headers) as response:
+                response.raise_for_status()
+        finally:
+            await run_io(stream.close)
+
+    async def _multipart_upload(self, key: str, path: Path) -> None:
+        url, headers = self._signed_request("POST", key, query={"uploads": ""})
+        async with self._client().post(url, headers=headers) as response:
+            response.raise_for_status()
+            upload_id = _xml_text(await response.read(), "UploadId")
+
+        etags: list[str] = []
+        stream = await run_io(open, path, "rb")
+        try:
+            while part := await run_io(stream.read, MULTIPART_PART_SIZE):
+                query = {"partNumber": str(len(etags) + 1), "uploadId": upload_id}
+                url, headers = self._signed_request(
+                    "PUT", key, query=query, payload_hash=hashlib.sha256(part).hexdigest()
+                )
+                async with self._client().put(url, data=part, headers=headers) as response:
+                    response.raise_for_status()
+                    etags.append(response.headers["ETag"])
+        except BaseException:
+            await run_io(stream.close)
+            url, headers = self._signed_request("DELETE", key, query={"uploadId": upload_id})
+            async with self._client().delete(url, headers=headers):
+                pass
+            raise
+        await run_io(stream.close)
+
+        body = "".join(
+            f"<Part><PartNumber>{number}</PartNumber><ETag>{etag}</ETag></Part>"
+            for number, etag in enumerate(etags, start=1)
+        )
+        payload = f"<CompleteMultipartUpload>{body}</CompleteMultipartUpload>".encode()
+        url, headers = self._signed_request(
+            "POST", key, query={"uploadId": upload_id}, payload_hash=hashlib.sha256(payload).hexdigest()
+        )
+        async with self._client().post(url, data=payload, headers=headers) as response:
+            response.raise_for_status()
+            # S3 may report a failed completion with HTTP 200 and an <Error> body.
+            if b"<Error>" in await response.read():
+                raise RuntimeError(f"S3 multipart upload of {key} failed")
+
+
+def _xml_text(payload: bytes, tag: str) -> str:
+    root = ElementTree.fromstring(payload)
+    for element in root.iter():
+        if element.tag.rsplit("}", maxsplit=1)[-1] == tag and element.text:
+            return element.text
+    raise RuntimeError(f"S3 response has no <{tag}>")
@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+import time
+from dataclasses import dataclass
+from typing import Protocol
+
+from .redis import get_redis
+
+COMPACT_INTERVAL = 60.0
+
+_REDIS_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local cost = tonumber(ARGV[4])
+local state = redis.call("hmget", KEYS[1], "tokens", "ts")
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= cost then
+    tokens = tokens - cost
+else
+    wait = (cost - tokens) / rate
+end
+redis.call("hset", KEYS[1], "tokens", tokens, "ts", now)
+redis.call("pexpire", KEYS[1], math.ceil(capacity / rate * 1000) + 1000)
+return tostring(wait)
+"""
+
+
+@dataclass(frozen=True, slots=True)
+class Limit:
+    """Refill ``rate`` tokens per second up to ``burst`` tokens."""
+
+    rate: float
+    burst: float
+
+    @classmethod
+    def parse(cls, raw: str) -> "Limit":
+        """Parse ``"<rate>/<burst>"``, e.g. ``"0.5/4"``."""
+        rate, _, burst = raw.strip().partition("/")
+        limit = cls(rate=float(rate), burst=float(burst or rate))
+        if limit.rate <= 0 or limit.burst <= 0:
+            raise ValueError(f"Rate limit must be positive: {raw!r}")
+        return limit
+
+    def share(self, parts: int) -> "Limit":
+        """Split the limit between ``parts`` processes that enforce it separately."""
+        if parts <= 1:
+            return self
+        return Limit(rate=self.rate / parts, burst=max(1.0, self.burst / parts))
+
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated_at")
+
+    def __init__(self, limit: Limit, now: float | None = None) -> None:
+        self.rate = limit.rate
+        self.capacity = limit.burst
+        self.tokens = limit.burst
+        self.updated_at = time.monotonic() if now is None else now
+
+    def _refill(self, now: float) -> None:
+        elapsed = max(0.0, now - self.updated_at)
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+        self.updated_at = now
+
+    def consume(self, cost: float = 1.0, now: float | None = None) -> float:
+        """Take ``cost`` tokens; return 0 on success or seconds until enough tokens."""
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return 0.0
+        return (cost - self.tokens) / self.rate
+
+    def is_idle(self, now: float) -> bool:
+        """Return True when the bucket has refilled completely and can be dropped."""
+        return self.tokens + (now - self.updated_at) * self.rate >= self.capacity
+
+
+class BucketStore(Protocol):
+    async def hit(self, key: str, limit: Limit, cost: float = 1.0) -> float:
+        """Consume tokens from the bucket ``key``; return the retry delay or 0."""
+
+
+class MemoryBucketStore:
+    """Token buckets kept in a dict; idle buckets are compacted periodically."""
+
+    def __init__(self, compact_interval: float = COMPACT_INTERVAL) -> None:
+        self._buckets: dict[str, TokenBucket] = {}
+        self._compact_interval = compact_interval
+        self._compacted_at = time.monotonic()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    async def hit(self, key: str, limit: Limit, cost: float = 1.0) -> float:
+        now = time.monotonic()
+        if now - self._compacted_at >= self._compact_interval:
+            self.compact(now)
+
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(limit, now)
+        return bucket.consume(cost, now)
+
+    def compact(self, now: float | None = None) -> None:
+        now = time.monotonic() if now is None else now
+        self._buckets = {key: bucket for key, bucket in self._buckets.items() if not bucket.is_idle(now)}
+        self._compacted_at = now
+
+
+class RedisBucketStore:
+    """Token buckets shared between processes, evaluated atomically in Redis."""
+
+    def __init__(self, prefix: str = "hypetuning:bucket:") -> None:
+        self._redis = get_redis()
+        self._prefix = prefix
+
+    async def hit(self, key: str, limit: Limit, cost: float = 1.0) -> float:
+        wait = await self._redis.eval(
+            _REDIS_BUCKET_SCRIPT,
+            1,
+            self._prefix + key,
+            limit.rate,
+            limit.burst,
+            time.time(),
+            cost,
+        )
+        return float(wait)
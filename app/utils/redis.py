@@ -0,0 +1,25 @@
+from __future__ import annotations
+
+from typing import Any
+
+from bot.config import get_settings
+
+_client: Any = None
+
+
+def get_redis() -> Any:
+    """Return a shared ``redis.asyncio`` client built from ``REDIS_URL``."""
+    global _client
+    if _client is not None:
+        return _client
+
+    settings = get_settings()
+    if not settings.redis_url:
+        raise RuntimeError("REDIS_URL is not configured")
+    try:
+        from redis.asyncio import Redis
+    except ImportError as exc:  # pragma: no cover - optional dependency
+        raise RuntimeError("REDIS_URL is set but the 'redis' package is not installed") from exc
+
+    _client = Redis.from_url(settings.redis_url, decode_responses=True)
+    return _client
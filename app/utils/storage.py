@@ -1,14 +1,32 @@
 from __future__ import annotations
 
+import asyncio
+import logging
 from pathlib import Path
-from typing import Literal, Optional
+from typing import AsyncIterable, Literal, Optional, get_args
 
-UploadKind = Literal["car", "wheel", "result", "video"]
+from aiogram import Bot
 
-_STORAGE_ROOT = Path(__file__).resolve().parent.parent / "storage"
-_USER_UPLOADS_ROOT = _STORAGE_ROOT / "user_uploads"
+from bot.config import get_settings
+from ..services import video_cache_service
+from ..services.tracing import span
+from .blob_store import BlobPointer, BlobStore
+from .object_storage import S3Backend
+from .fileio import CHUNK_SIZE, iter_chunks, read_bytes, remove, run_io, write_bytes, write_stream  # noqa: F401
 
-_FILENAMES = {
+logger = logging.getLogger(__name__)
+_settings = get_settings()
+
+# "result" is the provider original; "preview" is its Telegram-sized copy.
+UploadKind = Literal["car", "wheel", "result", "preview", "video"]
+
+_STORAGE_ROOT = Path(_settings.storage_dir or Path(__file__).resolve().parent.parent / "storage")
+_LEGACY_UPLOADS_ROOT = _STORAGE_ROOT / "user_uploads"
+
+DOWNLOAD_TIMEOUT = 60
+DAY = 24 * 60 * 60
+
+_LEGACY_FILENAMES = {
     "car": "car.jpg",
     "wheel": "wheel.jpg",
     "result": "result.jpg",
@@ -16,25 +34,148 @@ _FILENAMES = {
 }
 
 
-def _user_directory(user_id: int, ensure_exists: bool = True) -> Path:
-    directory = _USER_UPLOADS_ROOT / str(user_id)
-    if ensure_exists:
-        directory.mkdir(parents=True, exist_ok=True)
-    return directory
+def _build_store() -> BlobStore:
+    if _settings.storage_backend == "s3":
+        remote = S3Backend(
+            endpoint_url=_settings.s3_endpoint_url,
+            bucket=_settings.s3_bucket,
+            access_key=_settings.s3_access_key,
+            secret_key=_settings.s3_secret_key,
+            region=_settings.s3_region,
+            public_endpoint_url=_settings.s3_public_endpoint_url,
+        )
+        return BlobStore(_STORAGE_ROOT / "cache", remote=remote)
+    return BlobStore(_STORAGE_ROOT)
+
+
+_store = _build_store()
+
+
+def get_blob_store() -> BlobStore:
+    return _store
+
 
+async def close_storage() -> None:
+    """Close the object storage client; call once in-flight uploads have drained."""
+    if _store.remote is not None:
+        await _store.remote.close()
 
-def build_upload_path(user_id: int, kind: UploadKind, *, ensure_dir: bool = True) -> Path:
-    try:
-        filename = _FILENAMES[kind]
-    except KeyError as exc:
-        raise ValueError(f"Unsupported upload kind: {kind}") from exc
 
-    directory = _user_directory(user_id, ensure_exists=ensure_dir)
-    return directory / filename
+def _check_kind(kind: str) -> None:
+    if kind not in get_args(UploadKind):
+        raise ValueError(f"Unsupported upload kind: {kind}")
 
 
-def read_upload_bytes(user_id: int, kind: UploadKind) -> Optional[bytes]:
-    path = build_upload_path(user_id, kind, ensure_dir=False)
-    if not path.exists():
+async def _adopt_legacy_upload(user_id: int, kind: UploadKind) -> Optional[BlobPointer]:
+    """Move a file from the old ``user_uploads/<id>/`` layout into the blob store."""
+    if kind not in _LEGACY_FILENAMES:
         return None
-    return path.read_bytes()
+    legacy_path = _LEGACY_UPLOADS_ROOT / str(user_id) / _LEGACY_FILENAMES[kind]
+    data = await read_bytes(legacy_path)
+    if data is None:
+        return None
+    pointer, _ = await _store.put_bytes(data)
+    await _store.set_pointer(user_id, kind, pointer)
+    await remove(legacy_path)
+    return pointer
+
+
+async def _current_pointer(user_id: int, kind: UploadKind) -> Optional[BlobPointer]:
+    _check_kind(kind)
+    return await _store.get_pointer(user_id, kind) or await _adopt_legacy_upload(user_id, kind)
+
+
+async def upload_path(user_id: int, kind: UploadKind) -> Optional[Path]:
+    """Return the on-disk file currently stored for the user's upload slot."""
+    pointer = await _current_pointer(user_id, kind)
+    if pointer is None:
+        return None
+    return await _store.get_path(pointer.digest)
+
+
+async def upload_digest(user_id: int, kind: UploadKind) -> Optional[str]:
+    """Content hash of the user's upload slot, usable as a cache key."""
+    pointer = await _current_pointer(user_id, kind)
+    return pointer.digest if pointer else None
+
+
+async def blob_path(digest: str) -> Optional[Path]:
+    """Return the file for a digest recorded earlier, if it is still stored."""
+    return await _store.get_path(digest)
+
+
+async def presigned_upload_url(user_id: int, kind: UploadKind) -> Optional[str]:
+    """Return a URL providers can fetch directly, or None for local storage."""
+    _check_kind(kind)
+    if _store.remote is None:
+        return None
+    pointer = await _store.get_pointer(user_id, kind)
+    if pointer is None:
+        return None
+    return await _store.presigned_url(pointer.digest, _settings.s3_presign_ttl)
+
+
+async def read_upload_bytes(user_id: int, kind: UploadKind) -> Optional[bytes]:
+    with span("storage read", **{"upload.kind": kind}):
+        path = await upload_path(user_id, kind)
+        if path is None:
+            return None
+        return await read_bytes(path)
+
+
+async def write_upload_bytes(user_id: int, kind: UploadKind, data: bytes) -> Path:
+    _check_kind(kind)
+    pointer, path = await _store.put_bytes(data)
+    await _store.set_pointer(user_id, kind, pointer)
+    # An identical blob may already be stored as its compressed copy.
+    return path
+
+
+async def write_upload_stream(user_id: int, kind: UploadKind, chunks: AsyncIterable[bytes]) -> Path:
+    _check_kind(kind)
+    with span("storage write", **{"upload.kind": kind}):
+        pointer, path = await _store.put_stream(chunks)
+        await _store.set_pointer(user_id, kind, pointer)
+    return path
+
+
+async def delete_upload(user_id: int, kind: UploadKind) -> None:
+    """Detach the slot; the blob itself is collected by maintenance once unreferenced."""
+    _check_kind(kind)
+    await _store.set_pointer(user_id, kind, None)
+
+
+async def download_upload(bot: Bot, file_id: str, user_id: int, kind: UploadKind) -> Path:
+    """Stream a Telegram file straight into the user's upload slot."""
+    with span("telegram download", **{"upload.kind": kind}):
+        file = await bot.get_file(file_id)
+        api = bot.session.api
+        if api.is_local:
+            chunks = iter_chunks(Path(api.wrap_local_file.to_local(file.file_path)))
+        else:
+            url = api.file_url(bot.token, file.file_path)
+            chunks = bot.session.stream_content(url=url, timeout=DOWNLOAD_TIMEOUT, chunk_size=CHUNK_SIZE)
+        return await write_upload_stream(user_id, kind, chunks)
+
+
+async def run_maintenance() -> None:
+    """Background loop enforcing the storage quota, max age and cold compression."""
+    while True:
+        try:
+            # A full scan can take a while; keep it off the shared I/O pool.
+            quota_mb = _settings.storage_cache_mb if _store.remote else _settings.storage_quota_mb
+            # Cached fly-bys outlive the "video" pointer a new result removes.
+            pinned = frozenset(await video_cache_service.cached_digests())
+            report = await asyncio.to_thread(
+                _store.evict,
+                quota_bytes=quota_mb * 1024 * 1024,
+                max_age=_settings.storage_max_age_days * DAY,
+                cold_after=_settings.storage_cold_after_days * DAY,
+                pinned=pinned,
+            )
+            report.pointers_removed = await _store.drop_pointers(report.evicted)
+            await video_cache_service.forget_digests(set(report.evicted))
+            logger.info("Storage maintenance: %s", report)
+        except Exception:  # pragma: no cover - maintenance must never stop
+            logger.exception("Storage maintenance failed")
+        await asyncio.sleep(_settings.storage_maintenance_interval)
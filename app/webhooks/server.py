@@ -1,31 +1,54 @@
 from __future__ import annotations
 
 import logging
+import socket
 from typing import Optional
 
 from aiohttp import web
 
 from bot.config import get_settings
+from ..services import metrics
+from ..services.lifecycle import worker_port
 from .yookassa import register_yookassa_routes
 
 logger = logging.getLogger(__name__)
 
 
+async def metrics_handler(request: web.Request) -> web.Response:
+    return web.Response(text=metrics.render(), headers={"Content-Type": metrics.CONTENT_TYPE})
+
+
 async def start_webhook_server() -> Optional[web.AppRunner]:
+    """Serve YooKassa callbacks and ``/metrics``; ``None`` when neither is enabled.
+
+    Supervisor workers share this port, so a scrape would reach a random one;
+    they serve ``/metrics`` only on their own worker port.
+    """
     settings = get_settings()
-    if not settings.use_yookassa:
-        return None
-    if not settings.yookassa_webhook_secret or not settings.yookassa_shop_id:
-        logger.warning("YooKassa webhook credentials are missing; webhook server disabled.")
+    yookassa = settings.use_yookassa
+    if yookassa and (not settings.yookassa_webhook_secret or not settings.yookassa_shop_id):
+        logger.warning("YooKassa webhook credentials are missing; YooKassa webhooks disabled.")
+        yookassa = False
+    serve_metrics = settings.metrics_enabled and worker_port() is None
+    if not yookassa and not serve_metrics:
         return None
 
     app = web.Application()
-    register_yookassa_routes(app)
+    if yookassa:
+        register_yookassa_routes(app)
+    if serve_metrics:
+        app.router.add_get("/metrics", metrics_handler)
 
     runner = web.AppRunner(app)
     await runner.setup()
     try:
-        site = web.TCPSite(runner, host=settings.webhook_host, port=settings.webhook_port)
+        # SO_REUSEPORT lets the next process bind while this one drains on reload.
+        site = web.TCPSite(
+            runner,
+            host=settings.webhook_host,
+            port=settings.webhook_port,
+            reuse_port=hasattr(socket, "SO_REUSEPORT"),
+        )
         await site.start()
         logger.info("Webhook server started on %s:%s", settings.webhook_host, settings.webhook_port)
         return runner
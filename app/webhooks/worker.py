@@ -0,0 +1,62 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Optional
+
+from aiogram import Bot, Dispatcher
+from aiohttp import web
+
+from bot.config import get_settings
+from ..services.health import snapshot
+from ..services.lifecycle import get_lifecycle
+from .server import metrics_handler
+
+logger = logging.getLogger(__name__)
+
+_update_tasks: set[asyncio.Task] = set()
+
+
+async def _health(request: web.Request) -> web.Response:
+    report = snapshot(get_lifecycle())
+    return web.json_response(report, status=200 if report["status"] == "ok" else 503)
+
+
+def _update_handler(dp: Dispatcher, bot: Bot):
+    async def _update(request: web.Request) -> web.Response:
+        if get_lifecycle().draining:
+            # The supervisor keeps the update and retries with the next process.
+            return web.json_response({"ok": False, "error": "draining"}, status=503)
+        payload = await request.json()
+        task = asyncio.create_task(dp.feed_raw_update(bot, payload))
+        _update_tasks.add(task)
+        task.add_done_callback(_update_tasks.discard)
+        return web.json_response({"ok": True})
+
+    return _update
+
+
+async def start_worker_server(
+    port: int,
+    *,
+    dp: Optional[Dispatcher] = None,
+    bot: Optional[Bot] = None,
+) -> web.AppRunner:
+    """Serve ``/health``, ``/metrics`` and, under the supervisor, ``/update`` on localhost.
+
+    Supervisor workers do not poll Telegram themselves: the supervisor polls
+    once and posts every update to the worker that owns the user.
+    """
+    app = web.Application()
+    app.router.add_get("/health", _health)
+    if get_settings().metrics_enabled:
+        app.router.add_get("/metrics", metrics_handler)
+    if dp is not None and bot is not None:
+        app.router.add_post("/update", _update_handler(dp, bot))
+
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host="127.0.0.1", port=port)
+    await site.start()
+    logger.info("Worker server listening on 127.0.0.1:%s", port)
+    return runner
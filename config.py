@@ -34,20 +34,86 @@ class Settings:
     fal_api_key: str
     admin_ids: List[int]
     support_contact: str
+    fal_queue_url: str = "https://queue.fal.run"
+    telegram_api_base: str = "https://api.telegram.org"
+    worker_id: str = "main"
+    shutdown_grace: int = 120
+    workers: int = 1
+    worker_base_port: int = 8100
+    health_port: int = 0
+    health_max_lag: float = 5.0
+    loop_block_threshold: float = 0.25
+    loop_debug: bool = False
     free_credits: int = 1
     payments_currency: str = "RUB"
     required_channel: str = ""
     required_channel_link: str = ""
+    subscription_cache_ttl: int = 600
+    subscription_negative_ttl: int = 30
     yookassa_shop_id: str = ""
     yookassa_secret_key: str = ""
     yookassa_return_url: str = ""
     yookassa_webhook_secret: str = ""
+    yookassa_api_url: str = "https://api.yookassa.ru/v3"
     yookassa_send_receipt: bool = False
     yookassa_tax_system_code: int | None = None
     yookassa_receipt_vat_code: int = 1
     yookassa_receipt_email: str = ""
     webhook_host: str = "127.0.0.1"
     webhook_port: int = 8080
+    metrics_enabled: bool = True
+    tracing_enabled: bool = True
+    trace_sample_rate: float = 0.05
+    trace_slow_seconds: float = 60.0
+    trace_file: str = "logs/traces.jsonl"
+    log_level: str = "INFO"
+    log_format: str = "text"
+    log_max_mb: int = 50
+    log_backup_count: int = 10
+    log_rotate_hours: float = 24.0
+    log_max_length: int = 2000
+    log_rate_limit: str = "20/100"
+    ai_output_format: str = "jpeg"
+    image_workers: int = 2
+    telegram_photo_max_side: int = 2560
+    image_concurrency: int = 8
+    video_concurrency: int = 3
+    admission_max_wait_free: int = 180
+    admission_max_wait_paid: int = 900
+    video_cache_ttl_days: int = 90
+    video_cache_charge_hits: bool = False
+    ffmpeg_binary: str = "ffmpeg"
+    ffprobe_binary: str = "ffprobe"
+    ffmpeg_workers: int = 2
+    video_bitrate: str = ""
+    storage_io_workers: int = 4
+    storage_quota_mb: int = 20480
+    storage_max_age_days: int = 30
+    storage_cold_after_days: int = 3
+    storage_maintenance_interval: int = 3600
+    storage_backend: str = "local"
+    storage_dir: str = ""
+    storage_cache_mb: int = 2048
+    s3_endpoint_url: str = ""
+    s3_public_endpoint_url: str = ""
+    s3_bucket: str = ""
+    s3_access_key: str = ""
+    s3_secret_key: str = ""
+    s3_region: str = "us-east-1"
+    s3_presign_ttl: int = 3600
+    redis_url: str = ""
+    action_lock_backend: str = "memory"
+    action_lock_ttl: int = 1200
+    throttle_enabled: bool = True
+    throttle_backend: str = "memory"
+    throttle_global_limit: str = "50/200"
+    throttle_user_limit: str = "1/8"
+    throttle_group_limits: str = "menu=0.3/3,fitting=1/6,payments=0.5/4,admin=1/10"
+    broadcast_rate: float = 25.0
+    broadcast_concurrency: int = 10
+    outbound_global_limit: str = "30/30"
+    outbound_chat_limit: str = "1/3"
+    outbound_group_chat_limit: str = "0.33/5"
 
     @property
     def payment_packages(self) -> List[PaymentPackage]:
@@ -75,19 +141,87 @@ def get_settings() -> Settings:
         database_url=os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./bot.db"),
         ai_provider=os.getenv("AI_PROVIDER", "gemini"),
         fal_api_key=os.getenv("FAL_API_KEY", os.getenv("AI_API_KEY", "")),
+        fal_queue_url=os.getenv("FAL_QUEUE_URL", "https://queue.fal.run"),
+        telegram_api_base=os.getenv("TELEGRAM_API_BASE", "https://api.telegram.org"),
+        worker_id=os.getenv("WORKER_ID", "main"),
+        shutdown_grace=int(os.getenv("SHUTDOWN_GRACE", "120")),
+        workers=max(1, int(os.getenv("WORKERS", "1"))),
+        worker_base_port=int(os.getenv("WORKER_BASE_PORT", "8100")),
+        health_port=int(os.getenv("HEALTH_PORT", "0")),
+        health_max_lag=float(os.getenv("HEALTH_MAX_LAG", "5")),
+        loop_block_threshold=float(os.getenv("LOOP_BLOCK_THRESHOLD", "0.25")),
+        loop_debug=os.getenv("LOOP_DEBUG", "false").lower() in {"1", "true", "yes"},
         admin_ids=admin_ids,
         support_contact=os.getenv("SUPPORT_CONTACT", "@username"),
         free_credits=int(os.getenv("FREE_CREDITS", "1")),
         required_channel=os.getenv("REQUIRED_CHANNEL", ""),
         required_channel_link=os.getenv("REQUIRED_CHANNEL_LINK", ""),
+        subscription_cache_ttl=int(os.getenv("SUBSCRIPTION_CACHE_TTL", "600")),
+        subscription_negative_ttl=int(os.getenv("SUBSCRIPTION_NEGATIVE_TTL", "30")),
         yookassa_shop_id=os.getenv("YOOKASSA_SHOP_ID", ""),
         yookassa_secret_key=os.getenv("YOOKASSA_SECRET_KEY", ""),
         yookassa_return_url=os.getenv("YOOKASSA_RETURN_URL", ""),
         yookassa_webhook_secret=os.getenv("YOOKASSA_WEBHOOK_SECRET", ""),
+        yookassa_api_url=os.getenv("YOOKASSA_API_URL", "https://api.yookassa.ru/v3"),
         yookassa_send_receipt=os.getenv("YOOKASSA_SEND_RECEIPT", "false").lower() in {"1", "true", "yes"},
         yookassa_tax_system_code=int(os.getenv("YOOKASSA_TAX_SYSTEM_CODE")) if os.getenv("YOOKASSA_TAX_SYSTEM_CODE") else None,
         yookassa_receipt_vat_code=int(os.getenv("YOOKASSA_RECEIPT_VAT_CODE", "1")),
         yookassa_receipt_email=os.getenv("YOOKASSA_RECEIPT_EMAIL", ""),
         webhook_host=os.getenv("WEBHOOK_HOST", "127.0.0.1"),
         webhook_port=int(os.getenv("WEBHOOK_PORT", "8080")),
+        metrics_enabled=os.getenv("METRICS_ENABLED", "true").lower() in {"1", "true", "yes"},
+        tracing_enabled=os.getenv("TRACING_ENABLED", "true").lower() in {"1", "true", "yes"},
+        trace_sample_rate=float(os.getenv("TRACE_SAMPLE_RATE", "0.05")),
+        trace_slow_seconds=float(os.getenv("TRACE_SLOW_SECONDS", "60")),
+        trace_file=os.getenv("TRACE_FILE", "logs/traces.jsonl"),
+        log_level=os.getenv("LOG_LEVEL", "INFO"),
+        log_format=os.getenv("LOG_FORMAT", "text").lower(),
+        log_max_mb=int(os.getenv("LOG_MAX_MB", "50")),
+        log_backup_count=int(os.getenv("LOG_BACKUP_COUNT", "10")),
+        log_rotate_hours=float(os.getenv("LOG_ROTATE_HOURS", "24")),
+        log_max_length=int(os.getenv("LOG_MAX_LENGTH", "2000")),
+        log_rate_limit=os.getenv("LOG_RATE_LIMIT", "20/100"),
+        ai_output_format=os.getenv("AI_OUTPUT_FORMAT", "jpeg").lower(),
+        image_workers=int(os.getenv("IMAGE_WORKERS", "2")),
+        telegram_photo_max_side=int(os.getenv("TELEGRAM_PHOTO_MAX_SIDE", "2560")),
+        image_concurrency=int(os.getenv("IMAGE_CONCURRENCY", "8")),
+        video_concurrency=int(os.getenv("VIDEO_CONCURRENCY", "3")),
+        admission_max_wait_free=int(os.getenv("ADMISSION_MAX_WAIT_FREE", "180")),
+        admission_max_wait_paid=int(os.getenv("ADMISSION_MAX_WAIT_PAID", "900")),
+        video_cache_ttl_days=int(os.getenv("VIDEO_CACHE_TTL_DAYS", "90")),
+        video_cache_charge_hits=os.getenv("VIDEO_CACHE_CHARGE_HITS", "false").lower() in {"1", "true", "yes"},
+        ffmpeg_binary=os.getenv("FFMPEG_BINARY", "ffmpeg"),
+        ffprobe_binary=os.getenv("FFPROBE_BINARY", "ffprobe"),
+        ffmpeg_workers=int(os.getenv("FFMPEG_WORKERS", "2")),
+        video_bitrate=os.getenv("VIDEO_BITRATE", ""),
+        storage_io_workers=int(os.getenv("STORAGE_IO_WORKERS", "4")),
+        storage_quota_mb=int(os.getenv("STORAGE_QUOTA_MB", "20480")),
+        storage_max_age_days=int(os.getenv("STORAGE_MAX_AGE_DAYS", "30")),
+        storage_cold_after_days=int(os.getenv("STORAGE_COLD_AFTER_DAYS", "3")),
+        storage_maintenance_interval=int(os.getenv("STORAGE_MAINTENANCE_INTERVAL", "3600")),
+        storage_backend=os.getenv("STORAGE_BACKEND", "local").lower(),
+        storage_dir=os.getenv("STORAGE_DIR", ""),
+        storage_cache_mb=int(os.getenv("STORAGE_CACHE_MB", "2048")),
+        s3_endpoint_url=os.getenv("S3_ENDPOINT_URL", ""),
+        s3_public_endpoint_url=os.getenv("S3_PUBLIC_ENDPOINT_URL", ""),
+        s3_bucket=os.getenv("S3_BUCKET", ""),
+        s3_access_key=os.getenv("S3_ACCESS_KEY", ""),
+        s3_secret_key=os.getenv("S3_SECRET_KEY", ""),
+        s3_region=os.getenv("S3_REGION", "us-east-1"),
+        s3_presign_ttl=int(os.getenv("S3_PRESIGN_TTL", "3600")),
+        redis_url=os.getenv("REDIS_URL", ""),
+        action_lock_backend=os.getenv("ACTION_LOCK_BACKEND", "memory").lower(),
+        action_lock_ttl=int(os.getenv("ACTION_LOCK_TTL", "1200")),
+        throttle_enabled=os.getenv("THROTTLE_ENABLED", "true").lower() in {"1", "true", "yes"},
+        throttle_backend=os.getenv("THROTTLE_BACKEND", "memory").lower(),
+        throttle_global_limit=os.getenv("THROTTLE_GLOBAL_LIMIT", "50/200"),
+        throttle_user_limit=os.getenv("THROTTLE_USER_LIMIT", "1/8"),
+        throttle_group_limits=os.getenv(
+            "THROTTLE_GROUP_LIMITS", "menu=0.3/3,fitting=1/6,payments=0.5/4,admin=1/10"
+        ),
+        broadcast_rate=float(os.getenv("BROADCAST_RATE", "25")),
+        broadcast_concurrency=int(os.getenv("BROADCAST_CONCURRENCY", "10")),
+        outbound_global_limit=os.getenv("OUTBOUND_GLOBAL_LIMIT", "30/30"),
+        outbound_chat_limit=os.getenv("OUTBOUND_CHAT_LIMIT", "1/3"),
+        outbound_group_chat_limit=os.getenv("OUTBOUND_GROUP_CHAT_LIMIT", "0.33/5"),
     )
@@ -0,0 +1,158 @@
+from __future__ import annotations
+
+import asyncio
+import math
+import random
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Optional
+
+from aiohttp import web
+
+
+@dataclass(frozen=True, slots=True)
+class Latency:
+    """Log-normal latency: ``median`` seconds, spread ``sigma`` (0 means constant)."""
+
+    median: float
+    sigma: float = 0.0
+
+    @classmethod
+    def parse(cls, raw: str) -> "Latency":
+        """Parse ``"<median>[:<sigma>]"``, e.g. ``"20:0.4"``."""
+        median, _, sigma = raw.partition(":")
+        latency = cls(median=float(median), sigma=float(sigma or 0))
+        if latency.median < 0 or latency.sigma < 0:
+            raise ValueError(f"Latency must not be negative: {raw!r}")
+        return latency
+
+    def sample(self) -> float:
+        if not self.sigma:
+            return self.median
+        return random.lognormvariate(math.log(max(self.median, 1e-3)), self.sigma)
+
+
+@dataclass(slots=True)
+class Request:
+    request_id: str
+    kind: str
+    status: str = "IN_QUEUE"
+    failed: bool = False
+    cancelled: bool = False
+    task: Optional[asyncio.Task] = None
+
+
+@dataclass
+class FakeFal:
+    """fal queue API stand-in with configurable latency and failure rates.
+
+    Requests to models with ``video`` in the name take ``video_latency``,
+    others ``image_latency``; ``error_rate`` of them complete with an error.
+    With ``concurrency`` set, requests beyond it wait ``IN_QUEUE`` like on
+    fal. Every image result is a distinct JPEG so the bot's caches by
+    content digest do not turn later users into cache hits.
+    """
+
+    base_url: str
+    image: bytes
+    video: bytes
+    image_latency: Latency
+    video_latency: Latency
+    error_rate: float = 0.0
+    concurrency: int = 0
+    counts: Counter = field(default_factory=Counter)
+    _requests: dict[str, Request] = field(default_factory=dict)
+    _slots: Optional[asyncio.Semaphore] = None
+    _next_id: int = 1
+
+    def app(self) -> web.Application:
+        if self.concurrency:
+            self._slots = asyncio.Semaphore(self.concurrency)
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_get("/requests/{request_id}/status", self._status)
+        app.router.add_put("/requests/{request_id}/cancel", self._cancel)
+        app.router.add_get("/requests/{request_id}", self._result)
+        app.router.add_get("/files/{request_id}/{name}", self._file)
+        app.router.add_post("/{model:.+}", self._submit)
+        return app
+
+    async def close(self) -> None:
+        tasks = [request.task for request in self._requests.values() if request.task and not request.task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _submit(self, request: web.Request) -> web.Response:
+        await request.read()
+        request_id = f"req-{self._next_id}"
+        self._next_id += 1
+        kind = "video" if "video" in request.match_info["model"] else "image"
+        job = Request(request_id, kind, failed=random.random() < self.error_rate)
+        job.task = asyncio.create_task(self._process(job))
+        self._requests[request_id] = job
+        self.counts[f"{kind}_submitted"] += 1
+        url = f"{self.base_url}/requests/{request_id}"
+        return web.json_response(
+            {
+                "request_id": request_id,
+                "status_url": f"{url}/status",
+                "response_url": url,
+                "cancel_url": f"{url}/cancel",
+            }
+        )
+
+    async def _process(self, job: Request) -> None:
+        latency = self.video_latency if job.kind == "video" else self.image_latency
+        if self._slots is None:
+            job.status = "IN_PROGRESS"
+            await asyncio.sleep(latency.sample())
+        else:
+            async with self._slots:
+                job.status = "IN_PROGRESS"
+                await asyncio.sleep(latency.sample())
+        job.status = "COMPLETED"
+        self.counts[f"{job.kind}_{'failed' if job.failed else 'completed'}"] += 1
+
+    def _get(self, request: web.Request) -> Request:
+        job = self._requests.get(request.match_info["request_id"])
+        if job is None:
+            raise web.HTTPNotFound()
+        return job
+
+    async def _status(self, request: web.Request) -> web.Response:
+        return web.json_response({"status": self._get(request).status})
+
+    async def _cancel(self, request: web.Request) -> web.Response:
+        job = self._get(request)
+        if job.status == "COMPLETED":
+            raise web.HTTPBadRequest()
+        job.cancelled = True
+        job.task.cancel()
+        job.status = "COMPLETED"
+        self.counts[f"{job.kind}_cancelled"] += 1
+        return web.json_response({"status": "CANCELLATION_REQUESTED"})
+
+    async def _result(self, request: web.Request) -> web.Response:
+        job = self._get(request)
+        if job.status != "COMPLETED":
+            raise web.HTTPBadRequest(text="Request is still in progress")
+        if job.failed or job.cancelled:
+            return web.json_response({"detail": "Simulated provider error"}, status=500)
+        url = f"{self.base_url}/files/{job.request_id}"
+        if job.kind == "video":
+            return web.json_response({"video": {"url": f"{url}/flyby.mp4"}})
+        return web.json_response({"images": [{"url": f"{url}/result.jpg"}]})
+
+    async def _file(self, request: web.Request) -> web.Response:
+        job = self._get(request)
+        self._requests.pop(job.request_id, None)
+        if job.kind == "video":
+            return web.Response(body=self.video, content_type="video/mp4")
+        return web.Response(body=_tag_jpeg(self.image, job.request_id), content_type="image/jpeg")
+
+
+def _tag_jpeg(image: bytes, tag: str) -> bytes:
+    """Insert a JPEG comment segment, changing the digest but not the picture."""
+    comment = f"loadtest {tag} {time.time_ns()}".encode()
+    return image[:2] + b"\xff\xfe" + (len(comment) + 2).to_bytes(2, "big") + comment + image[2:]
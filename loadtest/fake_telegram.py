@@ -0,0 +1,196 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import time
+from collections import Counter, deque
+from dataclasses import dataclass, field
+from typing import Any
+
+from aiohttp import web
+
+BOT_USER = {"id": 100000, "is_bot": True, "first_name": "Hypetuning", "username": "hypetuning_loadtest_bot"}
+# Methods whose result is the sent message.
+SEND_METHODS = {
+    "sendMessage",
+    "sendPhoto",
+    "sendVideo",
+    "sendDocument",
+    "sendAnimation",
+    "sendInvoice",
+    "copyMessage",
+}
+MAX_UPDATES = 100
+
+
+@dataclass(slots=True)
+class Sent:
+    """A Bot API call addressed to a user: a message or a callback answer."""
+
+    method: str
+    params: dict[str, Any]
+    at: float
+
+    @property
+    def text(self) -> str:
+        return str(self.params.get("text") or self.params.get("caption") or "")
+
+    def callback_data(self) -> list[str]:
+        """``callback_data`` of the inline keyboard attached to the message."""
+        markup = self.params.get("reply_markup") or {}
+        return [
+            button["callback_data"]
+            for row in markup.get("inline_keyboard", [])
+            for button in row
+            if button.get("callback_data")
+        ]
+
+
+@dataclass
+class FakeTelegram:
+    """Bot API stand-in: queues updates for ``getUpdates`` and records what the bot sends.
+
+    Every send is answered immediately with a plausible result (photos and
+    videos get file ids), uploads are read in full so their size is counted,
+    and files requested with ``getFile`` are served from ``photos``.
+    """
+
+    photos: dict[str, bytes]
+    calls: Counter = field(default_factory=Counter)
+    upload_bytes: int = 0
+    polled: asyncio.Event = field(default_factory=asyncio.Event)
+    _updates: deque = field(default_factory=deque)
+    _next_update_id: int = 1
+    _has_updates: asyncio.Event = field(default_factory=asyncio.Event)
+    _inboxes: dict[int, asyncio.Queue] = field(default_factory=dict)
+    _callbacks: dict[str, int] = field(default_factory=dict)
+    _next_message_id: int = 1
+
+    def app(self) -> web.Application:
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_route("*", "/bot{token}/{method}", self._handle)
+        app.router.add_get("/file/bot{token}/{path:.+}", self._file)
+        return app
+
+    def inbox(self, chat_id: int) -> asyncio.Queue:
+        queue = self._inboxes.get(chat_id)
+        if queue is None:
+            queue = self._inboxes[chat_id] = asyncio.Queue()
+        return queue
+
+    def push(self, update: dict[str, Any]) -> int:
+        update_id = self._next_update_id
+        self._next_update_id += 1
+        update["update_id"] = update_id
+        callback = update.get("callback_query")
+        if callback is not None:
+            self._callbacks[callback["id"]] = callback["from"]["id"]
+        self._updates.append(update)
+        self._has_updates.set()
+        return update_id
+
+    async def _params(self, request: web.Request) -> dict[str, Any]:
+        params: dict[str, Any] = dict(request.query)
+        if request.content_type == "application/json":
+            params.update(await request.json())
+        elif request.can_read_body:
+            for key, value in (await request.post()).items():
+                if isinstance(value, web.FileField):
+                    self.upload_bytes += len(value.file.read())
+                    params[key] = f"attach://{value.filename}"
+                else:
+                    params[key] = _decode(value)
+        return params
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        params = await self._params(request)
+        self.calls[method] += 1
+        if method == "getUpdates":
+            result: Any = await self._get_updates(params)
+        elif method == "getMe":
+            result = BOT_USER
+        elif method == "getFile":
+            file_id = str(params["file_id"])
+            size = len(self.photos.get(file_id.split("-", 1)[0], b""))
+            result = {
+                "file_id": file_id,
+                "file_unique_id": file_id,
+                "file_size": size,
+                "file_path": f"photos/{file_id}",
+            }
+        elif method == "getChatMember":
+            result = {"status": "member", "user": {"id": int(params["user_id"]), "is_bot": False, "first_name": "User"}}
+        elif method in SEND_METHODS:
+            result = self._send(method, params)
+        elif method == "answerCallbackQuery":
+            user_id = self._callbacks.pop(str(params.get("callback_query_id")), None)
+            if user_id is not None:
+                self.inbox(user_id).put_nowait(Sent(method, params, time.monotonic()))
+            result = True
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    async def _get_updates(self, params: dict[str, Any]) -> list[dict[str, Any]]:
+        self.polled.set()
+        offset = int(params.get("offset") or 0)
+        while self._updates and self._updates[0]["update_id"] < offset:
+            self._updates.popleft()
+        if not self._updates:
+            self._has_updates.clear()
+            timeout = float(params.get("timeout") or 0)
+            if timeout:
+                try:
+                    await asyncio.wait_for(self._has_updates.wait(), timeout)
+                except asyncio.TimeoutError:
+                    return []
+        limit = min(int(params.get("limit") or MAX_UPDATES), MAX_UPDATES)
+        return [self._updates[index] for index in range(min(limit, len(self._updates)))]
+
+    def _send(self, method: str, params: dict[str, Any]) -> dict[str, Any]:
+        chat_id = int(params["chat_id"])
+        message_id = self._next_message_id
+        self._next_message_id += 1
+        message: dict[str, Any] = {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": BOT_USER,
+        }
+        file_id = f"sent-{message_id}"
+        if method == "sendPhoto":
+            message["photo"] = [{"file_id": file_id, "file_unique_id": file_id, "width": 1280, "height": 960}]
+        elif method == "sendVideo":
+            message["video"] = {
+                "file_id": file_id,
+                "file_unique_id": file_id,
+                "width": 1280,
+                "height": 720,
+                "duration": 5,
+            }
+        elif method in {"sendDocument", "sendAnimation"}:
+            message["document"] = {"file_id": file_id, "file_unique_id": file_id}
+        if "text" in params:
+            message["text"] = str(params["text"])
+        if "caption" in params:
+            message["caption"] = str(params["caption"])
+        self.inbox(chat_id).put_nowait(Sent(method, params, time.monotonic()))
+        return message
+
+    async def _file(self, request: web.Request) -> web.Response:
+        file_id = request.match_info["path"].rsplit("/", 1)[-1]
+        data = self.photos.get(file_id.split("-", 1)[0])
+        if data is None:
+            raise web.HTTPNotFound()
+        return web.Response(body=data, content_type="image/jpeg")
+
+
+def _decode(value: str) -> Any:
+    # aiogram sends objects (keyboards, entities) as JSON strings in form fields.
+    if value[:1] in {"{", "["}:
+        try:
+            return json.loads(value)
+        except ValueError:
+            return value
+    return value
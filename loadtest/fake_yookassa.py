@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+import asyncio
+import base64
+import logging
+import random
+import time
+import uuid
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Optional
+
+import aiohttp
+from aiohttp import web
+
+from .fake_fal import Latency
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_ATTEMPTS = 5
+WEBHOOK_TIMEOUT = 10
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec="milliseconds").replace("+00:00", "Z")
+
+
+@dataclass
+class FakeYooKassa:
+    """YooKassa API stand-in that "pays" every payment and notifies the bot.
+
+    ``POST /v3/payments`` creates a pending payment; after ``pay_latency``
+    it turns ``succeeded`` (or ``canceled`` for ``fail_rate`` of them) and
+    the ``payment.*`` notification is posted to ``webhook_url`` with the
+    shop's Basic auth, retried like YooKassa does when the bot does not
+    answer 200. :meth:`settled` waits for that notification to be accepted.
+    """
+
+    webhook_url: str
+    shop_id: str
+    webhook_secret: str
+    pay_latency: Latency
+    fail_rate: float = 0.0
+    counts: Counter = field(default_factory=Counter)
+    webhook_seconds: list[float] = field(default_factory=list)
+    _payments: dict[str, dict[str, Any]] = field(default_factory=dict)
+    _settled: dict[str, asyncio.Event] = field(default_factory=dict)
+    _tasks: set[asyncio.Task] = field(default_factory=set)
+    _session: Optional[aiohttp.ClientSession] = None
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/v3/payments", self._create)
+        app.router.add_get("/v3/payments/{payment_id}", self._get)
+        return app
+
+    async def close(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._session is not None:
+            await self._session.close()
+
+    async def settled(self, payment_id: str, timeout: float) -> Optional[str]:
+        """Final status of the payment once the bot accepted its webhook; ``None`` on timeout."""
+        event = self._settled.setdefault(payment_id, asyncio.Event())
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        return self._payments[payment_id]["status"]
+
+    async def _create(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        payment_id = str(uuid.uuid4())
+        payment = {
+            "id": payment_id,
+            "status": "pending",
+            "paid": False,
+            "amount": body["amount"],
+            "description": body.get("description", ""),
+            "metadata": body.get("metadata") or {},
+            "recipient": {"account_id": self.shop_id, "gateway_id": "loadtest"},
+            "created_at": _now(),
+            "confirmation": {"type": "redirect", "confirmation_url": f"https://yoomoney.test/checkout/{payment_id}"},
+            "test": True,
+            "refundable": False,
+        }
+        self._payments[payment_id] = payment
+        self._settled.setdefault(payment_id, asyncio.Event())
+        self.counts["created"] += 1
+        task = asyncio.create_task(self._pay(payment))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return web.json_response(payment)
+
+    async def _get(self, request: web.Request) -> web.Response:
+        payment = self._payments.get(request.match_info["payment_id"])
+        if payment is None:
+            return web.json_response({"type": "error", "code": "not_found"}, status=404)
+        return web.json_response(payment)
+
+    async def _pay(self, payment: dict[str, Any]) -> None:
+        await asyncio.sleep(self.pay_latency.sample())
+        if random.random() < self.fail_rate:
+            payment["status"] = "canceled"
+            payment["cancellation_details"] = {"party": "yoo_money", "reason": "general_decline"}
+        else:
+            payment.update(status="succeeded", paid=True, captured_at=_now(), income_amount=payment["amount"])
+        self.counts[payment["status"]] += 1
+        event = "payment.succeeded" if payment["status"] == "succeeded" else "payment.canceled"
+        await self._notify(event, payment)
+        self._settled[payment["id"]].set()
+
+    async def _notify(self, event: str, payment: dict[str, Any]) -> None:
+        if self._session is None:
+            self._session = aiohttp.ClientSession()
+        token = base64.b64encode(f"{self.shop_id}:{self.webhook_secret}".encode()).decode()
+        body = {"type": "notification", "event": event, "object": payment}
+        for attempt in range(1, WEBHOOK_ATTEMPTS + 1):
+            started = time.monotonic()
+            try:
+                async with self._session.post(
+                    self.webhook_url,
+                    json=body,
+                    headers={"Authorization": f"Basic {token}"},
+                    timeout=aiohttp.ClientTimeout(total=WEBHOOK_TIMEOUT),
+                ) as response:
+                    if response.status == 200:
+                        self.webhook_seconds.append(time.monotonic() - started)
+                        self.counts["webhooks_delivered"] += 1
+                        return
+                    logger.warning("Webhook for %s answered HTTP %s", payment["id"], response.status)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
+                logger.warning("Webhook for %s failed: %s", payment["id"], exc)
+            self.counts["webhook_retries"] += 1
+            await asyncio.sleep(attempt)
+        self.counts["webhooks_lost"] += 1
@@ -0,0 +1,368 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import re
+import shutil
+import signal
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from contextlib import suppress
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Optional
+
+import aiohttp
+from aiohttp import web
+
+from .fake_fal import FakeFal, Latency
+from .fake_telegram import FakeTelegram
+from .fake_yookassa import FakeYooKassa
+from .scenario import QUANTILES, STEPS, Stats, VirtualUser, percentile
+
+BOT_DIR = Path(__file__).resolve().parents[1]
+PROJECT_ROOT = BOT_DIR.parent
+BOT_TOKEN = "100000:loadtest"
+SHOP_ID = "loadtest"
+SECRET = "loadtest"
+STARTUP_TIMEOUT = 120.0
+SCRAPE_INTERVAL = 2.0
+SCRAPE_TIMEOUT = 5.0
+
+logger = logging.getLogger("bot.loadtest")
+
+_SAMPLE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(.*)\})?\s+(\S+)$')
+_LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+def parse_metrics(text: str) -> dict[tuple[str, tuple[tuple[str, str], ...]], float]:
+    """Samples of a Prometheus text exposition keyed by name and sorted labels."""
+    samples = {}
+    for line in text.splitlines():
+        match = _SAMPLE.match(line)
+        if match is None:
+            continue
+        name, labels, value = match.groups()
+        samples[(name, tuple(sorted(_LABEL.findall(labels or ""))))] = float(value)
+    return samples
+
+
+def _total(samples: dict, name: str, **labels: str) -> float:
+    wanted = set(labels.items())
+    return sum(value for (sample, keys), value in samples.items() if sample == name and wanted <= set(keys))
+
+
+@dataclass
+class Scraper:
+    """Polls ``/metrics`` of every bot process and keeps peaks and the last values."""
+
+    urls: list[str]
+    last: dict[str, dict] = field(default_factory=dict)
+    first: dict[str, dict] = field(default_factory=dict)
+    peak_rss: dict[str, float] = field(default_factory=lambda: defaultdict(float))
+    peak_buffers: float = 0.0
+    peak_lag: float = 0.0
+
+    async def scrape(self, session: aiohttp.ClientSession) -> None:
+        buffers = 0.0
+        for url in self.urls:
+            try:
+                async with session.get(url, timeout=aiohttp.ClientTimeout(total=SCRAPE_TIMEOUT)) as response:
+                    samples = parse_metrics(await response.text())
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                continue
+            self.first.setdefault(url, samples)
+            self.last[url] = samples
+            self.peak_rss[url] = max(self.peak_rss[url], _total(samples, "bot_process_memory_bytes", kind="rss"))
+            self.peak_lag = max(self.peak_lag, _total(samples, "bot_loop_lag_seconds", quantile="0.99"))
+            buffers += _total(samples, "bot_buffer_bytes")
+        self.peak_buffers = max(self.peak_buffers, buffers)
+
+    async def run(self, session: aiohttp.ClientSession) -> None:
+        while True:
+            await self.scrape(session)
+            await asyncio.sleep(SCRAPE_INTERVAL)
+
+    def delta(self, name: str, **labels: str) -> float:
+        return sum(
+            _total(self.last[url], name, **labels) - _total(self.first.get(url, {}), name, **labels)
+            for url in self.last
+        )
+
+    def statements(self) -> dict[str, float]:
+        counts: dict[str, float] = defaultdict(float)
+        for url, samples in self.last.items():
+            before = self.first.get(url, {})
+            for (name, labels), value in samples.items():
+                if name == "bot_db_query_seconds_count":
+                    counts[dict(labels).get("statement", "")] += value - before.get((name, labels), 0.0)
+        return dict(sorted(((name, count) for name, count in counts.items() if count), key=lambda item: -item[1]))
+
+
+def _bot_env(args: argparse.Namespace, workdir: Path) -> dict[str, str]:
+    env = os.environ.copy()
+    env.setdefault("PYTHONPATH", str(PROJECT_ROOT))
+    env.setdefault("SHUTDOWN_GRACE", "30")
+    env.setdefault("LOG_LEVEL", "WARNING")
+    # Anything that could reach real users, payments or shared state is forced off: the shell may
+    # export production settings. Another database or Redis is used only when passed explicitly.
+    env.update(
+        {
+            "DATABASE_URL": args.database_url or f"sqlite+aiosqlite:///{workdir / 'loadtest.db'}",
+            "REDIS_URL": args.redis_url or "",
+            "REQUIRED_CHANNEL": "",
+            "ADMIN_IDS": "",
+            "STORAGE_BACKEND": "local",
+            "BOT_TOKEN": BOT_TOKEN,
+            "WORKER_ID": "loadtest",
+            "TELEGRAM_API_BASE": f"http://127.0.0.1:{args.telegram_port}",
+            "AI_PROVIDER": "nanobanana",
+            "FAL_API_KEY": "loadtest",
+            "FAL_QUEUE_URL": f"http://127.0.0.1:{args.fal_port}",
+            "PAYMENTS_PROVIDER": "yookassa",
+            "YOOKASSA_SHOP_ID": SHOP_ID,
+            "YOOKASSA_SECRET_KEY": SECRET,
+            "YOOKASSA_WEBHOOK_SECRET": SECRET,
+            "YOOKASSA_RETURN_URL": f"http://127.0.0.1:{args.webhook_port}/yookassa/return",
+            "YOOKASSA_API_URL": f"http://127.0.0.1:{args.yookassa_port}/v3",
+            "YOOKASSA_SEND_RECEIPT": "false",
+            "WEBHOOK_HOST": "127.0.0.1",
+            "WEBHOOK_PORT": str(args.webhook_port),
+            "WORKER_BASE_PORT": str(args.worker_base_port),
+            "METRICS_ENABLED": "true",
+            "STORAGE_DIR": str(workdir / "storage"),
+            "TRACE_FILE": str(workdir / "traces.jsonl"),
+        }
+    )
+    return env
+
+
+async def _serve(app: web.Application, port: int) -> web.AppRunner:
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    return runner
+
+
+async def _stop(process: asyncio.subprocess.Process, timeout: float) -> None:
+    if process.returncode is not None:
+        return
+    with suppress(ProcessLookupError):
+        process.send_signal(signal.SIGTERM)
+    try:
+        await asyncio.wait_for(process.wait(), timeout)
+    except asyncio.TimeoutError:
+        logger.warning("Bot PID %s did not stop in %ss; killing it", process.pid, timeout)
+        with suppress(ProcessLookupError):
+            process.kill()
+        await process.wait()
+
+
+async def _spawn_users(args: argparse.Namespace, telegram: FakeTelegram, yookassa: FakeYooKassa, stats: Stats) -> None:
+    tasks = []
+    for index in range(args.users):
+        user = VirtualUser(
+            user_id=args.first_user_id + index,
+            telegram=telegram,
+            yookassa=yookassa,
+            stats=stats,
+            step_timeout=args.step_timeout,
+            think=args.think,
+        )
+        tasks.append(asyncio.create_task(user.run(), name=f"user-{user.user_id}"))
+        await asyncio.sleep(1 / args.arrival_rate)
+    await asyncio.gather(*tasks)
+
+
+async def run(args: argparse.Namespace) -> dict[str, Any]:
+    """Start the fakes and the bot, walk ``args.users`` users through the scenario and report.
+
+    The bot runs as a separate process (``bot.main``, or ``bot.supervisor``
+    with ``--workers``) exactly as in production, with its own database and
+    storage in a temporary directory; DB round trips, memory and event-loop
+    lag come from its ``/metrics``.
+    """
+    workdir = Path(tempfile.mkdtemp(prefix="loadtest-"))
+    photos = {"car": Path(args.car_photo).read_bytes(), "wheel": Path(args.wheel_photo).read_bytes()}
+    telegram = FakeTelegram(photos=photos)
+    fal = FakeFal(
+        base_url=f"http://127.0.0.1:{args.fal_port}",
+        image=Path(args.result_image).read_bytes(),
+        video=Path(args.result_video).read_bytes(),
+        image_latency=Latency.parse(args.image_latency),
+        video_latency=Latency.parse(args.video_latency),
+        error_rate=args.fal_error_rate,
+        concurrency=args.fal_concurrency,
+    )
+    yookassa = FakeYooKassa(
+        webhook_url=f"http://127.0.0.1:{args.webhook_port}/yookassa/webhook",
+        shop_id=SHOP_ID,
+        webhook_secret=SECRET,
+        pay_latency=Latency.parse(args.pay_latency),
+        fail_rate=args.payment_fail_rate,
+    )
+    runners = [
+        await _serve(telegram.app(), args.telegram_port),
+        await _serve(fal.app(), args.fal_port),
+        await _serve(yookassa.app(), args.yookassa_port),
+    ]
+    if args.workers > 1:
+        command = ["-m", "bot.supervisor", "--workers", str(args.workers)]
+        metrics_urls = [f"http://127.0.0.1:{args.worker_base_port + slot}/metrics" for slot in range(args.workers)]
+    else:
+        command = ["-m", "bot.main"]
+        metrics_urls = [f"http://127.0.0.1:{args.webhook_port}/metrics"]
+    bot_log = (workdir / "bot.out").open("wb")
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, *command, cwd=str(PROJECT_ROOT), env=_bot_env(args, workdir), stdout=bot_log, stderr=bot_log
+    )
+    logger.info("Bot started with PID %s; output in %s", process.pid, workdir / "bot.out")
+    stats = Stats()
+    scraper = Scraper(metrics_urls)
+    session = aiohttp.ClientSession()
+    scrape_task: Optional[asyncio.Task] = None
+    try:
+        try:
+            await asyncio.wait_for(telegram.polled.wait(), STARTUP_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise RuntimeError(f"The bot did not start polling in {STARTUP_TIMEOUT:.0f}s; see {workdir / 'bot.out'}")
+        await scraper.scrape(session)
+        scrape_task = asyncio.create_task(scraper.run(session))
+        logger.info("Bot is polling; starting %s users at %s/s", args.users, args.arrival_rate)
+        started = time.monotonic()
+        await _spawn_users(args, telegram, yookassa, stats)
+        elapsed = time.monotonic() - started
+        scrape_task.cancel()
+        with suppress(asyncio.CancelledError):
+            await scrape_task
+        await scraper.scrape(session)
+    finally:
+        if scrape_task is not None:
+            scrape_task.cancel()
+        await session.close()
+        await _stop(process, timeout=120)
+        bot_log.close()
+        await fal.close()
+        await yookassa.close()
+        for runner in runners:
+            await runner.cleanup()
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    db_queries = scraper.delta("bot_db_query_seconds_count")
+    return {
+        "users": args.users,
+        "workers": args.workers,
+        "seconds": round(elapsed, 1),
+        "scenarios_per_second": round(stats.users_finished / elapsed, 3) if elapsed else 0.0,
+        **stats.summary(),
+        "db": {
+            "queries": int(db_queries),
+            "queries_per_user": round(db_queries / stats.users_started, 1) if stats.users_started else None,
+            "by_statement": {name: int(count) for name, count in scraper.statements().items()},
+        },
+        "memory": {
+            "peak_rss_mb": [round(value / 2**20, 1) for value in scraper.peak_rss.values()],
+            "peak_buffers_mb": round(scraper.peak_buffers / 2**20, 1),
+        },
+        "loop": {
+            "peak_lag_p99": round(scraper.peak_lag, 3),
+            "blocked": int(scraper.delta("bot_loop_blocked_total")),
+        },
+        "telegram": {
+            "calls": dict(telegram.calls.most_common()),
+            "upload_mb": round(telegram.upload_bytes / 2**20, 1),
+            "retries": int(scraper.delta("bot_telegram_retries_total")),
+        },
+        "fal": dict(fal.counts),
+        "yookassa": {
+            **dict(yookassa.counts),
+            "webhook_p99": round(percentile(yookassa.webhook_seconds, 0.99), 3),
+        },
+        "workdir": str(workdir) if args.keep else None,
+    }
+
+
+def _quantile_columns(row: dict[str, Any]) -> str:
+    return "".join(f"{row[f'p{round(q * 100)}']:>9.2f}" for q in QUANTILES)
+
+
+def format_report(report: dict[str, Any]) -> str:
+    """Plain-text table of the report returned by :func:`run`."""
+    header = "".join(f"{f'p{round(q * 100)}':>9}" for q in QUANTILES)
+    lines = [
+        f"{report['users']} users, {report['workers']} worker(s): {report['seconds']}s, "
+        f"{report['users_finished']} finished, {report['scenarios_per_second']} scenarios/s",
+        "",
+        f"{'step':<14}{'ok':>7}{'other':>24}{header}{'max':>9}",
+    ]
+    for step in STEPS:
+        row = report["steps"].get(step)
+        if row is None:
+            continue
+        outcomes = dict(row["outcomes"])
+        ok = outcomes.pop("ok", 0)
+        other = ", ".join(f"{name} {count}" for name, count in outcomes.items())
+        lines.append(f"{step:<14}{ok:>7}{other:>24}{_quantile_columns(row)}{row['max']:>9.2f}")
+    lines.append(f"{'scenario':<14}{report['users_finished']:>7}{'':>24}{_quantile_columns(report['scenario'])}")
+    db = report["db"]
+    top = ", ".join(f"{name} {count}" for name, count in list(db["by_statement"].items())[:5])
+    lines += [
+        "",
+        f"DB: {db['queries']} statements, {db['queries_per_user']} per user ({top})",
+        f"Memory: peak RSS {report['memory']['peak_rss_mb']} MB, "
+        f"peak image/video buffers {report['memory']['peak_buffers_mb']} MB",
+        f"Event loop: peak p99 lag {report['loop']['peak_lag_p99']}s, {report['loop']['blocked']} blocking callbacks",
+        f"Telegram: {sum(report['telegram']['calls'].values())} calls, {report['telegram']['upload_mb']} MB uploaded, "
+        f"{report['telegram']['retries']} flood-control retries",
+        f"fal: {report['fal']}",
+        f"YooKassa: {report['yookassa']}",
+    ]
+    if report["workdir"]:
+        lines.append(f"Bot output, database and storage kept in {report['workdir']}")
+    return "\n".join(lines)
+
+
+def main(argv: list[str] | None = None) -> int:
+    assets = BOT_DIR / "app" / "assets"
+    parser = argparse.ArgumentParser(
+        description="Load-test the bot offline against fake Telegram, fal and YooKassa servers."
+    )
+    parser.add_argument("--users", type=int, default=100, help="Simulated users (default: 100).")
+    parser.add_argument("--arrival-rate", type=float, default=5.0, help="New users per second (default: 5).")
+    parser.add_argument("--think", type=float, default=1.0, help="Mean pause between a user's steps, s (default: 1).")
+    parser.add_argument("--step-timeout", type=float, default=900.0, help="Give up on a step after this, s.")
+    parser.add_argument("--workers", type=int, default=1, help="Run the supervisor with this many workers.")
+    parser.add_argument("--image-latency", default="20:0.4", help="fal image latency, '<median s>[:<sigma>]'.")
+    parser.add_argument("--video-latency", default="60:0.3", help="fal video latency, '<median s>[:<sigma>]'.")
+    parser.add_argument("--fal-error-rate", type=float, default=0.02, help="Share of fal requests that fail.")
+    parser.add_argument("--fal-concurrency", type=int, default=0, help="fal requests run at once (0: unlimited).")
+    parser.add_argument("--pay-latency", default="5:0.5", help="Time until a payment succeeds, '<median s>[:<sigma>]'.")
+    parser.add_argument("--payment-fail-rate", type=float, default=0.0, help="Share of payments that are declined.")
+    parser.add_argument("--car-photo", default=str(BOT_DIR / "lenarst.jpg"))
+    parser.add_argument("--wheel-photo", default=str(BOT_DIR / "defki.jpg"))
+    parser.add_argument("--result-image", default=str(BOT_DIR / "app" / "2025-10-15 20.36.04.jpg"))
+    parser.add_argument("--result-video", default=str(assets / "IMG_4498.MP4"))
+    parser.add_argument("--first-user-id", type=int, default=7_000_000_000)
+    parser.add_argument("--telegram-port", type=int, default=18081)
+    parser.add_argument("--fal-port", type=int, default=18082)
+    parser.add_argument("--yookassa-port", type=int, default=18083)
+    parser.add_argument("--webhook-port", type=int, default=18080)
+    parser.add_argument("--worker-base-port", type=int, default=18100)
+    parser.add_argument("--database-url", help="Use this database instead of a temporary SQLite file.")
+    parser.add_argument("--redis-url", help="Use this Redis for FSM state and rate limits (default: none).")
+    parser.add_argument("--json", dest="json_path", help="Also write the report as JSON to this file.")
+    parser.add_argument("--keep", action="store_true", help="Keep the bot output, database and storage.")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(name)s: %(message)s")
+    report = asyncio.run(run(args))
+    print(format_report(report))
+    if args.json_path:
+        Path(args.json_path).write_text(json.dumps(report, ensure_ascii=False, indent=2))
+    return 0
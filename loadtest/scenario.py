@@ -0,0 +1,218 @@
+from __future__ import annotations
+
+import asyncio
+import random
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Optional
+
+from .fake_telegram import FakeTelegram, Sent
+from .fake_yookassa import FakeYooKassa
+
+# The order steps are reported in.
+STEPS = ("start", "fitting", "car_photo", "wheel_photo", "generate", "shop", "payment_link", "payment", "video")
+QUANTILES = (0.5, 0.95, 0.99)
+PAYMENT_PACKAGE = "three"
+
+Matcher = Callable[[Sent], bool]
+
+
+def _text(*fragments: str) -> Matcher:
+    return lambda sent: sent.method != "answerCallbackQuery" and any(part in sent.text for part in fragments)
+
+
+def _media(*methods: str) -> Matcher:
+    return lambda sent: sent.method in methods
+
+
+def _callback_answer(*fragments: str) -> Matcher:
+    return lambda sent: sent.method == "answerCallbackQuery" and any(part in sent.text for part in fragments)
+
+
+# Replies that end a step early whatever step it is.
+THROTTLED = _text("Слишком много запросов")
+REJECTED = _text("Сейчас большая очередь", "Бот перезапускается")
+
+
+def percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+@dataclass
+class Stats:
+    """Latencies per step (successful ones) and outcome counts per step."""
+
+    latencies: dict[str, list[float]] = field(default_factory=lambda: defaultdict(list))
+    outcomes: dict[str, dict[str, int]] = field(default_factory=lambda: defaultdict(lambda: defaultdict(int)))
+    scenarios: list[float] = field(default_factory=list)
+    users_started: int = 0
+    users_finished: int = 0
+
+    def record(self, step: str, outcome: str, seconds: float) -> None:
+        self.outcomes[step][outcome] += 1
+        if outcome == "ok":
+            self.latencies[step].append(seconds)
+
+    def summary(self) -> dict[str, Any]:
+        steps = {}
+        for step in STEPS:
+            if step not in self.outcomes:
+                continue
+            values = self.latencies.get(step, [])
+            steps[step] = {
+                "outcomes": dict(self.outcomes[step]),
+                **{f"p{round(q * 100)}": round(percentile(values, q), 3) for q in QUANTILES},
+                "max": round(max(values, default=0.0), 3),
+            }
+        return {
+            "users_started": self.users_started,
+            "users_finished": self.users_finished,
+            "scenario": {f"p{round(q * 100)}": round(percentile(self.scenarios, q), 3) for q in QUANTILES},
+            "steps": steps,
+        }
+
+
+class StepFailed(Exception):
+    pass
+
+
+@dataclass
+class VirtualUser:
+    """One simulated user walking start → fitting → payment → video.
+
+    A step is timed from the update being queued for the bot until the reply
+    that completes it arrives; the scenario stops at the first step that was
+    rejected, throttled, failed or timed out.
+    """
+
+    user_id: int
+    telegram: FakeTelegram
+    yookassa: FakeYooKassa
+    stats: Stats
+    step_timeout: float
+    think: float
+    _message_id: int = 0
+
+    async def run(self) -> None:
+        self.stats.users_started += 1
+        started = time.monotonic()
+        try:
+            await self._step("start", self._message(text="/start"), ok=_media("sendVideo", "sendPhoto"))
+            await self._step(
+                "fitting",
+                self._message(text="🚗 Использовать бесплатную примерку"),
+                ok=_text("Шаг 1 из 2"),
+            )
+            await self._step("car_photo", self._message(photo="car"), ok=_text("Шаг 2 из 2"))
+            await self._step("wheel_photo", self._message(photo="wheel"), ok=_text("Всё готово"))
+            await self._step(
+                "generate",
+                self._message(text="✅ Запустить"),
+                ok=_text("Готово! Вот примерка"),
+                failed=_text("не удалось получить результат", "Не удалось обработать фото", "Фото не нашёл"),
+            )
+            await self._step("shop", self._message(text="💳 Купить генерации"), ok=_text("Выбери подходящий пакет"))
+            link = await self._step(
+                "payment_link",
+                self._callback(f"shop:{PAYMENT_PACKAGE}"),
+                ok=_text("Ссылка на оплату готова"),
+                failed=_callback_answer("Не удалось создать платёж", "не настроен", "Тариф не найден"),
+            )
+            payment_id = next(
+                data.rpartition(":")[2] for data in link.callback_data() if data.startswith("payment:check:")
+            )
+            # The user pays on YooKassa's page meanwhile; the bot learns about it from the webhook.
+            status = await self.yookassa.settled(payment_id, self.step_timeout)
+            if status != "succeeded":
+                self.stats.record("payment", "failed" if status else "timeout", 0.0)
+                raise StepFailed("payment")
+            await self._step(
+                "payment",
+                self._callback(f"payment:check:{payment_id}"),
+                ok=_text("Оплата прошла"),
+                failed=_callback_answer("Не удалось проверить", "Платёж не найден", "Текущий статус"),
+            )
+            await self._step(
+                "video",
+                self._message(text="🎬 Видео-пролёт"),
+                ok=_media("sendVideo"),
+                failed=_text("Не удалось сделать видео", "нужно 3 генерации", "Пока нет свежей примерки"),
+            )
+        except StepFailed:
+            return
+        self.stats.users_finished += 1
+        self.stats.scenarios.append(time.monotonic() - started)
+
+    async def _step(
+        self,
+        name: str,
+        update: dict[str, Any],
+        *,
+        ok: Matcher,
+        failed: Optional[Matcher] = None,
+    ) -> Sent:
+        await asyncio.sleep(random.uniform(0.5, 1.5) * self.think)
+        inbox = self.telegram.inbox(self.user_id)
+        # Late replies to an earlier step must not complete this one.
+        while not inbox.empty():
+            inbox.get_nowait()
+        started = time.monotonic()
+        self.telegram.push(update)
+        deadline = started + self.step_timeout
+        while True:
+            try:
+                sent = await asyncio.wait_for(inbox.get(), max(0.0, deadline - time.monotonic()))
+            except asyncio.TimeoutError:
+                self.stats.record(name, "timeout", self.step_timeout)
+                raise StepFailed(name)
+            if ok(sent):
+                self.stats.record(name, "ok", sent.at - started)
+                return sent
+            for outcome, matcher in (("throttled", THROTTLED), ("rejected", REJECTED), ("failed", failed)):
+                if matcher is not None and matcher(sent):
+                    self.stats.record(name, outcome, sent.at - started)
+                    raise StepFailed(name)
+
+    def _user(self) -> dict[str, Any]:
+        return {"id": self.user_id, "is_bot": False, "first_name": "Load", "username": f"load{self.user_id}"}
+
+    def _chat(self) -> dict[str, Any]:
+        return {"id": self.user_id, "type": "private", "first_name": "Load"}
+
+    def _message(self, *, text: Optional[str] = None, photo: Optional[str] = None) -> dict[str, Any]:
+        self._message_id += 1
+        message: dict[str, Any] = {
+            "message_id": self._message_id,
+            "date": int(time.time()),
+            "chat": self._chat(),
+            "from": self._user(),
+        }
+        if text is not None:
+            message["text"] = text
+            if text.startswith("/"):
+                message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text)}]
+        if photo is not None:
+            file_id = f"{photo}-{self.user_id}-{self._message_id}"
+            message["photo"] = [{"file_id": file_id, "file_unique_id": file_id, "width": 1280, "height": 960}]
+        return {"message": message}
+
+    def _callback(self, data: str) -> dict[str, Any]:
+        self._message_id += 1
+        return {
+            "callback_query": {
+                "id": f"{self.user_id}-{self._message_id}",
+                "from": self._user(),
+                "chat_instance": str(self.user_id),
+                "data": data,
+                "message": {
+                    "message_id": self._message_id,
+                    "date": int(time.time()),
+                    "chat": self._chat(),
+                    "text": "…",
+                },
+            }
+        }
@@ -2,63 +2,173 @@ from __future__ import annotations
 
 import asyncio
 import logging
+from contextlib import suppress
 from pathlib import Path
 
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.enums import ParseMode
+from aiogram.fsm.storage.base import BaseStorage
 from aiogram.fsm.storage.memory import MemoryStorage
 
 from bot.config import get_settings
-from bot.app.database import create_db_and_tables
+from bot.app.database import close_db, create_db_and_tables
 from bot.app.handlers import admin, fitting, menu, payments, start
+from bot.app.middlewares.action_lock import ActionLockMiddleware
+from bot.app.middlewares.metrics import HandlerMetricsMiddleware, TelegramMetricsMiddleware
+from bot.app.middlewares.outbound import get_outbound_scheduler
+from bot.app.middlewares.throttling import Throttler
+from bot.app.middlewares.tracing import (
+    HandlerTracingMiddleware,
+    TelegramTracingMiddleware,
+    UpdateTracingMiddleware,
+)
+from bot.app.services import job_service
+from bot.app.services.broadcast_service import get_broadcast_service
+from bot.app.services.health import get_loop_monitor
+from bot.app.services.lifecycle import Lifecycle, get_lifecycle, handoff_pid, is_primary_worker, worker_port
+from bot.app.utils.logs import setup_logging
+from bot.app.utils.media import preload_banners
+from bot.app.utils.storage import close_storage, run_maintenance
 from bot.app.webhooks.server import start_webhook_server
+from bot.app.webhooks.worker import start_worker_server
 from bot.utils.loop import PipeEventLoopPolicy
 
 logger = logging.getLogger(__name__)
 
+OUTBOUND_FLUSH_TIMEOUT = 10.0
+HANDLER_ROUTERS = (start.router, menu.router, fitting.router, payments.router, admin.router)
+
+
+def _build_fsm_storage() -> BaseStorage:
+    settings = get_settings()
+    if not settings.redis_url:
+        return MemoryStorage()
+    try:
+        from aiogram.fsm.storage.redis import RedisStorage
+    except ImportError as exc:  # pragma: no cover - optional dependency
+        raise RuntimeError("REDIS_URL is set but the 'redis' package is not installed") from exc
+    # Dialog state then survives restarts and reloads of the bot process.
+    return RedisStorage.from_url(settings.redis_url)
+
+
+async def _resume_background_work(bot: Bot, lifecycle: Lifecycle, predecessor: int | None) -> None:
+    # The process we replace still owns its broadcasts and jobs until it exits.
+    if predecessor is not None:
+        await lifecycle.wait_for_exit(predecessor, timeout=get_settings().shutdown_grace + 60)
+    await get_broadcast_service().resume_unfinished(bot)
+    await job_service.recover_unfinished(bot)
+
 
 async def main() -> None:
-    logs_dir = Path(__file__).resolve().parent / "logs"
-    logs_dir.mkdir(exist_ok=True)
-    log_file = logs_dir / "bot.log"
-
-    logging.basicConfig(
-        level=logging.INFO,
-        format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
-        handlers=[
-            logging.StreamHandler(),
-            logging.FileHandler(log_file, encoding="utf-8"),
-        ],
-    )
+    setup_logging(Path(__file__).resolve().parent / "logs")
     logger.info("Bot startup initiated")
     settings = get_settings()
 
     if not settings.bot_token:
         raise RuntimeError("BOT_TOKEN is not configured")
 
-    bot = Bot(token=settings.bot_token, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
-    storage = MemoryStorage()
+    session = AiohttpSession(api=TelegramAPIServer.from_base(settings.telegram_api_base))
+    bot = Bot(token=settings.bot_token, session=session, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+    bot.session.middleware(get_outbound_scheduler())
+    if settings.metrics_enabled:
+        # Registered after the scheduler, so every retry attempt is timed on its own.
+        bot.session.middleware(TelegramMetricsMiddleware())
+    if settings.tracing_enabled:
+        bot.session.middleware(TelegramTracingMiddleware())
+    storage = _build_fsm_storage()
     dp = Dispatcher(storage=storage)
+    lifecycle = get_lifecycle()
+    dp.update.outer_middleware(lifecycle.inflight)
+    if settings.tracing_enabled:
+        dp.update.outer_middleware(UpdateTracingMiddleware())
+    dp.message.middleware(ActionLockMiddleware())
+    if settings.metrics_enabled:
+        handler_metrics = HandlerMetricsMiddleware()
+        dp.message.middleware(handler_metrics)
+        dp.callback_query.middleware(handler_metrics)
+        dp.pre_checkout_query.middleware(handler_metrics)
+    if settings.tracing_enabled:
+        handler_tracing = HandlerTracingMiddleware()
+        dp.message.middleware(handler_tracing)
+        dp.callback_query.middleware(handler_tracing)
+        dp.pre_checkout_query.middleware(handler_tracing)
+
+    dp.include_routers(*HANDLER_ROUTERS)
 
-    dp.include_router(start.router)
-    dp.include_router(menu.router)
-    dp.include_router(fitting.router)
-    dp.include_router(payments.router)
-    dp.include_router(admin.router)
+    if settings.throttle_enabled:
+        throttler = Throttler()
+        throttled_routers = (
+            ("menu", start.router),
+            ("menu", menu.router),
+            ("fitting", fitting.router),
+            ("payments", payments.router),
+            ("admin", admin.router),
+        )
+        for group, router in throttled_routers:
+            router.message.middleware(throttler.middleware(group))
+            router.callback_query.middleware(throttler.middleware(group))
 
     logger.info("Creating database and tables if needed")
     await create_db_and_tables()
+    await preload_banners()
+
+    lifecycle.install_signal_handlers()
+    # Under the supervisor the worker gets updates over HTTP instead of polling.
+    supervised_port = worker_port()
+    predecessor = handoff_pid()
+    if not await lifecycle.take_over(predecessor, polling=supervised_port is None):
+        logger.info("Stop requested before polling started")
+        await bot.session.close()
+        return
+    get_loop_monitor().start()
+    resume_task = asyncio.create_task(
+        _resume_background_work(bot, lifecycle, predecessor), name="resume-background-work"
+    )
+    maintenance_task = None
+    if is_primary_worker():
+        maintenance_task = asyncio.create_task(run_maintenance(), name="storage-maintenance")
 
-    logger.info("Launching webhook server (YooKassa) if enabled")
+    logger.info("Launching webhook server (YooKassa, metrics) if enabled")
     webhook_runner = await start_webhook_server()
+    worker_runner = None
     try:
-        logger.info("Starting polling")
-        await dp.start_polling(bot)
+        if supervised_port is not None:
+            worker_runner = await start_worker_server(supervised_port, dp=dp, bot=bot)
+            logger.info("Serving updates from the supervisor as %s", settings.worker_id)
+            await lifecycle.wait_for_stop()
+        else:
+            if settings.health_port:
+                worker_runner = await start_worker_server(settings.health_port)
+            logger.info("Starting polling")
+            await lifecycle.poll(dp, bot)
     finally:
+        # Hand polling to the next process first, then finish what we started.
+        if supervised_port is None:
+            await lifecycle.confirm_updates(bot)
+            lifecycle.release_polling()
+        resume_task.cancel()
+        with suppress(asyncio.CancelledError):
+            await resume_task
         if webhook_runner:
             logger.info("Stopping webhook server")
             await webhook_runner.cleanup()
+        await get_broadcast_service().shutdown()
+        await lifecycle.drain(settings.shutdown_grace)
+        if not await get_outbound_scheduler().flush(OUTBOUND_FLUSH_TIMEOUT):
+            logger.warning("Outgoing messages were still queued at shutdown")
+        if maintenance_task:
+            maintenance_task.cancel()
+        if worker_runner:
+            await worker_runner.cleanup()
+        get_loop_monitor().stop()
+        await storage.close()
+        await close_storage()
+        await close_db()
+        await bot.session.close()
+        logger.info("Bot stopped")
 
 
 if __name__ == "__main__":
@@ -2,17 +2,25 @@
 from __future__ import annotations
 
 import argparse
+import json
 import os
 import signal
 import subprocess
 import sys
 import time
+import urllib.error
+import urllib.request
 from pathlib import Path
 
 BOT_DIR = Path(__file__).resolve().parent
 PROJECT_ROOT = BOT_DIR.parent
 PID_FILE = BOT_DIR / "bot.pid"
+SUPERVISOR_STATE_FILE = BOT_DIR / "supervisor.json"
 LOG_FILE = BOT_DIR / "out.log"
+# The bot drains in-flight generations for up to SHUTDOWN_GRACE (120 s by default).
+STOP_TIMEOUT = 180.0
+# Must match ``HANDOFF_ENV`` in app/services/lifecycle.py.
+HANDOFF_ENV = "BOT_HANDOFF_PID"
 
 
 def _read_pid() -> int | None:
@@ -60,27 +68,69 @@ def _resolve_python(python_exec: str | None) -> str:
     return sys.executable
 
 
-def _start(python_exec: str | None) -> None:
-    pid = _read_pid()
-    if _is_running(pid):
-        print(f"Bot already running with PID {pid}.")
-        return
-
+def _spawn(
+    python_exec: str | None,
+    handoff_pid: int | None = None,
+    workers: int | None = None,
+) -> subprocess.Popen:
     env = os.environ.copy()
     env.setdefault("PYTHONPATH", str(PROJECT_ROOT))
+    if handoff_pid is not None:
+        env[HANDOFF_ENV] = str(handoff_pid)
+
+    command = ["-m", "bot.main"]
+    if workers is not None:
+        command = ["-m", "bot.supervisor", "--workers", str(workers)]
 
     python = _resolve_python(python_exec)
     LOG_FILE.parent.mkdir(parents=True, exist_ok=True)
     with open(LOG_FILE, "ab", buffering=0) as stream:
-        process = subprocess.Popen(
-            [python, "-m", "bot.main"],
+        return subprocess.Popen(
+            [python, *command],
             cwd=str(PROJECT_ROOT),
             stdout=stream,
             stderr=subprocess.STDOUT,
             env=env,
         )
+
+
+def _start(python_exec: str | None, workers: int | None = None) -> None:
+    pid = _read_pid()
+    if _is_running(pid):
+        print(f"Bot already running with PID {pid}.")
+        return
+
+    process = _spawn(python_exec, workers=workers)
     _write_pid(process.pid)
-    print(f"Bot started with PID {process.pid}.")
+    if workers is not None:
+        print(f"Supervisor with {workers} workers started with PID {process.pid}.")
+    else:
+        print(f"Bot started with PID {process.pid}.")
+
+
+def _supervisor_state() -> dict | None:
+    """State of the running supervisor, or ``None`` in single-process mode."""
+    try:
+        state = json.loads(SUPERVISOR_STATE_FILE.read_text())
+    except (FileNotFoundError, ValueError):
+        return None
+    if state.get("pid") != _read_pid() or not _is_running(state.get("pid")):
+        return None
+    return state
+
+
+def _fetch_health(port: int) -> dict | None:
+    try:
+        response = urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=2)
+    except urllib.error.HTTPError as exc:
+        response = exc  # 503 still carries the health report
+    except OSError:
+        return None
+    with response:
+        try:
+            return json.load(response)
+        except (OSError, ValueError):
+            return None
 
 
 def _stop(timeout: float, force: bool) -> None:
@@ -113,12 +163,70 @@ def _stop(timeout: float, force: bool) -> None:
     print("Bot stopped.")
 
 
+def _reload(python_exec: str | None, timeout: float) -> int:
+    """Start a new process that takes over polling, then let the old one drain.
+
+    The new process sends SIGTERM to the old one only after its own startup
+    succeeded, so a broken deploy leaves the running bot untouched.
+    """
+    if _supervisor_state() is not None:
+        pid = _read_pid()
+        os.kill(pid, signal.SIGHUP)
+        print(f"Rolling reload requested from supervisor {pid}; see {LOG_FILE} and `status`.")
+        return 0
+
+    old_pid = _read_pid()
+    if not _is_running(old_pid):
+        print("Bot is not running; starting a new process.")
+        _start(python_exec)
+        return 0
+
+    process = _spawn(python_exec, handoff_pid=old_pid)
+    _write_pid(process.pid)
+    print(f"Started bot process {process.pid}; waiting for {old_pid} to drain...")
+
+    deadline = time.time() + timeout
+    while _is_running(old_pid) and time.time() < deadline:
+        if process.poll() is not None:
+            _write_pid(old_pid)
+            print(f"New process exited with code {process.returncode}; bot {old_pid} keeps running. See {LOG_FILE}.")
+            return 1
+        time.sleep(0.2)
+
+    if _is_running(old_pid):
+        print(f"Process {old_pid} is still draining; it will exit on its own.")
+    else:
+        print(f"Bot reloaded; now running with PID {process.pid}.")
+    return 0
+
+
 def _status() -> None:
     pid = _read_pid()
-    if _is_running(pid):
-        print(f"Bot is running with PID {pid}.")
-    else:
+    if not _is_running(pid):
         print("Bot is not running.")
+        return
+
+    state = _supervisor_state()
+    if state is None:
+        print(f"Bot is running with PID {pid}.")
+        return
+
+    workers = state["workers"]
+    healthy = 0
+    print(f"Supervisor is running with PID {pid}, {len(workers)} workers:")
+    for worker in workers:
+        health = _fetch_health(worker["port"]) or {}
+        if health.get("status") == "ok":
+            healthy += 1
+        last_update = health.get("last_update_at")
+        idle = f"{time.time() - last_update:.0f}s ago" if last_update else "never"
+        print(
+            f"  #{worker['slot']} {worker['worker_id']}: PID {worker['pid']}, port {worker['port']}, "
+            f"{health.get('status', worker['state'])}, loop lag {health.get('loop_lag', '-')}s, "
+            f"in flight {health.get('in_flight', '-')}, queued {worker['queued']}, "
+            f"last update {idle}, restarts {worker['restarts']}"
+        )
+    print(f"{healthy}/{len(workers)} workers healthy.")
 
 
 def main(argv: list[str] | None = None) -> int:
@@ -132,13 +240,19 @@ def main(argv: list[str] | None = None) -> int:
         metavar="PATH",
         help="Python interpreter to use (defaults to current interpreter).",
     )
+    start_parser.add_argument(
+        "--workers",
+        type=int,
+        metavar="N",
+        help="Run N workers under a supervisor with health checks and auto-restart.",
+    )
 
     stop_parser = subparsers.add_parser("stop", help="Stop the bot process using the PID file.")
     stop_parser.add_argument(
         "--timeout",
         type=float,
-        default=10.0,
-        help="Seconds to wait for graceful shutdown before giving up (default: 10).",
+        default=STOP_TIMEOUT,
+        help="Seconds to wait for graceful shutdown before giving up (default: %(default)s).",
     )
     stop_parser.add_argument(
         "--force",
@@ -155,11 +269,17 @@ def main(argv: list[str] | None = None) -> int:
         metavar="PATH",
         help="Python interpreter to use (defaults to current interpreter).",
     )
+    restart_parser.add_argument(
+        "--workers",
+        type=int,
+        metavar="N",
+        help="Run N workers under a supervisor with health checks and auto-restart.",
+    )
     restart_parser.add_argument(
         "--timeout",
         type=float,
-        default=10.0,
-        help="Seconds to wait for graceful shutdown before forcing stop (default: 10).",
+        default=STOP_TIMEOUT,
+        help="Seconds to wait for graceful shutdown before forcing stop (default: %(default)s).",
     )
     restart_parser.add_argument(
         "--force",
@@ -167,17 +287,36 @@ def main(argv: list[str] | None = None) -> int:
         help="Send SIGKILL if the process does not stop within timeout.",
     )
 
+    reload_parser = subparsers.add_parser(
+        "reload",
+        help="Start a new process and drain the running one without downtime.",
+    )
+    reload_parser.add_argument(
+        "--python",
+        dest="python_exec",
+        metavar="PATH",
+        help="Python interpreter to use (defaults to current interpreter).",
+    )
+    reload_parser.add_argument(
+        "--timeout",
+        type=float,
+        default=STOP_TIMEOUT,
+        help="Seconds to wait for the old process to drain (default: %(default)s).",
+    )
+
     args = parser.parse_args(argv)
 
     if args.action == "start":
-        _start(args.python_exec)
+        _start(args.python_exec, workers=args.workers)
     elif args.action == "stop":
         _stop(timeout=args.timeout, force=args.force)
     elif args.action == "status":
         _status()
     elif args.action == "restart":
         _stop(timeout=args.timeout, force=args.force)
-        _start(args.python_exec)
+        _start(args.python_exec, workers=args.workers)
+    elif args.action == "reload":
+        return _reload(args.python_exec, timeout=args.timeout)
     else:
         parser.error("Unknown action")
 
@@ -0,0 +1,406 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import signal
+import sys
+import time
+from contextlib import suppress
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Optional
+
+import aiohttp
+
+from bot.config import get_settings
+from bot.app.services.lifecycle import HANDOFF_ENV, WORKER_PORT_ENV, WORKER_SLOT_ENV, Lifecycle, slot_worker_id
+from bot.app.utils.logs import setup_logging
+from bot.utils.loop import PipeEventLoopPolicy
+
+BOT_DIR = Path(__file__).resolve().parent
+PROJECT_ROOT = BOT_DIR.parent
+STATE_FILE = BOT_DIR / "supervisor.json"
+
+POLL_TIMEOUT = 25
+POLL_BACKOFF_MAX = 30.0
+HEALTH_INTERVAL = 5.0
+HEALTH_TIMEOUT = 3.0
+# Consecutive failed health checks before a worker is restarted.
+HEALTH_FAILURES = 3
+STARTUP_TIMEOUT = 90.0
+# A worker that stopped answering health checks cannot drain; kill it soon.
+KILL_TIMEOUT = 10.0
+RESTART_BACKOFF_MAX = 60.0
+# A worker that stayed up this long restarts without backoff next time.
+STABLE_AFTER = 300.0
+FORWARD_TIMEOUT = 10.0
+FORWARD_RETRY = 0.5
+FORWARD_DRAIN_TIMEOUT = 10.0
+
+logger = logging.getLogger("bot.supervisor")
+
+
+def routing_key(update: dict[str, Any]) -> int:
+    """User (or chat) an update belongs to; all of a user's updates go to one worker."""
+    for key, event in update.items():
+        if key == "update_id" or not isinstance(event, dict):
+            continue
+        member = (event.get("new_chat_member") or {}).get("user")
+        if key == "chat_member" and member:
+            # The affected member, not the admin who kicked or banned them, owns the cached subscription.
+            return int(member["id"])
+        user = event.get("from") or event.get("user")
+        if user:
+            return int(user["id"])
+        chat = event.get("chat") or (event.get("message") or {}).get("chat")
+        if chat:
+            return int(chat["id"])
+    return int(update["update_id"])
+
+
+def used_update_types() -> list[str]:
+    """Update types the workers handle, as single-process polling asks Telegram for them."""
+    from aiogram import Dispatcher
+
+    from bot.main import HANDLER_ROUTERS
+
+    dp = Dispatcher()
+    dp.include_routers(*HANDLER_ROUTERS)
+    return dp.resolve_used_update_types()
+
+
+@dataclass(eq=False)
+class Worker:
+    slot: int
+    worker_id: str
+    port: int = 0
+    generation: int = 0
+    process: Optional[asyncio.subprocess.Process] = None
+    state: str = "stopped"
+    failures: int = 0
+    restarts: int = 0
+    backoff: float = 0.0
+    started_at: float = 0.0
+    health: dict[str, Any] = field(default_factory=dict)
+    queue: asyncio.Queue = field(default_factory=asyncio.Queue)
+
+    def describe(self) -> dict[str, Any]:
+        return {
+            "slot": self.slot,
+            "worker_id": self.worker_id,
+            "pid": self.process.pid if self.process else None,
+            "port": self.port,
+            "state": self.state,
+            "restarts": self.restarts,
+            "queued": self.queue.qsize(),
+            "health": self.health,
+        }
+
+
+class Supervisor:
+    """Runs ``count`` bot workers behind a single Telegram poller.
+
+    Only one process may poll Telegram, so the supervisor polls and posts
+    each update to the worker owning the user (``user_id % count``); a
+    user's dialog state and running jobs therefore stay in one process. Every
+    worker is health-checked over HTTP and restarted with exponential backoff
+    when it exits, stops answering or reports a lagging event loop. SIGHUP
+    replaces the workers one at a time without dropping updates.
+    """
+
+    def __init__(self, count: int) -> None:
+        self.settings = get_settings()
+        self.count = count
+        self.updates_url = f"{self.settings.telegram_api_base.rstrip('/')}/bot{self.settings.bot_token}/getUpdates"
+        self.lifecycle = Lifecycle()
+        self.workers = [
+            Worker(slot=slot, worker_id=slot_worker_id(self.settings.worker_id, slot)) for slot in range(count)
+        ]
+        self.allowed_updates = used_update_types()
+        self.offset: Optional[int] = None
+        # Updates polled but not yet accepted by a worker; they must not be confirmed.
+        self._undelivered: set[int] = set()
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._reloading: Optional[asyncio.Task] = None
+        self._background: set[asyncio.Task] = set()
+
+    def _port(self, worker: Worker, generation: int) -> int:
+        # Alternate between two ports so a reloaded worker starts next to the old one.
+        return self.settings.worker_base_port + worker.slot + self.count * (generation % 2)
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        self.lifecycle.install_signal_handlers()
+        loop.add_signal_handler(signal.SIGHUP, self.request_reload)
+        if not await self.lifecycle.take_over():
+            return
+
+        async with aiohttp.ClientSession() as session:
+            self._session = session
+            # The primary worker creates the schema; start the rest once it is up.
+            await self._start(self.workers[0])
+            await asyncio.gather(*(self._start(worker) for worker in self.workers[1:]))
+            tasks = [
+                asyncio.create_task(self._ingress(), name="supervisor-ingress"),
+                asyncio.create_task(self._write_state_forever(), name="supervisor-state"),
+                *(asyncio.create_task(self._forward(worker), name=f"forward-{worker.slot}") for worker in self.workers),
+                *(asyncio.create_task(self._watch(worker), name=f"watch-{worker.slot}") for worker in self.workers),
+            ]
+            try:
+                await self.lifecycle.wait_for_stop()
+            finally:
+                await self._shutdown(tasks)
+        STATE_FILE.unlink(missing_ok=True)
+        logger.info("Supervisor stopped")
+
+    async def _shutdown(self, tasks: list[asyncio.Task]) -> None:
+        logger.info("Stopping supervisor")
+        tasks[0].cancel()
+        with suppress(asyncio.CancelledError):
+            await tasks[0]
+        if self._reloading:
+            self._reloading.cancel()
+
+        # Hand over updates that are already queued before the workers drain.
+        with suppress(asyncio.TimeoutError):
+            await asyncio.wait_for(
+                asyncio.gather(*(worker.queue.join() for worker in self.workers)),
+                FORWARD_DRAIN_TIMEOUT,
+            )
+        await self._confirm_updates()
+        self.lifecycle.release_polling()
+        for task in tasks[1:]:
+            task.cancel()
+        await asyncio.gather(*tasks[1:], return_exceptions=True)
+        grace = self.settings.shutdown_grace + 30
+        await asyncio.gather(*(self._terminate(worker.process, grace) for worker in self.workers))
+        await asyncio.gather(*self._background, return_exceptions=True)
+
+    def request_reload(self) -> None:
+        if self._reloading and not self._reloading.done():
+            logger.info("Reload already in progress")
+            return
+        self._reloading = asyncio.create_task(self._reload(), name="supervisor-reload")
+
+    async def _spawn(self, worker: Worker, port: int, predecessor: Optional[int] = None) -> asyncio.subprocess.Process:
+        env = os.environ.copy()
+        env.setdefault("PYTHONPATH", str(PROJECT_ROOT))
+        env.update(
+            {
+                "WORKERS": str(self.count),
+                "WORKER_ID": worker.worker_id,
+                WORKER_PORT_ENV: str(port),
+                WORKER_SLOT_ENV: str(worker.slot),
+            }
+        )
+        if predecessor is not None:
+            env[HANDOFF_ENV] = str(predecessor)
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, "-m", "bot.main", cwd=str(PROJECT_ROOT), env=env
+        )
+        logger.info("Worker %s started with PID %s on port %s", worker.slot, process.pid, port)
+        return process
+
+    async def _start(self, worker: Worker) -> None:
+        worker.state = "starting"
+        worker.port = self._port(worker, worker.generation)
+        worker.process = await self._spawn(worker, worker.port)
+        worker.started_at = time.monotonic()
+        worker.failures = 0
+        if await self._wait_healthy(worker.process, worker.port):
+            worker.state = "ok"
+        else:
+            # Let the watcher restart it with backoff.
+            worker.state = "unhealthy"
+            worker.failures = HEALTH_FAILURES
+
+    async def _wait_healthy(self, process: asyncio.subprocess.Process, port: int) -> bool:
+        deadline = time.monotonic() + STARTUP_TIMEOUT
+        while time.monotonic() < deadline and process.returncode is None:
+            if (await self._health(port))[0]:
+                return True
+            await asyncio.sleep(1.0)
+        return False
+
+    async def _health(self, port: int) -> tuple[bool, dict[str, Any]]:
+        assert self._session is not None
+        try:
+            async with self._session.get(
+                f"http://127.0.0.1:{port}/health", timeout=aiohttp.ClientTimeout(total=HEALTH_TIMEOUT)
+            ) as response:
+                return response.status == 200, await response.json()
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+            return False, {}
+
+    async def _watch(self, worker: Worker) -> None:
+        while True:
+            await asyncio.sleep(HEALTH_INTERVAL)
+            if worker.state in {"starting", "restarting", "reloading"} or worker.process is None:
+                continue
+            healthy, worker.health = await self._health(worker.port)
+            if worker.process.returncode is not None:
+                reason = f"exited with code {worker.process.returncode}"
+            elif healthy:
+                worker.failures = 0
+                worker.state = "ok"
+                continue
+            else:
+                worker.failures += 1
+                worker.state = "unhealthy"
+                if worker.failures < HEALTH_FAILURES:
+                    continue
+                reason = f"failed {worker.failures} health checks"
+            await self._restart(worker, reason)
+
+    async def _restart(self, worker: Worker, reason: str) -> None:
+        worker.state = "restarting"
+        logger.warning("Restarting worker %s (PID %s): %s", worker.slot, worker.process.pid, reason)
+        await self._terminate(worker.process, KILL_TIMEOUT)
+        if time.monotonic() - worker.started_at >= STABLE_AFTER:
+            worker.backoff = 0.0
+        if worker.backoff:
+            logger.info("Waiting %ss before restarting worker %s", worker.backoff, worker.slot)
+            await asyncio.sleep(worker.backoff)
+        worker.backoff = min(RESTART_BACKOFF_MAX, max(1.0, worker.backoff * 2))
+        worker.restarts += 1
+        await self._start(worker)
+
+    async def _reload(self) -> None:
+        logger.info("Rolling reload of %s workers", self.count)
+        for worker in self.workers:
+            old = worker.process
+            if old is None or old.returncode is not None or worker.state != "ok":
+                continue
+            worker.state = "reloading"
+            port = self._port(worker, worker.generation + 1)
+            # The new worker asks the old one to drain once its own startup succeeded.
+            process = await self._spawn(worker, port, predecessor=old.pid)
+            if not await self._wait_healthy(process, port):
+                logger.error("Worker %s failed to start during reload; stopping the reload", worker.slot)
+                await self._terminate(process, KILL_TIMEOUT)
+                worker.state = "ok"
+                return
+            worker.generation += 1
+            worker.process, worker.port = process, port
+            worker.started_at = time.monotonic()
+            worker.state = "ok"
+            task = asyncio.create_task(self._terminate(old, self.settings.shutdown_grace + 30))
+            self._background.add(task)
+            task.add_done_callback(self._background.discard)
+        logger.info("Rolling reload finished")
+
+    async def _terminate(self, process: Optional[asyncio.subprocess.Process], timeout: float) -> None:
+        if process is None or process.returncode is not None:
+            return
+        with suppress(ProcessLookupError):
+            process.send_signal(signal.SIGTERM)
+        try:
+            await asyncio.wait_for(process.wait(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Worker PID %s did not exit in %ss; killing it", process.pid, timeout)
+            with suppress(ProcessLookupError):
+                process.kill()
+            await process.wait()
+
+    async def _ingress(self) -> None:
+        assert self._session is not None
+        url = self.updates_url
+        backoff = 1.0
+        while True:
+            params: dict[str, Any] = {"timeout": POLL_TIMEOUT, "allowed_updates": json.dumps(self.allowed_updates)}
+            if self.offset is not None:
+                params["offset"] = self.offset
+            try:
+                async with self._session.get(
+                    url, params=params, timeout=aiohttp.ClientTimeout(total=POLL_TIMEOUT + 10)
+                ) as response:
+                    payload = await response.json()
+                if not payload.get("ok"):
+                    raise RuntimeError(payload.get("description", f"HTTP {response.status}"))
+            except (aiohttp.ClientError, asyncio.TimeoutError, RuntimeError, ValueError) as exc:
+                logger.warning("getUpdates failed: %s; retrying in %ss", exc, backoff)
+                await asyncio.sleep(backoff)
+                backoff = min(POLL_BACKOFF_MAX, backoff * 2)
+                continue
+            backoff = 1.0
+            for update in payload["result"]:
+                self.offset = update["update_id"] + 1
+                self._undelivered.add(update["update_id"])
+                self.workers[routing_key(update) % self.count].queue.put_nowait(update)
+
+    async def _confirm_updates(self) -> None:
+        if self.offset is None or self._session is None:
+            return
+        offset = self.offset
+        if self._undelivered:
+            # Telegram resends from the first update no worker took; later ones may arrive twice.
+            offset = min(self._undelivered)
+            logger.warning(
+                "%s updates were not delivered to workers; leaving them to the next poller", len(self._undelivered)
+            )
+        url = self.updates_url
+        params = {"offset": offset, "limit": 1, "timeout": 0}
+        try:
+            async with self._session.get(url, params=params, timeout=aiohttp.ClientTimeout(total=10)):
+                pass
+        except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
+            logger.warning("Failed to confirm updates before shutdown: %s", exc)
+
+    async def _forward(self, worker: Worker) -> None:
+        assert self._session is not None
+        while True:
+            update = await worker.queue.get()
+            # Retry until a worker process accepts it; the port changes on reload.
+            while True:
+                try:
+                    async with self._session.post(
+                        f"http://127.0.0.1:{worker.port}/update",
+                        json=update,
+                        timeout=aiohttp.ClientTimeout(total=FORWARD_TIMEOUT),
+                    ) as response:
+                        if response.status == 200:
+                            break
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    pass
+                await asyncio.sleep(FORWARD_RETRY)
+            self._undelivered.discard(update["update_id"])
+            worker.queue.task_done()
+
+    async def _write_state_forever(self) -> None:
+        while True:
+            self._write_state()
+            await asyncio.sleep(HEALTH_INTERVAL)
+
+    def _write_state(self) -> None:
+        state = {
+            "pid": os.getpid(),
+            "updated_at": time.time(),
+            "workers": [worker.describe() for worker in self.workers],
+        }
+        tmp = STATE_FILE.with_suffix(".tmp")
+        tmp.write_text(json.dumps(state, indent=2))
+        tmp.replace(STATE_FILE)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Run several Hypetuning bot workers.")
+    parser.add_argument("--workers", type=int, default=None, help="Number of workers (default: WORKERS).")
+    args = parser.parse_args(argv)
+
+    # Worker slot 0 keeps WORKER_ID and with it bot.log.
+    setup_logging(Path(__file__).resolve().parent / "logs", "supervisor.log")
+    settings = get_settings()
+    if not settings.bot_token:
+        raise RuntimeError("BOT_TOKEN is not configured")
+    count = max(1, args.workers or settings.workers)
+
+    asyncio.set_event_loop_policy(PipeEventLoopPolicy())
+    asyncio.run(Supervisor(count).run())
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())